@@ -5,7 +5,7 @@
 #
 # Logic for parsing and creating avatars for a Kano World profile
 from kano.logging import logger
-from kano_profile.badges import calculate_badges
+from kano_profile.badges import load_badges
 
 from .character_components import (AvatarAccessory, AvatarEnvironment,
                                    AvatarCategory, AvatarCharacterSet)
@@ -212,7 +212,7 @@ class AvatarConfParser(object):
         :param conf_data: YAML format configuration structure read from file
         """
         # TODO conf_data is not used any more in this function, maybe remove it
-        envirs = calculate_badges()
+        envirs = load_badges()
 
         for _, env in envirs[self.env_label]['all'].iteritems():
             env_obj = AvatarEnvironment.from_data(env)
@@ -33,3 +33,37 @@ def completed_at_least_one_challenge(app_name):
         except AttributeError:
             pass
     return level > 0
+
+
+def get_group_progress(group_profile):
+    if 'challengeNo' not in group_profile:
+        return 0
+
+    return group_profile['challengeNo']
+
+
+def get_app_state_progress(app_state):
+    """ Returns the progress of an app based on an already loaded state.
+
+    For apps that track their progress in challenge groups this is the sum
+    of the challenges completed in each group, otherwise it is the level.
+
+    :param app_state: The state of the app
+    :type app_state: dict
+
+    :returns: The progress of the app
+    :rtype: int
+    """
+    progress = 0
+
+    if 'groups' in app_state and app_state['groups']:
+        groups_profile = app_state['groups']
+        for group in groups_profile:
+            progress += get_group_progress(groups_profile[group])
+
+        return progress
+
+    if 'level' in app_state and app_state['level']:
+        progress = app_state['level']
+
+    return progress
@@ -8,12 +8,18 @@
 
 import json
 import os
+import fcntl
+from contextlib import contextmanager
+from copy import deepcopy
 
-from kano.utils import read_json, write_json, get_date_now, ensure_dir, \
-    chown_path, run_print_output_error, run_bg, run_cmd
+from kano.utils import read_json, get_date_now, ensure_dir, chown_path, \
+    run_print_output_error, run_bg, run_cmd
 from kano.logging import logger
 from kano_profile.paths import apps_dir, xp_file, kanoprofile_dir, \
-    app_profiles_file
+    app_profiles_file, profile_dir_str, profile_generation_file
+from kano_profile.profile_index import bump_generation
+from kano_profile.atomic_write import atomic_write_json, deferred_fsync
+from kano_profile.json_cache import peek_json, copy_json, invalidate
 
 
 def get_app_dir(app_name):
@@ -33,17 +39,49 @@ def get_app_state_file(app_name):
     return app_state_file
 
 
-def load_app_state(app_name):
-    app_state_file = get_app_state_file(app_name)
-    app_state = read_json(app_state_file)
+def get_app_state_lock_file(app_name):
+    app_state_lock_str = 'state.lock'
+    app_state_lock_file = os.path.join(get_app_dir(app_name),
+                                       app_state_lock_str)
+    return app_state_lock_file
+
+
+def get_app_state_stamp(app_name):
+    """ Returns a cheap fingerprint of the app's state file, suitable for
+    detecting whether it changed since it was last read.
+
+    :param app_name: The application whose state file to check.
+    :type app_name: str
+
+    :returns: A (mtime, size, inode) tuple or None if there is no state file
+    :rtype: tuple or NoneType
+    """
+    try:
+        st = os.stat(get_app_state_file(app_name))
+    except OSError:
+        return None
+
+    return st.st_mtime, st.st_size, st.st_ino
+
+
+def peek_app_state(app_name):
+    """ Just like load_app_state, but the state returned is shared with the
+    other readers and must not be modified. It spares copying the state when
+    it is only read.
+    """
+    app_state = peek_json(get_app_state_file(app_name))
     if not app_state:
         app_state = dict()
     return app_state
 
 
+def load_app_state(app_name):
+    return copy_json(peek_app_state(app_name))
+
+
 def load_app_state_encode(app_name):
     try:
-        data = load_app_state(app_name)
+        data = peek_app_state(app_name)
         if data:
             encoded_data = json.dumps(data)
             return encoded_data
@@ -53,9 +91,9 @@ def load_app_state_encode(app_name):
 
 
 def load_app_state_variable(app_name, variable):
-    data = load_app_state(app_name)
+    data = peek_app_state(app_name)
     if variable in data:
-        return data[variable]
+        return copy_json(data[variable])
 
 
 def load_app_state_variable_encode(app_name, variable):
@@ -84,13 +122,56 @@ def save_app_state(app_name, data):
     app_state_file = get_app_state_file(app_name)
     data['save_date'] = get_date_now()
     ensure_dir(get_app_dir(app_name))
-    write_json(app_state_file, data)
+    atomic_write_json(app_state_file, data)
+    invalidate(app_state_file)
     if 'SUDO_USER' in os.environ:
         chown_path(kanoprofile_dir)
         chown_path(apps_dir)
         chown_path(get_app_dir(app_name))
         chown_path(app_state_file)
 
+    bump_generation()
+
+
+@contextmanager
+def app_state(app_name):
+    """ A transaction on the state of an application.
+
+    The state is loaded once and can be changed as many times as needed in
+    the block. It is then saved once, at the end of the block and only if it
+    changed. The state is locked for the whole transaction, so concurrent
+    transactions on the same app don't lose each other's changes. If the
+    block raises an exception, nothing is saved.
+
+        with app_state('make-snake') as state:
+            state['level'] = 3
+            state['total_number_of_apples'] += 10
+
+    :param app_name: The application whose state to change.
+    :type app_name: str
+
+    :returns: The state of the application, to be changed in place
+    :rtype: dict
+    """
+
+    ensure_dir(get_app_dir(app_name))
+    lock_file = get_app_state_lock_file(app_name)
+
+    with open(lock_file, 'a') as lock:
+        if 'SUDO_USER' in os.environ:
+            chown_path(get_app_dir(app_name))
+            chown_path(lock_file)
+
+        fcntl.flock(lock, fcntl.LOCK_EX)
+
+        data = load_app_state(app_name)
+        original_data = deepcopy(data)
+
+        yield data
+
+        if data != original_data:
+            save_app_state(app_name, data)
+
 
 def save_app_state_decode(app_name, data):
     """ Just like save_app_state, but data is stringified.
@@ -123,10 +204,8 @@ def save_app_state_variable(app_name, variable, value):
     msg = "save_app_state_variable {} {} {}".format(app_name, variable, value)
     logger.debug(msg)
 
-    data = load_app_state(app_name)
-    data[variable] = value
-
-    save_app_state(app_name, data)
+    with app_state(app_name) as data:
+        data[variable] = value
 
 
 def save_app_state_variable_decode(app_name, variable, value):
@@ -163,11 +242,9 @@ def update_upwards(app_name, variable, value):
     """
     msg = "update_increasingly {} {} {}".format(app_name, variable, value)
     logger.debug(msg)
-    data = load_app_state(app_name)
-    if data.get(variable, 0) < value:
-        data[variable] = value
-
-        save_app_state(app_name, data)
+    with app_state(app_name) as data:
+        if data.get(variable, 0) < value:
+            data[variable] = value
 
 
 def increment_app_state_variable(app_name, variable, value):
@@ -175,12 +252,10 @@ def increment_app_state_variable(app_name, variable, value):
         "increment_app_state_variable {} {} {}".format(
             app_name, variable, value))
 
-    data = load_app_state(app_name)
-    if variable not in data:
-        data[variable] = 0
-    data[variable] += value
-
-    save_app_state(app_name, data)
+    with app_state(app_name) as data:
+        if variable not in data:
+            data[variable] = 0
+        data[variable] += value
 
 
 def get_app_list():
@@ -326,16 +401,25 @@ def save_app_state_variable_all_users(app, variable, value):
 
     users = get_all_users()
 
-    for user in users:
-        dir_path = os.path.join(
-            "/home", user, ".kanoprofile", "apps", app
-        )
-        if not os.path.exists(dir_path):
-            os.makedirs(dir_path)
-            chown_path(dir_path, user, user)
-
-        state_path = os.path.join(dir_path, "state.json")
-        data = {variable: value}
-        data['save_date'] = get_date_now()
-        write_json(state_path, data)
-        chown_path(state_path, user, user)
+    # Sync all the users' files in one go
+    with deferred_fsync():
+        for user in users:
+            dir_path = os.path.join(
+                "/home", user, ".kanoprofile", "apps", app
+            )
+            if not os.path.exists(dir_path):
+                os.makedirs(dir_path)
+                chown_path(dir_path, user, user)
+
+            state_path = os.path.join(dir_path, "state.json")
+            data = {variable: value}
+            data['save_date'] = get_date_now()
+            atomic_write_json(state_path, data)
+            invalidate(state_path)
+            chown_path(state_path, user, user)
+
+            generation_file = os.path.join(
+                "/home", user, ".kanoprofile", profile_dir_str,
+                os.path.basename(profile_generation_file)
+            )
+            bump_generation(generation_file, user)
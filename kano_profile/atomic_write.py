@@ -0,0 +1,122 @@
+# atomic_write.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Crash-safe writes for the profile stores
+#
+# Rewriting a file in place leaves it empty or truncated if the power goes
+# while it's being written, which is not unusual on an SD card. Instead, the
+# new contents are written to a temporary file in the same directory, synced
+# to the disk and then renamed over the old file, so the file always has
+# either the old or the new contents.
+#
+# The contents of each file are always synced before the rename, otherwise
+# the new name could reach the disk before the data it points to. Making the
+# rename itself durable takes another sync of the directory, which writers
+# saving many files in one go can batch with deferred_fsync(): each directory
+# is synced once, at the end of the batch.
+#
+
+import os
+import json
+import tempfile
+import threading
+from contextlib import contextmanager
+
+
+DEFAULT_FILE_MODE = 0644
+
+_batches = threading.local()
+
+
+def _fsync_path(path, flags=os.O_RDONLY):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+@contextmanager
+def deferred_fsync():
+    """ Batches the syncs of the directories of the atomic writes in the block.
+
+    The files are still synced and replaced atomically as they are written,
+    but the renames are only made durable when the (outermost) block
+    finishes. The directories shared by several files are synced once.
+    """
+    pending = getattr(_batches, 'pending', None)
+    if pending is not None:
+        yield
+        return
+
+    _batches.pending = pending = []
+    try:
+        yield
+    finally:
+        _batches.pending = None
+
+        for dir_path in sorted(set(pending), key=pending.index):
+            try:
+                _fsync_path(dir_path)
+            except OSError:
+                # Removed since, nothing left to sync
+                pass
+
+
+def atomic_write(path, contents):
+    """ Replaces the contents of a file atomically.
+
+    :param path: The file to write
+    :type path: str
+    :param contents: The new contents of the file
+    :type contents: str
+    :raises IOError, OSError: If the file couldn't be written. The previous
+                              contents are left untouched.
+    """
+    path = os.path.abspath(path)
+    dir_path, file_name = os.path.split(path)
+
+    try:
+        mode = os.stat(path).st_mode & 0777
+    except OSError:
+        mode = DEFAULT_FILE_MODE
+
+    fd, tmp_path = tempfile.mkstemp(
+        prefix='.{}.'.format(file_name), suffix='.tmp', dir=dir_path
+    )
+
+    try:
+        with os.fdopen(fd, 'w') as tmp_f:
+            tmp_f.write(contents)
+            tmp_f.flush()
+            os.fsync(tmp_f.fileno())
+
+        os.chmod(tmp_path, mode)
+        os.rename(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    pending = getattr(_batches, 'pending', None)
+    if pending is None:
+        _fsync_path(dir_path)
+    else:
+        pending.append(dir_path)
+
+
+def atomic_write_json(path, data, sort_keys=True):
+    """ Replaces the contents of a json file atomically.
+
+    :param path: The file to write
+    :type path: str
+    :param data: The data to serialise
+    :type data: JSON serialisable value
+    :param sort_keys: (Optional) Whether to sort the keys of the objects
+    :type sort_keys: bool
+    :raises IOError, OSError: If the file couldn't be written
+    :raises TypeError, ValueError: If the data can't be serialised
+    """
+    atomic_write(path, json.dumps(data, sort_keys=sort_keys))
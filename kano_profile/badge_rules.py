@@ -0,0 +1,318 @@
+# badge_rules.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Compiles the badge rules into an evaluation plan
+#
+# The rules are plain dicts as loaded from the json files in the rules
+# directory. Interpreting them on every evaluation means dispatching on the
+# operation, splitting the target variables and resolving the max levels
+# over and over again. Instead, each badge is compiled once into a closure
+# that only needs the app states to give a result.
+#
+
+from kano.logging import logger
+from kano_profile.app_progress_helpers import get_app_state_progress
+
+
+class CompiledBadge(object):
+    """ A single badge (or environment) with its unlocking conditions
+    compiled into the `evaluate` function.
+
+    `evaluate` takes a dict of app states indexed by the app name and
+    returns whether the badge has been achieved.
+    """
+
+    __slots__ = (
+        'category', 'subcategory', 'name', 'rules', 'push_back', 'targets',
+        'evaluate', 'bit'
+    )
+
+    def __init__(self, category, subcategory, name, rules, evaluate, index):
+        self.category = category
+        self.subcategory = subcategory
+        self.name = name
+        self.rules = rules
+        self.push_back = rules.get('push_back') is True
+        self.targets = [(target[0], target[1]) for target in rules['targets']]
+        self.evaluate = evaluate
+        self.bit = 1 << index
+
+    @property
+    def offline(self):
+        """ Whether the badge counts towards the number of offline badges """
+        return self.category == 'badges' and self.subcategory != 'online'
+
+    @property
+    def apps(self):
+        return set(app for app, dummy_variable in self.targets)
+
+    def __repr__(self):
+        return 'CompiledBadge({}:{}:{})'.format(
+            self.category, self.subcategory, self.name
+        )
+
+
+class BadgeResult(object):
+    """ The result of evaluating a badge.
+
+    It behaves like the dict of the badge rules with the `achieved` flag set,
+    but only references the rules shared by all the results. Setting a key
+    stores it on the result alone, so the rules are never modified.
+    """
+
+    __slots__ = ('_rules', '_achieved', '_local')
+
+    def __init__(self, rules, achieved):
+        self._rules = rules
+        self._achieved = achieved
+        self._local = None
+
+    def __getitem__(self, key):
+        if key == 'achieved':
+            return self._achieved
+
+        if self._local and key in self._local:
+            return self._local[key]
+
+        return self._rules[key]
+
+    def __setitem__(self, key, value):
+        if key == 'achieved':
+            self._achieved = value
+            return
+
+        if self._local is None:
+            self._local = {}
+
+        self._local[key] = value
+
+    def __contains__(self, key):
+        return key == 'achieved' or key in self._rules or \
+            bool(self._local and key in self._local)
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def to_dict(self):
+        result = dict(self._rules)
+        if self._local:
+            result.update(self._local)
+        result['achieved'] = self._achieved
+
+        return result
+
+    def keys(self):
+        return self.to_dict().keys()
+
+    def iteritems(self):
+        return self.to_dict().iteritems()
+
+    def items(self):
+        return self.to_dict().items()
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def __eq__(self, other):
+        if isinstance(other, BadgeResult):
+            other = other.to_dict()
+
+        return self.to_dict() == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'BadgeResult({})'.format(self.to_dict())
+
+
+def _compile_getter(app, keys):
+    """ Returns a function that fetches the value of a target variable from
+    the app states, or None if the variable isn't set.
+    """
+
+    if keys == ['level']:
+        def get_progress(app_states):
+            return get_app_state_progress(app_states.get(app) or {})
+
+        return get_progress
+
+    def get_value(app_states):
+        try:
+            value = app_states[app]
+
+            for key in keys:
+                value = value[key]
+        except (TypeError, KeyError):
+            return None
+
+        return value
+
+    return get_value
+
+
+def _compile_each_greater(rules, app_profiles):
+    checks = []
+    for target in rules['targets']:
+        app = target[0]
+        keys = target[1].split('.')
+        threshold_value = target[2]
+
+        if keys[-1] == 'level' and threshold_value == -1:
+            threshold_value = app_profiles[app]['max_level']
+
+        checks.append((_compile_getter(app, keys), threshold_value))
+
+    def are_each_greater(app_states):
+        for get_value, threshold_value in checks:
+            local_value = get_value(app_states)
+
+            if local_value is None or local_value < threshold_value:
+                return False
+
+        return True
+
+    return are_each_greater
+
+
+def _compile_sum_greater(rules, app_profiles):
+    threshold_value = rules['value']
+    getters = [
+        _compile_getter(target[0], target[1].split('.'))
+        for target in rules['targets']
+    ]
+
+    def is_sum_greater(app_states):
+        total = 0
+
+        for get_value in getters:
+            local_value = get_value(app_states)
+
+            if local_value:
+                total += float(local_value)
+
+        return total >= threshold_value
+
+    return is_sum_greater
+
+
+OPERATIONS = {
+    'each_greater': ([], _compile_each_greater),
+    'sum_greater': (['value'], _compile_sum_greater),
+}
+
+
+def compile_badge_rules(rules, app_profiles):
+    """ Compiles the rules of a single badge
+    :param rules: The rules of the badge
+    :type rules: dict
+    :param app_profiles: The contents of app_profiles.json
+    :type app_profiles: dict
+    :returns: The function evaluating the rules. If the rules are malformed
+              it returns None
+    :rtype: function or NoneType
+    :raises KeyError: If the max level of a target app is not configured
+    """
+
+    warn_template = "Malformed badge rules, missing '{}' - [{}]"
+
+    for field in ['operation', 'targets']:
+        if field not in rules:
+            logger.warn(warn_template.format(field, rules))
+            return None
+
+    if rules['operation'] not in OPERATIONS:
+        return None
+
+    req_fields, compile_fn = OPERATIONS[rules['operation']]
+    for field in req_fields:
+        if field not in rules:
+            logger.warn(warn_template.format(field, rules))
+            return None
+
+    return compile_fn(rules, app_profiles)
+
+
+class BadgeRules(object):
+    """ The badge rules compiled into an evaluation plan.
+
+    The badges are split into the ones that can be evaluated straight away
+    and the `push_back` ones, which depend on the results of the former. The
+    plan also indexes the badges by the app variables they depend on.
+    """
+
+    def __init__(self, all_rules, app_profiles):
+        self.all_rules = all_rules or {}
+        self.badges = []
+        self.push_back_badges = []
+        self.by_target = {}
+        self.by_app = {}
+        self.offline_mask = 0
+
+        for category, subcats in self.all_rules.iteritems():
+            for subcat, items in subcats.iteritems():
+                for item, rules in items.iteritems():
+                    evaluate = compile_badge_rules(rules, app_profiles)
+                    if evaluate is None:
+                        continue
+
+                    badge = CompiledBadge(
+                        category, subcat, item, rules, evaluate,
+                        len(self.badges) + len(self.push_back_badges)
+                    )
+                    self._add(badge)
+
+    def _add(self, badge):
+        if badge.push_back:
+            self.push_back_badges.append(badge)
+        else:
+            self.badges.append(badge)
+
+        if badge.offline:
+            self.offline_mask |= badge.bit
+
+        for target in badge.targets:
+            self.by_target.setdefault(target, []).append(badge)
+
+        for app in badge.apps:
+            self.by_app.setdefault(app, []).append(badge)
+
+    @property
+    def all_badges(self):
+        return self.badges + self.push_back_badges
+
+    def get_results(self, achieved):
+        """ Builds the results of an evaluation in the structure returned by
+        calculate_badges()
+        :param achieved: The evaluation results as a bitset, where the `bit`
+                         of each achieved badge is set
+        :type achieved: int
+        :returns: The results indexed by category, subcategory and name
+        :rtype: dict
+        """
+        results = {}
+        for badge in self.all_badges:
+            results.setdefault(badge.category, {}) \
+                .setdefault(badge.subcategory, {})[badge.name] = \
+                BadgeResult(badge.rules, bool(achieved & badge.bit))
+
+        return results
+
+    def count_offline(self, achieved):
+        """ Counts the offline badges set in an achieved bitset """
+        return bin(achieved & self.offline_mask).count('1')
+
+    def badges_for_target(self, app, variable):
+        """ Returns the badges whose rules refer to the app variable """
+        return self.by_target.get((app, variable), [])
+
+    def badges_for_app(self, app):
+        """ Returns the badges whose rules refer to any variable of the app """
+        return self.by_app.get(app, [])
@@ -10,92 +10,153 @@ from __future__ import division
 
 import os
 import json
-import itertools
+from contextlib import contextmanager
 from copy import deepcopy
 
 from kano.logging import logger
 from kano.utils import read_json, is_gui, run_bg
 from .paths import xp_file, levels_file, rules_dir, bin_dir, \
     app_profiles_file, online_badges_dir, online_badges_file
-from .apps import load_app_state, get_app_list, save_app_state
+from .apps import load_app_state, peek_app_state, get_app_list, \
+    app_state, get_app_state_file, get_app_state_stamp
 from .quests import Quests
+from .app_progress_helpers import get_app_state_progress
+from .badge_rules import BadgeRules, BadgeResult
+from .profile_index import get_generation, bump_generation, load_index, \
+    save_index
+from .json_cache import on_invalidate
+
+
+# XP contributed by each app, keyed by the path to its state file. Every
+# entry remembers the stamp of the state file it was computed from, so only
+# the apps whose state changed since the last call have to be loaded again.
+_app_xp_cache = {}
+_xp_rules_cache = {
+    'stamp': None,
+    'rules': None
+}
+
+
+def _drop_app_xp(state_file):
+    # The stamp alone misses a state file saved twice within the resolution
+    # of the timestamps, so the entries go whenever the file is saved
+    if state_file is None:
+        _app_xp_cache.clear()
+    else:
+        _app_xp_cache.pop(state_file, None)
 
 
-def calculate_xp():
-    allrules = read_json(xp_file)
-    if not allrules:
-        return -1
+on_invalidate(_drop_app_xp)
 
-    points = 0
 
-    for app, groups in allrules.iteritems():
-        appstate = load_app_state(app)
-        if not appstate:
-            continue
+def _load_xp_rules():
+    """ Returns the XP rules, reading xp.json only when it changed.
+    A change in the rules invalidates all the cached per-app contributions.
+    """
+    try:
+        st = os.stat(xp_file)
+        stamp = (st.st_mtime, st.st_size, st.st_ino)
+    except OSError:
+        stamp = None
 
-        for group, rules in groups.iteritems():
-            # calculating points based on level
-            if group == 'level' and 'level' in appstate:
-                maxlevel = int(appstate['level'])
+    if stamp is None or stamp != _xp_rules_cache['stamp']:
+        _xp_rules_cache['rules'] = read_json(xp_file)
+        _xp_rules_cache['stamp'] = stamp
+        _app_xp_cache.clear()
 
-                for level, value in rules.iteritems():
+    return _xp_rules_cache['rules']
+
+
+def calculate_app_xp(groups, appstate):
+    """ Calculates the XP awarded for the state of a single app
+    :param groups: The XP rules of the app (as found in xp.json)
+    :type groups: dict
+    :param appstate: The state of the app
+    :type appstate: dict
+    :returns: The XP points of the app
+    :rtype: float
+    """
+    points = 0
+
+    for group, rules in groups.iteritems():
+        # calculating points based on level
+        if group == 'level' and 'level' in appstate:
+            maxlevel = int(appstate['level'])
+
+            for level, value in rules.iteritems():
+                level = int(level)
+                value = int(value)
+
+                if level <= maxlevel:
+                    points += value
+
+        # calculating points based on multipliers
+        if group == 'multipliers':
+            for thing, value in rules.iteritems():
+                value = float(value)
+                if thing in appstate:
+                    points += value * appstate[thing]
+
+        if group == 'groups':
+            # Iterate over the groups of the local profile
+            groups_item_iter = appstate.get('groups', {}).iteritems
+            for grp_name, grp_obj in groups_item_iter():
+                level_achieved = int(
+                    appstate['groups'][grp_name]['challengeNo']
+                )
+                for level, value in rules.get(grp_name, {}).iteritems():
                     level = int(level)
                     value = int(value)
 
-                    if level <= maxlevel:
+                    if level <= level_achieved:
                         points += value
 
-            # calculating points based on multipliers
-            if group == 'multipliers':
-                for thing, value in rules.iteritems():
-                    value = float(value)
-                    if thing in appstate:
-                        points += value * appstate[thing]
-
-            if group == 'groups':
-                # Iterate over the groups of the local profile
-                groups_item_iter = appstate.get('groups', {}).iteritems
-                for grp_name, grp_obj in groups_item_iter():
-                    level_achieved = int(
-                        appstate['groups'][grp_name]['challengeNo']
-                    )
-                    for level, value in rules.get(grp_name, {}).iteritems():
-                        level = int(level)
-                        value = int(value)
-
-                        if level <= level_achieved:
-                            points += value
-    qm = Quests()
-    return int(points) + qm.evaluate_xp()
+    return points
 
 
-def get_group_progress(group_profile):
-    if 'challengeNo' not in group_profile:
+def _get_app_xp(app, groups):
+    """ Returns the XP contribution of an app, recalculating it only if its
+    state file changed since the last time it was read.
+    """
+    state_file = get_app_state_file(app)
+    stamp = get_app_state_stamp(app)
+    if stamp is None:
+        _app_xp_cache.pop(state_file, None)
         return 0
 
-    return group_profile['challengeNo']
+    cached = _app_xp_cache.get(state_file)
+    if cached and cached[0] == stamp:
+        return cached[1]
 
+    appstate = peek_app_state(app)
+    points = calculate_app_xp(groups, appstate) if appstate else 0
+    _app_xp_cache[state_file] = (stamp, points)
+
+    return points
 
-def calculate_app_progress(app_name):
-    app_profile = load_app_state(app_name)
-    progress = 0
 
-    if 'groups' in app_profile and app_profile['groups']:
-        groups_profile = app_profile['groups']
-        for group in groups_profile:
-            progress += get_group_progress(groups_profile[group])
+def calculate_xp():
+    allrules = _load_xp_rules()
+    if not allrules:
+        return -1
 
-        return progress
+    points = 0
 
-    if 'level' in app_profile and app_profile['level']:
-        progress = app_profile['level']
+    for app, groups in allrules.iteritems():
+        points += _get_app_xp(app, groups)
+
+    qm = Quests()
+    return int(points) + qm.evaluate_xp()
 
-    return progress
 
+def calculate_app_progress(app_name):
+    return get_app_state_progress(peek_app_state(app_name))
 
-def calculate_kano_level():
+
+def calculate_kano_level(xp_now=None):
     '''
     Calculates the current level of the user
+    Optionally takes the current xp if it is already known
     Returns: level, percentage and current xp
     '''
     level_rules = read_json(levels_file)
@@ -103,7 +164,8 @@ def calculate_kano_level():
         return -1, 0, 0
 
     max_level = max([int(n) for n in level_rules.keys()])
-    xp_now = calculate_xp()
+    if xp_now is None:
+        xp_now = calculate_xp()
 
     for level in xrange(1, max_level + 1):
         level_min = level_rules[str(level)]
@@ -120,13 +182,14 @@ def calculate_kano_level():
             return int(reached_level), reached_percentage, xp_now
 
 
-def calculate_min_current_max_xp():
+def calculate_min_current_max_xp(xp_now=None):
     level_rules = read_json(levels_file)
     if not level_rules:
         return -1, 0
 
     max_level = max([int(n) for n in level_rules.keys()])
-    xp_now = calculate_xp()
+    if xp_now is None:
+        xp_now = calculate_xp()
 
     level_min = 0
     level_max = 0
@@ -143,165 +206,69 @@ def calculate_min_current_max_xp():
             return level_min, xp_now, level_max
 
 
-class BadgeCalc(object):
-    def __init__(self):
-        self._app_profiles = read_json(app_profiles_file)
-        if not self._app_profiles:
-            logger.error("Error reading app_profiles.json")
-            raise RuntimeError("Couldn't read app profiles")
-
-        self._app_list = get_app_list() + ['computed']
-        self._app_state = dict()
-        for app in self._app_list:
-            self._app_state[app] = load_app_state(app)
-
-        self._app_state.setdefault('computed', dict())['kano_level'] = \
-            calculate_kano_level()[0]
-
-        self._all_rules = load_badge_rules()
-        self._calculated_badges = {}
-
-    def _parse_target_variable(self, variable):
-        return variable.split('.')
-
-    def _get_variable(self, app, target_keys):
-        if target_keys == ['level']:
-            return calculate_app_progress(app)
-
-        ret_val = None
-
-        try:
-            ret_val = self._app_state[app]
-
-            for key in target_keys:
-                ret_val = ret_val[key]
-        except (TypeError, KeyError):
-            ret_val = None
-
-        return ret_val
-
-    def _are_each_greater(self, targets):
-        for target in targets:
-            app = target[0]
-            attr_list = self._parse_target_variable(target[1])
-            threshold_value = target[2]
-
-            local_value = self._get_variable(app, attr_list)
-
-            if local_value is None:
-                return False
-
-            if attr_list[-1] == 'level' and threshold_value == -1:
-                threshold_value = self._app_profiles[app]['max_level']
+# The badge rules only change with the package, so they are compiled once per
+# process and shared by all the BadgeCalc instances.
+_compiled_badge_rules = None
 
-            if local_value < threshold_value:
-                return False
 
-        return True
-
-    def _is_sum_greater(self, targets, threshold_value):
-        total = 0
-
-        for target in targets:
-            app = target[0]
-            attr_list = self._parse_target_variable(target[1])
-
-            local_value = self._get_variable(app, attr_list)
-
-            if local_value:
-                total += float(local_value)
+def load_compiled_badge_rules():
+    """ Returns the badge rules compiled into an evaluation plan
+    :returns: The compiled badge rules
+    :rtype: kano_profile.badge_rules.BadgeRules
+    :raises RuntimeError: If the app profiles can't be read
+    :raises KeyError: If the rules refer to a max level which is not set in
+                      the app profiles
+    """
+    global _compiled_badge_rules
 
-        return total >= threshold_value
+    if _compiled_badge_rules is None:
+        app_profiles = read_json(app_profiles_file)
+        if not app_profiles:
+            logger.error("Error reading app_profiles.json")
+            raise RuntimeError("Couldn't read app profiles")
 
-    def _evaluate_rules(self, rules):
-        """ Evaluates the rules and returns whether the badge has been unlocked
-        :param rules: The category whose z-index will be returned
-        :returns: True or False if the badge has been achieved. If the rules
-                  are malformed it returns None
-        :rtype: Boolean or NoneType
-        """
+        _compiled_badge_rules = BadgeRules(load_badge_rules(), app_profiles)
 
-        warn_template = "Malformed badge rules, missing '{}' - [{}]"
-        req_fields = [
-            'operation',
-            'targets'
-        ]
+    return _compiled_badge_rules
 
-        for field in req_fields:
-            if field not in rules:
-                logger.warn(warn_template.format(field, rules))
-                return None
 
-        if rules['operation'] == 'each_greater':
-            return self._are_each_greater(rules['targets'])
+class BadgeCalc(object):
+    def __init__(self):
+        self._rules = load_compiled_badge_rules()
 
-        if rules['operation'] == 'sum_greater':
-            if 'value' not in rules:
-                logger.warn(warn_template.format('value', rules))
-                return None
+        self._app_list = get_app_list() + ['computed']
+        self._app_state = dict()
+        for app in self._app_list:
+            self._app_state[app] = peek_app_state(app)
 
-            return self._is_sum_greater(rules['targets'], rules['value'])
+        # The computed values are added to the state below
+        self._app_state['computed'] = load_app_state('computed')
 
-        return None
+        self._app_state.setdefault('computed', dict())['kano_level'] = \
+            calculate_kano_level()[0]
 
-    @staticmethod
-    def is_push_back(item):
-        """ Tells us if a rule is of type push_back i.e. to be calculated at
-        the end
-        :param item: A container with the rules dict embedded
-        :type item: tuple with dict in position [1]
-        :returns: True if the rule calculation is to be delayed until non push
-                  back badges are evaluated
-        :rtype: Boolean
-        """
-        rules = item[1]
-        return 'push_back' in rules and rules['push_back'] is True
+        self._achieved = 0
 
     def _do_calculate(self, calculate_only_pushed_back):
         """ Perform the evaluation of the badge unlocking conditions. It stores
-        the results in self._calculated_badges
-        the end
+        the results in the self._achieved bitset
         :param calculate_only_pushed_back: Only calculate 'push_back' type
                                            badges
         :type calculate_only_pushed_back: Boolean
         """
-        for category, subcats in self._all_rules.iteritems():
-            for subcat, items in subcats.iteritems():
-                if calculate_only_pushed_back:
-                    filter_fn = itertools.ifilter
-                else:
-                    filter_fn = itertools.ifilterfalse
-
-                it = filter_fn(self.is_push_back, items.iteritems())
-
-                for item, rules in it:
-                    achieved = self._evaluate_rules(rules)
-                    if achieved is None:
-                        continue
+        if calculate_only_pushed_back:
+            badges = self._rules.push_back_badges
+        else:
+            badges = self._rules.badges
 
-                    calc_badge = self._calculated_badges.setdefault(
-                        category,
-                        {}
-                    )
-                    calc_subcat = calc_badge.setdefault(subcat, {})
-                    calc_subcat[item] = self._all_rules[category][subcat][item]
-                    calc_subcat[item]['achieved'] = achieved
+        for badge in badges:
+            if badge.evaluate(self._app_state):
+                self._achieved |= badge.bit
+            else:
+                self._achieved &= ~badge.bit
 
     def count_offline_badges(self):
-        count = 0
-        # Only iterate over badges
-        iter_badges = itertools.ifilter(lambda k: k[0] == 'badges',
-                                        self._calculated_badges.iteritems())
-        for category, subcats in iter_badges:
-            # Only get the online badges
-            iter_subcats = itertools.ifilter(lambda k: k[0] != 'online',
-                                             subcats.iteritems())
-            for subcat, items in iter_subcats:
-                # Count achieved
-                achieved_iter = itertools.ifilter(lambda k: k['achieved'],
-                                                  items.itervalues())
-                count += sum(1 for b in achieved_iter)
-        return count
+        return self._rules.count_offline(self._achieved)
 
     @property
     def calculated_badges(self):
@@ -316,14 +283,26 @@ class BadgeCalc(object):
         # offline badges needs to have been calculated)
         self._do_calculate(True)
 
+        # The results only reference the rules, so they are cheap to build
+        calculated_badges = self._rules.get_results(self._achieved)
+
         # Inject badges from quests to the dict
         qm = Quests()
-        self._calculated_badges['badges']['quests'] = qm.evaluate_badges()
+        calculated_badges['badges']['quests'] = qm.evaluate_badges()
 
-        return deepcopy(self._calculated_badges)
+        return calculated_badges
 
 
 def calculate_badges():
+    """ Evaluates the rules of all the badges and environments.
+
+    The results are read-only views of the rules rather than copies of them,
+    see badges_to_dict() to serialise them.
+
+    :returns: The BadgeResult of each badge, indexed by category,
+              subcategory and name
+    :rtype: dict
+    """
     ret_v = {}
     try:
         badge_c = BadgeCalc()
@@ -336,6 +315,151 @@ def calculate_badges():
     return ret_v
 
 
+def badges_to_dict(badges):
+    """ Turns the result of calculate_badges() or load_badges() into plain
+    dicts, e.g. to serialise it as JSON.
+
+    :param badges: The badges, indexed by category, subcategory and name
+    :type badges: dict
+    :returns: A copy of the badges where each badge is a dict
+    :rtype: dict
+    """
+    return dict(
+        (category, dict(
+            (subcat, dict(
+                (item, dict(rules.iteritems()))
+                for item, rules in items.iteritems()
+            ))
+            for subcat, items in subcats.iteritems()
+        ))
+        for category, subcats in badges.iteritems()
+    )
+
+
+def _get_rules_stamp():
+    stamp = 0
+    for path in [xp_file, levels_file, app_profiles_file,
+                 os.path.join(rules_dir, 'badges'),
+                 os.path.join(rules_dir, 'environments')]:
+        try:
+            stamp = max(stamp, os.stat(path).st_mtime)
+        except OSError:
+            pass
+
+    return stamp
+
+
+def get_index_key():
+    """ Returns the key the results in the profile index are stored under.
+    Besides the generation of the profile, the results also depend on the
+    rules, which change with the package.
+    """
+    generation = get_generation()
+    if generation is None:
+        generation = bump_generation()
+
+    return [generation, _get_rules_stamp()]
+
+
+def _save_level_index(key, xp, level):
+    save_index('level', key, {
+        'xp': xp,
+        'level': list(level) if level else None
+    })
+
+
+def _load_level_index():
+    key = get_index_key()
+    data = load_index('level', key)
+    if data is None:
+        xp = calculate_xp()
+        level = calculate_kano_level(xp)
+        _save_level_index(key, xp, level)
+        data = {
+            'xp': xp,
+            'level': level
+        }
+
+    return data
+
+
+def load_xp():
+    """ Returns the XP of the user like calculate_xp(), but answers from the
+    profile index if nothing changed since it was last calculated.
+    :returns: The XP
+    :rtype: int
+    """
+    return _load_level_index()['xp']
+
+
+def load_kano_level():
+    """ Returns the level of the user like calculate_kano_level(), but
+    answers from the profile index if nothing changed since it was last
+    calculated.
+    :returns: level, percentage and current xp
+    :rtype: tuple
+    """
+    level = _load_level_index()['level']
+    if level is None:
+        return None
+
+    return tuple(level)
+
+
+def _get_badge_flags(badges):
+    flags = {}
+    for category, subcats in badges.iteritems():
+        for subcat, items in subcats.iteritems():
+            if category == 'badges' and subcat == 'quests':
+                continue
+
+            for item, rules in items.iteritems():
+                flags.setdefault(category, {}).setdefault(subcat, {})[item] = \
+                    rules['achieved']
+    return flags
+
+
+def _get_badges_from_flags(flags):
+    """ Rebuilds the result of calculate_badges() from the achieved flags
+    stored in the index and the badge metadata from the rules.
+    :raises KeyError: If the rules contain a badge missing in the index
+    """
+    rules = load_compiled_badge_rules()
+
+    achieved = 0
+    for badge in rules.all_badges:
+        if flags[badge.category][badge.subcategory][badge.name]:
+            achieved |= badge.bit
+
+    badges = rules.get_results(achieved)
+
+    qm = Quests()
+    badges.setdefault('badges', {})['quests'] = qm.evaluate_badges()
+
+    return badges
+
+
+def load_badges():
+    """ Returns the badges like calculate_badges(), but only evaluates the
+    rules if something changed since they were last calculated.
+    :returns: The badges and environments with their achieved flags
+    :rtype: dict
+    """
+    key = get_index_key()
+    flags = load_index('badges', key)
+    if flags:
+        try:
+            return _get_badges_from_flags(flags)
+        except (KeyError, RuntimeError) as exc:
+            logger.warn("The badge index is out of date [{}]".format(exc))
+
+    badges = calculate_badges()
+    if badges:
+        save_index('badges', key, _get_badge_flags(badges))
+
+    return badges
+
+
 def compare_badges_dict(old, new):
     if old == new:
         return []
@@ -392,16 +516,146 @@ def write_notifications(filename, notifications):
     finally:
         os.close(fifo)
 
-def save_app_state_with_dialog(app_name, data):
-    logger.debug("save_app_state_with_dialog {}".format(app_name))
+def calculate_badge_changes(app_name, old_state, new_state, old_level,
+                            new_level):
+    """ Calculates which badges got unlocked by a change in the state of a
+    single app, without evaluating the whole badge tree.
+
+    Only the badges that refer to the app (or to the kano level, if it
+    changed) are evaluated before and after the change. The push_back badges
+    are evaluated again only if the number of offline badges changed.
+
+    :param app_name: The app whose state changed
+    :type app_name: str
+    :param old_state: The state of the app before the change
+    :type old_state: dict
+    :param new_state: The state of the app after the change
+    :type new_state: dict
+    :param old_level: The kano level before the change
+    :type old_level: int
+    :param new_level: The kano level after the change
+    :type new_level: int
+    :returns: The newly achieved badges in the same format as
+              compare_badges_dict(), empty if the rules can't be loaded
+    :rtype: dict
+    """
+    try:
+        rules = load_compiled_badge_rules()
+    except KeyError as exc:
+        logger.error("Configuration missing some value: [{}]".format(exc))
+        return {}
+    except RuntimeError as exc:
+        logger.error("Error while trying to calculate badges [{}]".format(exc))
+        return {}
+
+    affected = set(rules.badges_for_app(app_name))
+    if old_level != new_level:
+        affected.update(rules.badges_for_target('computed', 'kano_level'))
+
+    new_states = {}
+    for badge in affected:
+        for app in badge.apps:
+            if app not in new_states:
+                new_states[app] = peek_app_state(app)
+
+    new_states[app_name] = new_state
+    if 'computed' not in new_states:
+        new_states['computed'] = peek_app_state('computed')
+    old_states = dict(new_states)
+    old_states[app_name] = old_state
+
+    old_states['computed'] = dict(old_states['computed'],
+                                  kano_level=old_level)
+    new_states['computed'] = dict(new_states['computed'],
+                                  kano_level=new_level)
+
+    changes = {}
+    offline_delta = 0
+    for badge in affected:
+        if badge.push_back:
+            continue
+
+        was_achieved = badge.evaluate(old_states)
+        is_achieved = badge.evaluate(new_states)
+        if was_achieved == is_achieved:
+            continue
+
+        if badge.offline:
+            offline_delta += 1 if is_achieved else -1
+
+        if is_achieved:
+            _add_badge_change(changes, badge)
+
+    if offline_delta or any(badge.push_back for badge in affected):
+        _add_push_back_changes(changes, rules, app_name, old_state, new_state,
+                               old_states['computed'], new_states['computed'],
+                               offline_delta)
+
+    return changes
+
+
+def _add_badge_change(changes, badge):
+    changes.setdefault(badge.category, dict()) \
+        .setdefault(badge.subcategory, dict())[badge.name] = \
+        BadgeResult(badge.rules, True)
+
 
-    old_level, _, old_xp = calculate_kano_level()
-    old_badges = calculate_badges()
+def _add_push_back_changes(changes, rules, app_name, old_state, new_state,
+                           old_computed, new_computed, offline_delta):
+    """ Evaluates the push_back badges before and after a change in the
+    state of an app. These depend on the total number of offline badges, so
+    this needs the states of all the apps.
+    """
+    new_states = dict()
+    for app in get_app_list():
+        new_states[app] = peek_app_state(app)
+    new_states[app_name] = new_state
+    new_states['computed'] = dict(new_computed)
+
+    num_offline_badges = sum(
+        1 for badge in rules.badges
+        if badge.offline and badge.evaluate(new_states)
+    )
+    new_states['computed']['num_offline_badges'] = num_offline_badges
+
+    old_states = dict(new_states)
+    old_states[app_name] = old_state
+    old_states['computed'] = dict(
+        old_computed,
+        num_offline_badges=num_offline_badges - offline_delta
+    )
+
+    for badge in rules.push_back_badges:
+        if not badge.evaluate(old_states) and badge.evaluate(new_states):
+            _add_badge_change(changes, badge)
+
+
+@contextmanager
+def app_state_with_dialog(app_name):
+    """ Just like apps.app_state(), but tells the user about the XP, level and
+    badges gained with the changes. The changes are worked out once for the
+    whole transaction, however many variables it sets.
+
+    :param app_name: The application whose state to change
+    :type app_name: str
+    :returns: The state of the application, to be changed in place
+    :rtype: dict
+    """
+    with app_state(app_name) as data:
+        old_state = deepcopy(data)
+        old_xp = calculate_xp()
+        old_level = calculate_kano_level(old_xp)[0]
+
+        yield data
 
-    save_app_state(app_name, data)
+    if data == old_state:
+        return
 
-    new_level, _, new_xp = calculate_kano_level()
-    new_badges = calculate_badges()
+    index_key = get_index_key()
+    new_xp = calculate_xp()
+    new_level_info = calculate_kano_level(new_xp)
+    new_level = new_level_info[0]
+    _save_level_index(index_key, new_xp, new_level_info)
 
     # TODO: This function needs a bit of refactoring in the future
     # The notifications no longer need to be concatenated to a string
@@ -413,7 +667,8 @@ def save_app_state_with_dialog(app_name, data):
 
     # new items
     new_items_str = ''
-    badge_changes = compare_badges_dict(old_badges, new_badges)
+    badge_changes = calculate_badge_changes(app_name, old_state, data,
+                                            old_level, new_level)
     if badge_changes:
         for category, subcats in badge_changes.iteritems():
             for subcat, items in subcats.iteritems():
@@ -443,16 +698,22 @@ def save_app_state_with_dialog(app_name, data):
     run_bg(cmd)
 
 
+def save_app_state_with_dialog(app_name, data):
+    logger.debug("save_app_state_with_dialog {}".format(app_name))
+
+    with app_state_with_dialog(app_name) as state:
+        state.clear()
+        state.update(data)
+
+
 def save_app_state_variable_with_dialog(app_name, variable, value):
     logger.debug(
         'save_app_state_variable_with_dialog {} {} {}'
         .format(app_name, variable, value)
     )
 
-    data = load_app_state(app_name)
-    data[variable] = value
-
-    save_app_state_with_dialog(app_name, data)
+    with app_state_with_dialog(app_name) as data:
+        data[variable] = value
 
 
 def update_upwards_with_dialog(app_name, variable, value):
@@ -473,11 +734,9 @@ def update_upwards_with_dialog(app_name, variable, value):
         app_name, variable, value
     )
     logger.debug(msg)
-    data = load_app_state(app_name)
-    if data.get(variable, 0) < value:
-        data[variable] = value
-
-        save_app_state_with_dialog(app_name, data)
+    with app_state_with_dialog(app_name) as data:
+        if data.get(variable, 0) < value:
+            data[variable] = value
 
 
 def increment_app_state_variable_with_dialog(app_name, variable, value):
@@ -486,12 +745,10 @@ def increment_app_state_variable_with_dialog(app_name, variable, value):
         .format(app_name, variable, value)
     )
 
-    data = load_app_state(app_name)
-    if variable not in data:
-        data[variable] = 0
-    data[variable] += value
-
-    save_app_state_with_dialog(app_name, data)
+    with app_state_with_dialog(app_name) as data:
+        if variable not in data:
+            data[variable] = 0
+        data[variable] += value
 
 
 def load_badge_rules():
@@ -541,7 +798,7 @@ def count_completed_challenges():
     completed_challenges = 0
 
     for app, groups in allrules.iteritems():
-        appstate = load_app_state(app)
+        appstate = peek_app_state(app)
         try:
             completed_challenges += int(appstate['level'])
         except Exception:
@@ -551,7 +808,7 @@ def count_completed_challenges():
 
 
 def count_badges():
-    all_badges = calculate_badges()
+    all_badges = load_badges()
 
     locked = {
         'badges': 0,
@@ -582,7 +839,7 @@ def count_stat(key):
     count = 0
 
     for app, _ in allrules.iteritems():
-        appstate = load_app_state(app)
+        appstate = peek_app_state(app)
         try:
             count += int(appstate[key])
         except Exception:
@@ -0,0 +1,124 @@
+# json_cache.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Process-wide read-through cache of the profile json files
+#
+# The profile and the app states are read over and over again, often many
+# times within a single operation. The parsed contents of each file are kept
+# along with the stat of the file they were read from, so reading an
+# unchanged file again only costs a stat. The writers invalidate the entries
+# of the files they save explicitly, as the stat of a file replaced within
+# the resolution of the timestamps can look the same.
+#
+
+import os
+import threading
+
+from kano.utils import read_json
+
+
+# Parsed contents of the files, keyed by the path. Each entry remembers the
+# stat of the file it was read from.
+_cache = {}
+_cache_lock = threading.Lock()
+
+# Functions to call when a file is invalidated, for the caches of values
+# derived from the files
+_invalidate_hooks = []
+
+
+def _get_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return st.st_mtime, st.st_size, st.st_ino
+
+
+def copy_json(value):
+    """ Copies a JSON value, much faster than deepcopy() as it only needs to
+    deal with dicts, lists and immutable values.
+    """
+    value_type = type(value)
+
+    if value_type is dict:
+        return {
+            key: copy_json(item) if type(item) in (dict, list) else item
+            for key, item in value.iteritems()
+        }
+
+    if value_type is list:
+        return [
+            copy_json(item) if type(item) in (dict, list) else item
+            for item in value
+        ]
+
+    return value
+
+
+def peek_json(path):
+    """ Reads a json file through the cache.
+
+    The value returned is shared with the other readers of the file, so it
+    must not be modified. Use read_json_cached() to get a private copy.
+
+    :param path: The file to read
+    :type path: str
+    :returns: The contents of the file or None if it is missing or invalid
+    """
+    stamp = _get_stamp(path)
+    if stamp is None:
+        with _cache_lock:
+            _cache.pop(path, None)
+        return None
+
+    entry = _cache.get(path)
+    if entry is None or entry[0] != stamp:
+        # If the file changes between the stat and the read, the new contents
+        # are stored with the old stamp and simply read again next time
+        entry = (stamp, read_json(path))
+        with _cache_lock:
+            _cache[path] = entry
+
+    return entry[1]
+
+
+def read_json_cached(path):
+    """ Reads a json file through the cache.
+
+    :param path: The file to read
+    :type path: str
+    :returns: A copy of the contents of the file, which the caller is free to
+              modify, or None if it is missing or invalid
+    """
+    return copy_json(peek_json(path))
+
+
+def on_invalidate(hook):
+    """ Registers a function to call whenever a file is dropped from the
+    cache, so the values derived from it can be dropped along with it.
+
+    :param hook: Called with the path passed to invalidate()
+    :type hook: function
+    """
+    _invalidate_hooks.append(hook)
+
+
+def invalidate(path=None):
+    """ Drops a file from the cache. Call it after writing the file.
+
+    :param path: (Optional) The file that changed. Drops all the files if
+                 not given.
+    :type path: str
+    """
+    with _cache_lock:
+        if path is None:
+            _cache.clear()
+        else:
+            _cache.pop(path, None)
+
+    for hook in _invalidate_hooks:
+        hook(path)
@@ -64,6 +64,12 @@ online_badges_file = os.path.join(online_badges_dir, "badges.json")
 profile_file_str = 'profile.json'
 profile_file = os.path.join(profile_dir, profile_file_str)
 
+profile_index_file = os.path.join(profile_dir, 'index.json')
+profile_generation_file = os.path.join(profile_dir, 'generation')
+
+# The hashes of the app states as last synced with Kano World
+profile_sync_hashes_file = os.path.join(profile_dir, 'sync-hashes.json')
+
 xp_file = os.path.join(rules_dir, 'xp.json')
 levels_file = os.path.join(rules_dir, 'levels.json')
 
@@ -71,6 +77,12 @@ app_profiles_file = os.path.join(rules_dir, 'app_profiles.json')
 
 tracker_dir = os.path.join(kanoprofile_dir, 'tracker/sessions/')
 tracker_events_file = os.path.join(kanoprofile_dir, 'tracker/events')
+tracker_event_log_dir = os.path.join(kanoprofile_dir, 'tracker/event-log')
+tracker_upload_cursor_file = os.path.join(kanoprofile_dir,
+                                          'tracker/upload-cursor')
 tracker_token_file = os.path.join(kanoprofile_dir, 'tracker/token')
+tracker_socket_file = os.path.join(kanoprofile_dir, 'tracker/daemon.sock')
+tracker_app_stats_dir = os.path.join(kanoprofile_dir, 'tracker/app-stats')
+tracker_boot_clocks_file = os.path.join(kanoprofile_dir, 'tracker/boot-clocks')
 
 PAUSED_SESSIONS_FILE = os.path.join(kanoprofile_dir, '.paused_sessions')
@@ -9,10 +9,11 @@
 import os
 
 from kano.logging import logger
-from kano.utils import (read_json, write_json, get_date_now, ensure_dir,
-                        chown_path, get_user_unsudoed, run_bg, is_running,
-                        list_dir)
+from kano.utils import (get_date_now, ensure_dir, chown_path,
+                        get_user_unsudoed, run_bg, is_running, list_dir)
 from .paths import profile_file, profile_dir, kanoprofile_dir, bin_dir
+from .atomic_write import atomic_write_json
+from .json_cache import read_json_cached, invalidate
 from kano_avatar.paths import AVATAR_DEFAULT_LOC
 
 
@@ -22,7 +23,7 @@ def load_profile():
     :returns: profile data as a dict
     :rtype: dict
     '''
-    data = read_json(profile_file)
+    data = read_json_cached(profile_file)
     if not data:
         data = dict()
         # if the profile file doesn't exist make sure that the new one
@@ -45,7 +46,8 @@ def save_profile(data, skip_kdesk_refresh=False):
     data.pop('mac_addr', None)
     data['save_date'] = get_date_now()
     ensure_dir(profile_dir)
-    write_json(profile_file, data)
+    atomic_write_json(profile_file, data)
+    invalidate(profile_file)
 
     if 'SUDO_USER' in os.environ:
         chown_path(kanoprofile_dir)
@@ -0,0 +1,122 @@
+# profile_index.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Persistent index of the results calculated from the profile
+#
+# Working out the XP, level and badges means reading all the app states and
+# evaluating the rules. The results are stored in a small index file along
+# with the generation of the profile they were calculated from. The
+# generation is a counter bumped every time an app state is saved, so an
+# entry of the index is only valid while nothing has changed since.
+#
+
+import os
+import fcntl
+
+from kano.logging import logger
+from kano.utils import read_json, ensure_dir, chown_path
+from kano_profile.paths import profile_dir, profile_index_file, \
+    profile_generation_file
+from kano_profile.atomic_write import atomic_write_json
+
+
+def get_generation(generation_file=profile_generation_file):
+    """ Returns the current generation of the profile
+    :param generation_file: (Optional) The file holding the generation
+    :returns: The generation or None if it hasn't been started yet
+    :rtype: int or NoneType
+    """
+    try:
+        with open(generation_file, 'r') as f:
+            return int(f.read().strip())
+    except (IOError, ValueError):
+        return None
+
+
+def bump_generation(generation_file=profile_generation_file, user=None):
+    """ Increments the generation of the profile, invalidating the index.
+
+    When the count is (re)started, the index next to the generation file is
+    removed as it could have been written with a colliding generation.
+
+    :param generation_file: (Optional) The file holding the generation, used
+                            to bump the generation of other users' profiles
+    :param user: (Optional) The owner to give the file to
+    :returns: The new generation or None on error
+    :rtype: int or NoneType
+    """
+    ensure_dir(os.path.dirname(generation_file))
+
+    try:
+        f = open(generation_file, 'a+')
+    except IOError as exc:
+        logger.error("Error opening the generation file: {}".format(exc))
+        return None
+
+    with f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        f.seek(0)
+        try:
+            generation = int(f.read().strip()) + 1
+        except ValueError:
+            generation = 1
+            index_file = os.path.join(os.path.dirname(generation_file),
+                                      os.path.basename(profile_index_file))
+            if os.path.exists(index_file):
+                os.remove(index_file)
+
+        f.seek(0)
+        f.truncate()
+        f.write(str(generation))
+
+    if user:
+        chown_path(generation_file, user, user)
+    elif 'SUDO_USER' in os.environ:
+        chown_path(profile_dir)
+        chown_path(generation_file)
+
+    return generation
+
+
+def load_index(section, key):
+    """ Reads a section of the index
+    :param section: Name of the section
+    :type section: str
+    :param key: The generation (and anything else the data depend on) the
+                data must have been calculated for
+    :type key: JSON serialisable value
+    :returns: The indexed data or None if it is missing or out of date
+    """
+    index = read_json(profile_index_file) or {}
+
+    entry = index.get(section)
+    if not entry or entry.get('key') != key:
+        return None
+
+    return entry.get('data')
+
+
+def save_index(section, key, data):
+    """ Stores a section of the index
+    :param section: Name of the section
+    :type section: str
+    :param key: The generation (and anything else the data depend on) the
+                data were calculated for. Make sure to read it before
+                calculating the data.
+    :type key: JSON serialisable value
+    :param data: The data to store
+    :type data: JSON serialisable value
+    """
+    index = read_json(profile_index_file) or {}
+    index[section] = {
+        'key': key,
+        'data': data
+    }
+
+    ensure_dir(profile_dir)
+    atomic_write_json(profile_index_file, index)
+    if 'SUDO_USER' in os.environ:
+        chown_path(profile_dir)
+        chown_path(profile_index_file)
@@ -11,6 +11,8 @@ import imp
 from kano.logging import logger
 from kano.utils import ensure_dir, run_cmd
 from .paths import profile_dir
+from .profile_index import bump_generation
+from .atomic_write import atomic_write_json
 from kano_profile_gui.paths import media_dir
 from kano.notifications import display_generic_notification
 
@@ -414,8 +416,10 @@ class Quest(object):
             store[self._id] = {}
         store[self._id]['state'] = self._state
 
-        with open(QUESTS_STORE, 'w') as quest_store_f:
-            json.dump(store, quest_store_f)
+        atomic_write_json(QUESTS_STORE, store, sort_keys=False)
+
+        # The XP and badges depend on the state of the quests
+        bump_generation()
 
     def _can_be_active(self):
         active = True
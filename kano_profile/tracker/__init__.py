@@ -14,6 +14,7 @@ __author__ = 'Kano Computing Ltd.'
 __email__ = 'dev@kano.me'
 
 
+import sys
 import time
 import atexit
 import datetime
@@ -24,30 +25,51 @@ import shlex
 
 from uuid import uuid1, uuid5
 
-from kano.utils.file_operations import read_file_contents, chown_path, \
-    ensure_dir
+from kano.utils.file_operations import read_file_contents, ensure_dir
 from kano.utils.hardware import get_cpu_id
 from kano.utils.misc import is_number
 from kano.logging import logger
 
-from kano_profile.apps import get_app_state_file, load_app_state_variable, \
-    save_app_state_variable
-from kano_profile.paths import tracker_dir, tracker_events_file, \
-    tracker_token_file
-from kano_profile.tracker.tracker_token import TOKEN, generate_tracker_token, \
-	load_token
-from kano_profile.tracker.tracking_utils import open_locked, \
-    get_nearest_previous_monday, get_utc_offset
+from kano_profile.apps import app_state, save_app_state_variable
+from kano_profile.paths import tracker_dir, tracker_token_file, \
+    tracker_upload_cursor_file
+from kano_profile.atomic_write import atomic_write_json
+from kano_profile.tracker.tracker_token import get_token, \
+    generate_tracker_token, load_token
+from kano_profile.tracker.event_log import iter_events_with_cursor, \
+    rewrite_events, KEEP, DROP
+from kano_profile.tracker.event_buffer import buffer_event
+from kano_profile.tracker.app_stats import migrate_app_stats, \
+    update_app_stats
+from kano_profile.tracker.boot_clock import get_boot_id, get_boottime, \
+    load_boot_clocks, get_wall_time
+from kano_profile.tracker.tracking_utils import get_utc_offset, LazyModule
 from kano_profile.tracker.tracking_session import TrackingSession
-from kano_profile.tracker.tracking_sessions import session_start, session_end, \
-    list_sessions, get_open_sessions, get_session_file_path, session_log, \
-	get_session_unique_id, get_session_event, CPU_ID, LANGUAGE, OS_VERSION
+from kano_profile.tracker.tracking_sessions import list_sessions, \
+    get_open_sessions, get_session_file_path, session_log, \
+    get_session_unique_id, get_session_event, get_tracker_cpu_id, \
+    get_os_version, get_language
 
 # Public imports
 from kano_profile.tracker.tracker import Tracker
+from kano_profile.tracker.tracking_utils import open_locked
+from kano_profile.tracker.event_buffer import flush_tracking_events
 from kano_profile.tracker.tracking_sessions import session_start, session_end, \
     pause_tracking_sessions, unpause_tracking_sessions
 
+__all__ = [
+    'open_locked', 'load_token', 'generate_tracker_token', 'OS_VERSION',
+    'CPU_ID', 'TOKEN', 'LANGUAGE', 'get_session_file_path',
+    'get_session_unique_id', 'session_start', 'session_end', 'session_log',
+    'list_sessions', 'get_open_sessions', 'get_session_event',
+    'pause_tracking_sessions', 'unpause_tracking_sessions', 'track_data',
+    'track_action', 'track_subprocess', 'get_action_event', 'get_utc_offset',
+    'Tracker', 'TrackingSession', 'add_runtime_to_app', 'save_hardware_info',
+    'save_kano_version', 'flush_tracking_events', 'iter_tracker_events',
+    'get_tracker_events', 'clear_tracker_events',
+    'acknowledge_tracker_events', 'resume_tracker_events_upload'
+]
+
 
 def track_data(name, data):
     """ Track arbitrary data.
@@ -65,23 +87,17 @@ def track_data(name, data):
         'type': 'data',
         'time': int(time.time()),
         'timezone_offset': get_utc_offset(),
-        'os_version': OS_VERSION,
-        'cpu_id': CPU_ID,
-        'token': TOKEN,
-        'language': LANGUAGE,
+        'os_version': get_os_version(),
+        'cpu_id': get_tracker_cpu_id(),
+        'token': get_token(),
+        'language': get_language(),
         'name': str(name),
-        'data': data
+        'data': data,
+        'boot_id': get_boot_id(),
+        'boottime': int(get_boottime())
     }
 
-    try:
-        af = open_locked(tracker_events_file, 'a')
-    except IOError as e:
-        logger.error("Error opening tracker events file {}".format(e))
-    else:
-        with af:
-            af.write(json.dumps(event) + "\n")
-        if 'SUDO_USER' in os.environ:
-            chown_path(tracker_events_file)
+    buffer_event(event)
 
 
 def track_action(name):
@@ -91,16 +107,7 @@ def track_action(name):
         :type name: str
     """
 
-    try:
-        af = open_locked(tracker_events_file, 'a')
-    except IOError as e:
-        logger.error("Error opening tracker events file {}".format(e))
-    else:
-        with af:
-            event = get_action_event(name)
-            af.write(json.dumps(event) + "\n")
-        if 'SUDO_USER' in os.environ:
-            chown_path(tracker_events_file)
+    buffer_event(get_action_event(name))
 
 
 def track_subprocess(name, cmd):
@@ -126,11 +133,13 @@ def get_action_event(name):
         'type': 'action',
         'time': int(time.time()),
         'timezone_offset': get_utc_offset(),
-        'os_version': OS_VERSION,
-        'cpu_id': CPU_ID,
-        'token': TOKEN,
-        'language': LANGUAGE,
-        'name': name
+        'os_version': get_os_version(),
+        'cpu_id': get_tracker_cpu_id(),
+        'token': get_token(),
+        'language': get_language(),
+        'name': name,
+        'boot_id': get_boot_id(),
+        'boottime': int(get_boottime())
     }
 
 
@@ -139,11 +148,12 @@ def add_runtime_to_app(app, runtime):
 
         Appends a time period to a given app's runtime stats and raises
         starts by one. Apart from the total values, it also updates the
-        weekly stats.
+        weekly stats, which are rolled up into monthly and yearly ones as
+        they get older (see kano_profile.tracker.app_stats).
 
-        This function uses advisory file locks (see flock(2)) to avoid
-        races between different applications saving their tracking data
-        at the same time.
+        The stats of each app are stored on their own and updated under an
+        advisory file lock (see flock(2)) to avoid races between different
+        applications saving their tracking data at the same time.
 
         :param app: The name of the application.
         :type app: str
@@ -161,45 +171,8 @@ def add_runtime_to_app(app, runtime):
 
     app = app.replace('.', '_')
 
-    # Make sure no one else is accessing this file
-    app_state_file = get_app_state_file('kano-tracker')
-
-    try:
-        tracker_store = open_locked(app_state_file, 'r')
-    except IOError as e:
-        logger.error("Error opening app state file {}".format(e))
-    else:
-        app_stats = load_app_state_variable('kano-tracker', 'app_stats')
-        if not app_stats:
-            app_stats = dict()
-
-        try:
-            app_stats[app]['starts'] += 1
-            app_stats[app]['runtime'] += runtime
-        except Exception:
-            app_stats[app] = {
-                'starts': 1,
-                'runtime': runtime,
-            }
-
-        # Record usage data on per-week basis
-        if 'weekly' not in app_stats[app]:
-            app_stats[app]['weekly'] = {}
-
-        week = str(get_nearest_previous_monday())
-        if week not in app_stats[app]['weekly']:
-            app_stats[app]['weekly'][week] = {
-                'starts': 0,
-                'runtime': 0
-            }
-
-        app_stats[app]['weekly'][week]['starts'] += 1
-        app_stats[app]['weekly'][week]['runtime'] += runtime
-
-        save_app_state_variable('kano-tracker', 'app_stats', app_stats)
-
-        # Close the lock
-        tracker_store.close()
+    migrate_app_stats()
+    update_app_stats(app, runtime)
 
 
 def save_hardware_info():
@@ -222,10 +195,6 @@ def save_kano_version():
     """Saves a dict of os-version: time values,
     to keep track of the users update process"""
 
-    updates = load_app_state_variable('kano-tracker', 'versions')
-    if not updates:
-        updates = dict()
-
     version_now = read_file_contents('/etc/kanux_version')
     if not version_now:
         return
@@ -233,39 +202,83 @@ def save_kano_version():
     version_now = version_now.replace('.', '_')
 
     time_now = datetime.datetime.utcnow().isoformat()
-    updates[version_now] = time_now
 
-    save_app_state_variable('kano-tracker', 'versions', updates)
+    with app_state('kano-tracker') as state:
+        updates = state.get('versions')
+        if not updates:
+            updates = state['versions'] = dict()
 
+        updates[version_now] = time_now
 
-def get_tracker_events(old_only=False):
-    """ Read the events log and return a dictionary with all of them.
+
+def iter_tracker_events(old_only=False):
+    """ Stream the valid events from the events log, without loading them
+        all in memory.
 
         :param old_only: Don't return events from the current boot.
         :type old_only: boolean
 
-        :returns: A dictionary suitable to be sent to the tracker endpoint.
+        :returns: The position in the log just after each event (to be
+                  passed to clear_tracker_events) and the event itself.
+        :rtype: iterator of (tuple, dict) tuples
+    """
+
+    flush_tracking_events()
+    token = get_token()
+    boot_clocks = load_boot_clocks()
+
+    for cursor, event in iter_events_with_cursor():
+        if not _validate_event(event):
+            continue
+
+        if old_only and event['token'] == token:
+            continue
+
+        yield cursor, _resolve_event_time(event, boot_clocks)
+
+
+def _resolve_event_time(event, boot_clocks):
+    """ Work out the wall time of an event from the clock of its boot,
+        which is only stored to that end.
+
+        :param event: The event data.
+        :type event: dict
+
+        :param boot_clocks: The offsets of the previous boots, as given by
+            load_boot_clocks().
+        :type boot_clocks: dict
+
+        :returns: The event, with the time it was stored with if its boot is
+            unknown.
         :rtype: dict
     """
 
-    data = {'events': []}
+    boot_id = event.pop('boot_id', None)
+    boottime = event.pop('boottime', None)
 
-    try:
-        rf = open_locked(tracker_events_file, 'r')
-    except IOError as e:
-        logger.error("Error opening the tracker events file {}".format(e))
-    else:
-        with rf:
-            for event_line in rf.readlines():
-                try:
-                    event = json.loads(event_line)
-                except:
-                    logger.warn("Found a corrupted event, skipping.")
+    if boottime is not None:
+        wall_time = get_wall_time(boot_id, boottime, boot_clocks)
+        if wall_time is not None:
+            event['time'] = int(wall_time)
+
+    return event
+
+
+def get_tracker_events(old_only=False):
+    """ Read the events log and return a dictionary with all of them.
 
-                if _validate_event(event) and event['token'] != TOKEN:
-                    data['events'].append(event)
+        :param old_only: Don't return events from the current boot.
+        :type old_only: boolean
+
+        :returns: A dictionary suitable to be sent to the tracker endpoint.
+        :rtype: dict
+    """
 
-    return data
+    return {
+        'events': [
+            event for dummy_cursor, event in iter_tracker_events(old_only)
+        ]
+    }
 
 
 def _validate_event(event):
@@ -303,29 +316,77 @@ def _validate_event(event):
     return True
 
 
-def clear_tracker_events(old_only=True):
+def clear_tracker_events(old_only=True, until=None):
     """ Truncate the events file, removing all the cached data.
 
         :param old_only: Don't remove data from the current boot.
         :type old_only: boolean
+
+        :param until: Only remove the events up to this position, as given
+            by iter_tracker_events. The events stored after it are not even
+            read.
+        :type until: tuple
     """
+
+    token = get_token()
+
+    def select(header):
+        if old_only and header.get('token') == token:
+            return KEEP
+
+        return DROP
+
+    return rewrite_events(select, until=until)
+
+
+def acknowledge_tracker_events(cursor):
+    """ Remove the old events up to the position given once they have been
+        uploaded.
+
+        The position is saved first, so if this gets interrupted the events
+        are removed by resume_tracker_events_upload() instead of being
+        uploaded again.
+
+        :param cursor: The position of the last event uploaded, as given by
+            iter_tracker_events.
+        :type cursor: tuple
+
+        :returns: Whether the events were removed.
+        :rtype: boolean
+    """
+
+    try:
+        atomic_write_json(tracker_upload_cursor_file, list(cursor))
+    except (IOError, OSError) as e:
+        logger.error("Error saving the tracker upload cursor {}".format(e))
+
+    if not clear_tracker_events(old_only=True, until=tuple(cursor)):
+        return False
+
+    if os.path.exists(tracker_upload_cursor_file):
+        os.remove(tracker_upload_cursor_file)
+
+    return True
+
+
+def resume_tracker_events_upload():
+    """ Finish removing the events of an interrupted upload. """
+
     try:
-        rf = open_locked(tracker_events_file, 'r')
-    except IOError as e:
-        logger.error("Error opening tracking events file {}".format(e))
-    else:
-        with rf:
-            events = []
-            for event_line in rf.readlines():
-                try:
-                    event = json.loads(event_line)
-                    if 'token' in event and event['token'] == TOKEN:
-                        events.append(event_line)
-                except:
-                    logger.warn("Found a corrupted event, skipping.")
-
-            with open(tracker_events_file, 'w') as wf:
-                for event_line in events:
-                    wf.write(event_line)
-            if 'SUDO_USER' in os.environ:
-                chown_path(tracker_events_file)
+        with open(tracker_upload_cursor_file, 'r') as cursor_f:
+            cursor = json.load(cursor_f)
+    except (IOError, ValueError):
+        cursor = None
+
+    if isinstance(cursor, list) and len(cursor) == 3:
+        acknowledge_tracker_events(cursor)
+    elif os.path.exists(tracker_upload_cursor_file):
+        os.remove(tracker_upload_cursor_file)
+
+
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'CPU_ID': get_tracker_cpu_id,
+    'OS_VERSION': get_os_version,
+    'LANGUAGE': get_language,
+    'TOKEN': get_token,
+})
@@ -0,0 +1,171 @@
+#
+# app_stats.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# The usage statistics of the applications
+#
+# Each application has a record of how many times it was started and for
+# how long it ran, in total and over time. The recent weeks are kept at full
+# resolution, while older weeks are rolled up into months and older months
+# into years, so the records stop growing. The records are stored in a file
+# per app, so ending a session only rewrites the small record of its app.
+#
+# The statistics used to be kept in the `app_stats` of the kano-tracker app
+# state, which still carries them when they're synced with Kano World.
+#
+
+
+import os
+import time
+
+from kano.logging import logger
+from kano.utils import read_json
+from kano.utils.file_operations import ensure_dir
+from kano_profile.apps import app_state, peek_app_state
+from kano_profile.paths import tracker_app_stats_dir
+from kano_profile.atomic_write import atomic_write_json, deferred_fsync
+from kano_profile.tracker.tracking_utils import open_locked, \
+    get_nearest_previous_monday
+
+
+WEEKS_KEPT = 8
+MONTHS_KEPT = 12
+
+WEEK = 7 * 24 * 60 * 60
+
+
+def _get_record_path(app, stats_dir):
+    return os.path.join(stats_dir, '{}.json'.format(app))
+
+
+def _lock(stats_dir):
+    ensure_dir(stats_dir)
+    return open_locked(os.path.join(stats_dir, '.lock'), 'a')
+
+
+def _add_to_bucket(buckets, key, starts, runtime):
+    bucket = buckets.setdefault(key, {'starts': 0, 'runtime': 0})
+    bucket['starts'] += starts
+    bucket['runtime'] += runtime
+
+
+def _get_month(week):
+    # The weeks go to the month of their Monday
+    return time.strftime('%Y-%m', time.gmtime(int(week)))
+
+
+def compact_app_stats(record, week=None):
+    """ Rolls the weeks older than WEEKS_KEPT up into months, and the months
+    older than MONTHS_KEPT up into years.
+
+    :param record: The statistics of an app, compacted in place
+    :type record: dict
+    :param week: (Optional) The current week, as given by
+                 get_nearest_previous_monday()
+    :type week: int
+    :returns: The record given
+    :rtype: dict
+    """
+    if week is None:
+        week = get_nearest_previous_monday()
+
+    weekly = record.setdefault('weekly', {})
+    monthly = record.setdefault('monthly', {})
+    yearly = record.setdefault('yearly', {})
+
+    oldest_week = week - (WEEKS_KEPT - 1) * WEEK
+    for key in weekly.keys():
+        if int(key) < oldest_week:
+            bucket = weekly.pop(key)
+            _add_to_bucket(monthly, _get_month(key), bucket['starts'],
+                           bucket['runtime'])
+
+    year, month = [int(part) for part in _get_month(week).split('-')]
+    month_index = year * 12 + month - 1 - (MONTHS_KEPT - 1)
+    oldest_month = '{:04d}-{:02d}'.format(month_index // 12,
+                                          month_index % 12 + 1)
+    for key in monthly.keys():
+        if key < oldest_month:
+            bucket = monthly.pop(key)
+            _add_to_bucket(yearly, key[:4], bucket['starts'],
+                           bucket['runtime'])
+
+    return record
+
+
+def load_app_stats(stats_dir=tracker_app_stats_dir):
+    """ Reads the statistics of all the apps.
+
+    :returns: The records indexed by the app
+    :rtype: dict
+    """
+    app_stats = {}
+
+    try:
+        names = os.listdir(stats_dir)
+    except OSError:
+        return app_stats
+
+    for name in names:
+        app, ext = os.path.splitext(name)
+        if ext != '.json':
+            continue
+
+        record = read_json(os.path.join(stats_dir, name))
+        if record:
+            app_stats[app] = record
+
+    return app_stats
+
+
+def update_app_stats(app, runtime, stats_dir=tracker_app_stats_dir):
+    """ Counts a new session of an app.
+
+    :param app: The name of the app
+    :type app: str
+    :param runtime: For how long the app ran
+    :type runtime: float
+    """
+    week = get_nearest_previous_monday()
+    path = _get_record_path(app, stats_dir)
+
+    with _lock(stats_dir):
+        record = read_json(path) or {}
+
+        record['starts'] = record.get('starts', 0) + 1
+        record['runtime'] = record.get('runtime', 0) + runtime
+        _add_to_bucket(record.setdefault('weekly', {}), str(week), 1, runtime)
+
+        atomic_write_json(path, compact_app_stats(record, week))
+
+
+def import_app_stats(app_stats, stats_dir=tracker_app_stats_dir):
+    """ Stores the statistics of the apps which don't have a record yet, e.g.
+    the ones restored from Kano World.
+
+    :param app_stats: The records indexed by the app
+    :type app_stats: dict
+    """
+    week = get_nearest_previous_monday()
+
+    with _lock(stats_dir), deferred_fsync():
+        for app, record in app_stats.iteritems():
+            path = _get_record_path(app, stats_dir)
+            if not isinstance(record, dict) or os.path.exists(path):
+                continue
+
+            atomic_write_json(path, compact_app_stats(record, week))
+
+
+def migrate_app_stats(stats_dir=tracker_app_stats_dir):
+    """ Moves the statistics out of the kano-tracker app state. """
+    if 'app_stats' not in (peek_app_state('kano-tracker') or {}):
+        return
+
+    with app_state('kano-tracker') as state:
+        app_stats = state.pop('app_stats', None)
+        if app_stats:
+            logger.info("Moving the app stats to their own store")
+            import_app_stats(app_stats, stats_dir)
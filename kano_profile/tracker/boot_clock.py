@@ -0,0 +1,198 @@
+#
+# boot_clock.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Timing of the sessions and events unaffected by changes of the system time
+#
+# The Kits have no real time clock, so the system time is often wrong until
+# NTP catches up, long after the first sessions started. Rather than fixing
+# the sessions and events up whenever the time changes, they carry the ID of
+# the boot and the CLOCK_BOOTTIME of when they happened, which only ever
+# moves forward at the same rate (suspend included). The lengths of the
+# sessions are measured on that clock, and their wall time is only worked
+# out when the events are read for the upload.
+#
+# To do that for the events of the previous boots, the offset between the
+# wall time and CLOCK_BOOTTIME is noted every time the sessions are
+# refreshed, the last one noted in a boot being the most accurate. The
+# offsets are kept for as long as there are events or sessions of the boot,
+# however many boots that takes.
+#
+
+
+import os
+import time
+import ctypes
+import ctypes.util
+
+from kano.logging import logger
+from kano.utils import read_json
+from kano_profile.paths import tracker_boot_clocks_file, tracker_dir
+from kano_profile.atomic_write import atomic_write_json
+from kano_profile.tracker.event_log import iter_headers
+from kano_profile.tracker.tracking_utils import list_files
+
+
+BOOT_ID_FILE = '/proc/sys/kernel/random/boot_id'
+UPTIME_FILE = '/proc/uptime'
+
+CLOCK_BOOTTIME = 7
+
+# How far off the noted offset of the boot can be before it's noted again
+CLOCK_TOLERANCE = 2
+
+# How many boots to note before looking for those no longer needed
+MAX_BOOTS = 32
+
+
+class _timespec(ctypes.Structure):
+    _fields_ = [
+        ('tv_sec', ctypes.c_long),
+        ('tv_nsec', ctypes.c_long)
+    ]
+
+
+_boot_id = None
+_clock_gettime = None
+
+
+def get_boot_id():
+    """ Returns the ID of the current boot, or an empty string if it's not
+        available.
+    """
+
+    global _boot_id
+
+    if _boot_id is None:
+        try:
+            with open(BOOT_ID_FILE, 'r') as boot_id_f:
+                _boot_id = boot_id_f.read().strip()
+        except IOError as err:
+            logger.warn("Can't read the boot ID: {}".format(err))
+            _boot_id = ''
+
+    return _boot_id
+
+
+def _get_clock_gettime():
+    global _clock_gettime
+
+    if _clock_gettime is None:
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _clock_gettime = libc.clock_gettime
+        except (OSError, AttributeError):
+            _clock_gettime = False
+
+    return _clock_gettime
+
+
+def get_boottime():
+    """ Returns the time since the boot, suspend included.
+
+        :returns: The CLOCK_BOOTTIME in seconds.
+        :rtype: float
+    """
+
+    clock_gettime = _get_clock_gettime()
+    if clock_gettime:
+        ts = _timespec()
+        if clock_gettime(CLOCK_BOOTTIME, ctypes.byref(ts)) == 0:
+            return ts.tv_sec + ts.tv_nsec / 1e9
+
+    # Older kernels, /proc/uptime is read off the same clock
+    with open(UPTIME_FILE, 'r') as uptime_f:
+        return float(uptime_f.read().split()[0])
+
+
+def get_boot_clock_offset():
+    """ Returns the wall time of the boot, as the system time has it now. """
+
+    return time.time() - get_boottime()
+
+
+def load_boot_clocks(path=tracker_boot_clocks_file):
+    """ Reads the last offsets noted for the previous boots.
+
+        :returns: The wall time of each boot, indexed by its ID.
+        :rtype: dict
+    """
+
+    return read_json(path) or {}
+
+
+def _get_boots_in_use():
+    """ Returns the IDs of the boots of the events still in the log, which
+        includes those being uploaded, and of the session files.
+    """
+
+    boot_ids = set(header.get('boot_id') for header in iter_headers())
+
+    try:
+        names = list_files(tracker_dir)
+    except OSError:
+        names = []
+
+    for name in names:
+        session = read_json(os.path.join(tracker_dir, name))
+        if isinstance(session, dict):
+            boot_ids.add(session.get('boot_id'))
+
+    return boot_ids
+
+
+def note_boot_clock(path=tracker_boot_clocks_file):
+    """ Notes the offset of the wall time of the current boot, if the system
+        time has changed since it was last noted.
+    """
+
+    boot_id = get_boot_id()
+    if not boot_id:
+        return
+
+    offset = get_boot_clock_offset()
+    boot_clocks = load_boot_clocks(path)
+    if abs(boot_clocks.get(boot_id, 0) - offset) <= CLOCK_TOLERANCE:
+        return
+
+    boot_clocks[boot_id] = offset
+
+    # The events of the boots without an offset keep the time they have, so
+    # only the boots nothing refers to any more are dropped
+    if len(boot_clocks) > MAX_BOOTS:
+        in_use = _get_boots_in_use()
+        in_use.add(boot_id)
+
+        for old_boot_id in set(boot_clocks) - in_use:
+            del boot_clocks[old_boot_id]
+
+    try:
+        atomic_write_json(path, boot_clocks)
+    except (IOError, OSError) as err:
+        logger.error("Error noting the clock of the boot: {}".format(err))
+
+
+def get_wall_time(boot_id, boottime, boot_clocks):
+    """ Works out when something that happened at a point of a boot did.
+
+        :param boot_id: The ID of the boot.
+        :type boot_id: str
+        :param boottime: The CLOCK_BOOTTIME when it happened.
+        :type boottime: number
+        :param boot_clocks: The offsets of the previous boots, as given by
+            load_boot_clocks().
+        :type boot_clocks: dict
+
+        :returns: The wall time or None if the boot is unknown.
+        :rtype: float
+    """
+
+    if boot_id and boot_id == get_boot_id():
+        return get_boot_clock_offset() + boottime
+
+    if boot_id in boot_clocks:
+        return boot_clocks[boot_id] + boottime
+
+    return None
@@ -0,0 +1,136 @@
+#
+# event_buffer.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Per-process buffer of the tracking events
+#
+# Storing an event means a round trip to the tracker daemon or taking the
+# lock of the event log, which adds up for the apps tracking an event every
+# few seconds. The events are kept in a buffer instead and stored together
+# when there are enough of them, shortly after the first one came in, and
+# when the process exits.
+#
+
+
+import os
+import atexit
+import threading
+
+from kano.logging import logger
+from kano_profile.tracker.event_log import append_events
+from kano_profile.tracker.tracker_client import send_events
+
+
+FLUSH_EVENTS = 50
+FLUSH_DELAY = 5
+
+
+def _store_events(events):
+    if send_events(events):
+        return True
+
+    return append_events(events)
+
+
+class EventBuffer(object):
+    """ Collects the events and stores them in batches.
+
+    :param max_events: Store the events once there are that many of them
+    :type max_events: int
+    :param max_delay: Store the events at most that many seconds after the
+                      first one was added
+    :type max_delay: number
+    """
+
+    def __init__(self, max_events=FLUSH_EVENTS, max_delay=FLUSH_DELAY):
+        self.max_events = max_events
+        self.max_delay = max_delay
+
+        self._events = []
+        self._lock = threading.RLock()
+        self._timer = None
+        self._pid = os.getpid()
+        self._hooked = False
+
+    def add(self, event):
+        """ Adds an event to the buffer, storing the buffer if it's full.
+
+        :param event: The event to store
+        :type event: dict
+        """
+        with self._lock:
+            self._check_fork()
+            self._hook_exit()
+
+            self._events.append(event)
+
+            if len(self._events) >= self.max_events:
+                self.flush()
+            elif self._timer is None:
+                self._timer = threading.Timer(self.max_delay, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        """ Stores the events in the buffer.
+
+        :returns: Whether all the events were stored. If not, they are kept
+                  for the next attempt.
+        :rtype: bool
+        """
+        with self._lock:
+            self._check_fork()
+
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+            if not self._events:
+                return True
+
+            if not _store_events(self._events):
+                logger.error("Couldn't store {} tracking events".format(
+                    len(self._events)
+                ))
+                return False
+
+            self._events = []
+            return True
+
+    def _check_fork(self):
+        # The events inherited from the parent are the parent's to store
+        if self._pid != os.getpid():
+            self._pid = os.getpid()
+            self._events = []
+            self._timer = None
+
+    def _hook_exit(self):
+        if self._hooked:
+            return
+
+        self._hooked = True
+        atexit.register(self.flush)
+
+
+_buffer = EventBuffer()
+
+
+def buffer_event(event):
+    """ Stores a tracking event, in a batch with the other events of the
+    process.
+
+    :param event: The event to store
+    :type event: dict
+    """
+    _buffer.add(event)
+
+
+def flush_tracking_events():
+    """ Stores the tracking events of the process buffered so far.
+
+    :returns: Whether all the events were stored
+    :rtype: bool
+    """
+    return _buffer.flush()
@@ -0,0 +1,644 @@
+#
+# event_log.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Compact, append-only storage of the tracking events
+#
+# The events used to be stored as one JSON object per line, each repeating
+# the fields that only change between boots (token, os version, ...). Now
+# those fields are stored once in a header record and each event record only
+# refers to its header by a short key.
+#
+# The log is split in numbered segment files, a new one is started when the
+# current one grows over SEGMENT_SIZE and the oldest ones are dropped when
+# there are more than MAX_SEGMENTS. Each segment starts with SEGMENT_MAGIC
+# followed by records:
+#
+#     <length of the payload: 4 bytes, big endian><kind: 1 byte><payload>
+#
+# The payload of both kinds of records is the 8 byte key of the header and a
+# compact JSON object. A header record always precedes the first event
+# referring to it in the same segment.
+#
+# All the writes are done holding a lock on the `.lock` file of the log.
+# Segments are only ever appended to or replaced with a rename, so they can
+# be read without taking the lock. A record torn by a power cut at the end of
+# a segment is cut off before appending to it, or it would hide the records
+# after it.
+#
+# A position in the log is given by a cursor, a (segment number, offset,
+# inode) tuple pointing just after an event. Segment 0 stands for the file
+# of events stored in the format used before. The inode tells whether the
+# segment has been rewritten since the cursor was taken, in which case the
+# offset no longer means anything.
+#
+
+
+import os
+import re
+import json
+import struct
+import hashlib
+import tempfile
+
+from kano.logging import logger
+from kano.utils.file_operations import ensure_dir, chown_path
+from kano_profile.paths import tracker_event_log_dir, tracker_events_file
+from kano_profile.tracker.tracking_utils import open_locked
+
+
+HEADER_FIELDS = (
+    'token',
+    'os_version',
+    'cpu_id',
+    'language',
+    'timezone_offset',
+    'boot_id'
+)
+
+SEGMENT_MAGIC = 'KTEL\x01'
+SEGMENT_SIZE = 128 * 1024
+MAX_SEGMENTS = 16
+
+HEADER_RECORD = 'H'
+EVENT_RECORD = 'E'
+
+# What to do with the events of a header when rewriting the log
+KEEP = 'keep'
+DROP = 'drop'
+TRANSFORM = 'transform'
+
+KEY_SIZE = 8
+
+LEGACY_SEGMENT = 0
+
+# Number of events moved from the old format at a time
+MIGRATION_CHUNK = 1000
+
+_RECORD = struct.Struct('>Ic')
+_SEGMENT_RE = re.compile(r'^(\d{8})\.log$')
+_LOCK_FILE = '.lock'
+_JSON_SEPARATORS = (',', ':')
+
+# The header keys written by this process to each segment, so they don't
+# need to be repeated. Keyed by the path to the segment, each entry holds the
+# inode and the size of the segment after the last write, which tell whether
+# the segment has been replaced since.
+_written_headers = {}
+
+
+def _split_event(event):
+    header = dict(
+        (field, event[field]) for field in HEADER_FIELDS if field in event
+    )
+    body = dict(
+        (field, value) for field, value in event.iteritems()
+        if field not in header
+    )
+
+    return header, body
+
+
+def _dumps(data):
+    return json.dumps(data, separators=_JSON_SEPARATORS, sort_keys=True)
+
+
+def _header_key(header_json):
+    return hashlib.md5(header_json).hexdigest()[:KEY_SIZE]
+
+
+def _pack_record(kind, key, data_json):
+    payload = key + data_json
+    return _RECORD.pack(len(payload), kind) + payload
+
+
+class _SegmentEncoder(object):
+    """ Encodes events for a segment, adding the header records which aren't
+    in the segment yet.
+    """
+
+    def __init__(self, known_keys=None):
+        self.known_keys = known_keys if known_keys is not None else set()
+        self._headers = {}
+
+    def encode_header(self, key, header_json):
+        if key in self.known_keys:
+            return ''
+
+        self.known_keys.add(key)
+        return _pack_record(HEADER_RECORD, key, header_json)
+
+    def encode(self, event):
+        header, body = _split_event(event)
+        header_json = _dumps(header)
+
+        key = self._headers.get(header_json)
+        if key is None:
+            key = self._headers[header_json] = _header_key(header_json)
+
+        return self.encode_header(key, header_json) + \
+            _pack_record(EVENT_RECORD, key, _dumps(body))
+
+
+def iter_segment_records(segment_f):
+    """ Reads the records of a segment one at a time.
+
+    A record which hasn't been written completely (e.g. the power went while
+    writing it) ends the segment.
+
+    :param segment_f: The segment, opened for reading in binary mode
+    :type segment_f: file
+    :returns: The kind, the header key, the JSON data of the record and the
+              offset in the segment just after the record
+    :rtype: iterator of (str, str, str, int) tuples
+    """
+    if segment_f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+        logger.warn('Not a tracker event log segment: {}'.format(
+            getattr(segment_f, 'name', segment_f)))
+        return
+
+    offset = len(SEGMENT_MAGIC)
+    while True:
+        prefix = segment_f.read(_RECORD.size)
+        if len(prefix) < _RECORD.size:
+            return
+
+        length, kind = _RECORD.unpack(prefix)
+        payload = segment_f.read(length)
+        if len(payload) < length or length < KEY_SIZE:
+            return
+
+        offset += _RECORD.size + length
+        yield kind, payload[:KEY_SIZE], payload[KEY_SIZE:], offset
+
+
+def _scan_segment(segment_f):
+    """ Finds where the complete records of a segment end.
+
+    :returns: The offset just after the last complete record and the keys of
+              the headers in the segment, or None if it isn't a segment
+    :rtype: int, set
+    """
+    segment_f.seek(0)
+    if segment_f.read(len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+        return None, set()
+
+    segment_f.seek(0)
+    end = len(SEGMENT_MAGIC)
+    keys = set()
+    for kind, key, data, offset in iter_segment_records(segment_f):
+        end = offset
+
+        if kind == HEADER_RECORD:
+            try:
+                json.loads(data)
+            except ValueError:
+                continue
+
+            keys.add(key)
+
+    return end, keys
+
+
+def _repair_segment(segment_f):
+    """ Cuts off a record torn at the end of a segment. Must be called
+    holding the lock.
+
+    :returns: The keys of the headers in the segment
+    :rtype: set
+    """
+    size = os.fstat(segment_f.fileno()).st_size
+    end, keys = _scan_segment(segment_f)
+
+    if end is None:
+        logger.warn('Restarting the corrupted tracker event log segment {}'
+                    .format(segment_f.name))
+        segment_f.seek(0)
+        segment_f.truncate()
+        segment_f.write(SEGMENT_MAGIC)
+    elif end < size:
+        logger.warn('Dropping a torn record at the end of {}'.format(
+            segment_f.name))
+        segment_f.truncate(end)
+
+    return keys
+
+
+def list_segments(log_dir=tracker_event_log_dir):
+    """ Returns the paths to the segments of the log, oldest first """
+    try:
+        names = os.listdir(log_dir)
+    except OSError:
+        return []
+
+    return [
+        os.path.join(log_dir, name)
+        for name in sorted(names) if _SEGMENT_RE.match(name)
+    ]
+
+
+def _segment_number(segment_path):
+    return int(_SEGMENT_RE.match(os.path.basename(segment_path)).group(1))
+
+
+def _iter_legacy_events(events_file=tracker_events_file):
+    """ Reads the events stored in the JSON lines format used before, along
+    with the offset just after each of them.
+    """
+    try:
+        events_f = open(events_file, 'r')
+    except IOError:
+        return
+
+    offset = 0
+    inode = os.fstat(events_f.fileno()).st_ino
+    with events_f:
+        while True:
+            line = events_f.readline()
+            if not line:
+                return
+
+            offset += len(line)
+
+            try:
+                event = json.loads(line)
+            except ValueError:
+                logger.warn('Found a corrupted event, skipping.')
+                continue
+
+            if isinstance(event, dict):
+                yield inode, offset, event
+
+
+def _iter_segment_events(segment_path):
+    try:
+        segment_f = open(segment_path, 'rb')
+    except IOError:
+        # Dropped since it was listed
+        return
+
+    headers = {}
+    inode = os.fstat(segment_f.fileno()).st_ino
+    with segment_f:
+        for kind, key, data, offset in iter_segment_records(segment_f):
+            try:
+                data = json.loads(data)
+            except ValueError:
+                logger.warn('Found a corrupted event, skipping.')
+                continue
+
+            if kind == HEADER_RECORD:
+                headers[key] = data
+            elif kind == EVENT_RECORD and key in headers:
+                event = dict(headers[key])
+                event.update(data)
+                yield inode, offset, event
+
+
+def iter_headers(log_dir=tracker_event_log_dir):
+    """ Streams the headers of the events in the log, without decoding the
+    events themselves. A header can come up once in each segment.
+
+    :returns: The fields of the events which only change between boots
+    :rtype: iterator of dicts
+    """
+    for segment_path in list_segments(log_dir):
+        try:
+            segment_f = open(segment_path, 'rb')
+        except IOError:
+            # Dropped since it was listed
+            continue
+
+        with segment_f:
+            for kind, dummy_key, data, dummy_offset in \
+                    iter_segment_records(segment_f):
+                if kind != HEADER_RECORD:
+                    continue
+
+                try:
+                    yield json.loads(data)
+                except ValueError:
+                    continue
+
+
+def iter_events_with_cursor(log_dir=tracker_event_log_dir,
+                            legacy_events_file=tracker_events_file):
+    """ Streams all the events in the log along with the cursor pointing
+    just after each of them.
+
+    :returns: The cursors and the events
+    :rtype: iterator of (tuple, dict) tuples
+    """
+    for inode, offset, event in _iter_legacy_events(legacy_events_file):
+        yield (LEGACY_SEGMENT, offset, inode), event
+
+    for segment_path in list_segments(log_dir):
+        number = _segment_number(segment_path)
+        for inode, offset, event in _iter_segment_events(segment_path):
+            yield (number, offset, inode), event
+
+
+def iter_events(log_dir=tracker_event_log_dir,
+                legacy_events_file=tracker_events_file):
+    """ Streams all the events in the log, oldest first, without loading
+    the whole log in memory.
+
+    The events still stored in the old format are read first.
+
+    :returns: The events
+    :rtype: iterator of dicts
+    """
+    for dummy_cursor, event in iter_events_with_cursor(log_dir,
+                                                       legacy_events_file):
+        yield event
+
+
+def _chown(path):
+    if 'SUDO_USER' in os.environ:
+        chown_path(path)
+
+
+def _new_segment_path(log_dir, segments):
+    if segments:
+        number = _segment_number(segments[-1]) + 1
+    else:
+        number = 1
+
+    return os.path.join(log_dir, '{:08d}.log'.format(number))
+
+
+def _create_segment(path):
+    with open(path, 'wb') as segment_f:
+        segment_f.write(SEGMENT_MAGIC)
+    _chown(path)
+
+
+def _get_active_segment(log_dir):
+    """ Returns the segment to append to, starting a new one if needed and
+    dropping the oldest ones. Must be called holding the lock.
+    """
+    segments = list_segments(log_dir)
+
+    if segments and os.path.getsize(segments[-1]) < SEGMENT_SIZE:
+        return segments[-1]
+
+    path = _new_segment_path(log_dir, segments)
+    _create_segment(path)
+    segments.append(path)
+
+    for old_segment in segments[:-MAX_SEGMENTS]:
+        logger.warn('Tracker event log full, dropping {}'.format(old_segment))
+        os.remove(old_segment)
+        _written_headers.pop(old_segment, None)
+
+    return path
+
+
+def _lock(log_dir):
+    ensure_dir(log_dir)
+    lock_path = os.path.join(log_dir, _LOCK_FILE)
+    lock_f = open_locked(lock_path, 'a')
+    _chown(lock_path)
+
+    return lock_f
+
+
+def append_events(events, log_dir=tracker_event_log_dir):
+    """ Stores events at the end of the log.
+
+    :param events: The events to store
+    :type events: list of dicts
+    :returns: Whether the events were stored
+    :rtype: bool
+    """
+    if not events:
+        return True
+
+    try:
+        lock_f = _lock(log_dir)
+    except (IOError, OSError) as exc:
+        logger.error('Error opening the tracker event log {}'.format(exc))
+        return False
+
+    with lock_f:
+        try:
+            segment_path = _get_active_segment(log_dir)
+
+            with open(segment_path, 'r+b') as segment_f:
+                # Unless this process wrote the end of the segment, make sure
+                # it doesn't end with a torn record
+                st = os.fstat(segment_f.fileno())
+                known = _written_headers.get(segment_path)
+                if known and known[0] == st.st_ino and known[1] == st.st_size:
+                    known_keys = known[2]
+                else:
+                    known_keys = _repair_segment(segment_f)
+
+                segment_f.seek(0, os.SEEK_END)
+                encoder = _SegmentEncoder(known_keys)
+                segment_f.write(''.join(
+                    encoder.encode(event) for event in events
+                ))
+                segment_f.flush()
+
+                _written_headers[segment_path] = (
+                    st.st_ino, segment_f.tell(), encoder.known_keys
+                )
+        except (IOError, OSError) as exc:
+            logger.error('Error writing the tracker event log {}'.format(exc))
+            return False
+
+    return True
+
+
+def _get_offset_limit(path, number, until):
+    """ Returns the offset of the file up to which the events are before the
+    cursor, or None if they all are.
+    """
+    if until is None or number < until[0]:
+        return None
+
+    try:
+        inode = os.stat(path).st_ino
+    except OSError:
+        return 0
+
+    if inode != until[2]:
+        # Rewritten since the cursor was taken, keep all its events
+        return 0
+
+    return until[1]
+
+
+def _rewrite_segment(segment_path, select, transform, until=None):
+    """ Rewrites a segment, leaving it untouched if nothing changed.
+    Must be called holding the lock.
+
+    The events after the offset `until` are kept as they are.
+    """
+    encoder = _SegmentEncoder()
+    headers = {}
+    changed = False
+
+    with open(segment_path, 'rb') as segment_f:
+        fd, tmp_path = tempfile.mkstemp(
+            prefix='.', suffix='.tmp', dir=os.path.dirname(segment_path)
+        )
+        tmp_f = os.fdopen(fd, 'wb')
+
+        try:
+            tmp_f.write(SEGMENT_MAGIC)
+
+            for kind, key, data, offset in iter_segment_records(segment_f):
+                if kind == HEADER_RECORD:
+                    try:
+                        header = json.loads(data)
+                    except ValueError:
+                        changed = True
+                        continue
+
+                    headers[key] = (select(header), header, data)
+                    continue
+
+                if key not in headers:
+                    changed = True
+                    continue
+
+                action, header, header_json = headers[key]
+                if until is not None and offset > until:
+                    action = KEEP
+
+                if action == DROP:
+                    changed = True
+                    continue
+
+                if action == KEEP:
+                    tmp_f.write(encoder.encode_header(key, header_json))
+                    tmp_f.write(_pack_record(EVENT_RECORD, key, data))
+                    continue
+
+                changed = True
+                try:
+                    event = dict(header)
+                    event.update(json.loads(data))
+                except ValueError:
+                    continue
+
+                event = transform(event)
+                if event is not None:
+                    tmp_f.write(encoder.encode(event))
+
+            has_events = tmp_f.tell() > len(SEGMENT_MAGIC)
+            tmp_f.close()
+
+            if not changed:
+                os.remove(tmp_path)
+            elif has_events:
+                os.rename(tmp_path, segment_path)
+                _chown(segment_path)
+            else:
+                os.remove(tmp_path)
+                os.remove(segment_path)
+        except Exception:
+            tmp_f.close()
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    if changed:
+        _written_headers.pop(segment_path, None)
+
+
+def rewrite_events(select, transform=None, until=None,
+                   log_dir=tracker_event_log_dir,
+                   legacy_events_file=tracker_events_file):
+    """ Filters or changes the events in the log.
+
+    The decision is first made per header, i.e. for all the events of a boot
+    at once, so the events which are kept or dropped as a whole don't even
+    need to be decoded.
+
+    The events still stored in the old format are moved into the log.
+
+    :param select: Called with each header, returns KEEP or DROP to keep or
+                   drop all its events or TRANSFORM to pass each of them
+                   through `transform`
+    :type select: function(dict)
+    :param transform: (Optional) Returns the event to store in place of the
+                      one given, or None to drop it
+    :type transform: function(dict)
+    :param until: (Optional) A cursor. Only the events up to it are passed
+                  to `select`, the rest are kept. The segments after it are
+                  not even read.
+    :type until: tuple
+    :returns: Whether the log could be rewritten
+    :rtype: bool
+    """
+    try:
+        lock_f = _lock(log_dir)
+    except (IOError, OSError) as exc:
+        logger.error('Error opening the tracker event log {}'.format(exc))
+        return False
+
+    with lock_f:
+        try:
+            for segment_path in list_segments(log_dir):
+                number = _segment_number(segment_path)
+                if until is not None and number > until[0]:
+                    break
+
+                _rewrite_segment(
+                    segment_path, select, transform,
+                    _get_offset_limit(segment_path, number, until)
+                )
+
+            if os.path.exists(legacy_events_file):
+                _migrate_legacy_events(
+                    select, transform, log_dir, legacy_events_file,
+                    _get_offset_limit(legacy_events_file, LEGACY_SEGMENT,
+                                      until)
+                )
+        except (IOError, OSError) as exc:
+            logger.error('Error rewriting the tracker event log {}'.format(exc))
+            return False
+
+    return True
+
+
+def _migrate_legacy_events(select, transform, log_dir, legacy_events_file,
+                           until=None):
+    events = []
+    for dummy_inode, offset, event in _iter_legacy_events(legacy_events_file):
+        if until is not None and offset > until:
+            action = KEEP
+        else:
+            action = select(_split_event(event)[0])
+
+        if action == TRANSFORM:
+            event = transform(event)
+        elif action == DROP:
+            event = None
+
+        if event is not None:
+            events.append(event)
+
+        if len(events) >= MIGRATION_CHUNK:
+            _append_unlocked(events, log_dir)
+            events = []
+
+    _append_unlocked(events, log_dir)
+    os.remove(legacy_events_file)
+
+
+def _append_unlocked(events, log_dir):
+    if not events:
+        return
+
+    segment_path = _get_active_segment(log_dir)
+    with open(segment_path, 'ab') as segment_f:
+        encoder = _SegmentEncoder()
+        segment_f.write(''.join(encoder.encode(event) for event in events))
+
+    _written_headers.pop(segment_path, None)
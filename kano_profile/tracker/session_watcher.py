@@ -0,0 +1,234 @@
+#
+# session_watcher.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Notifies the tracker daemon of the end of the session processes and of the
+# changes to the sessions directory
+#
+# On Linux 5.3 and newer, each process is watched through a pidfd, which
+# becomes readable when the process exits. Older kernels fall back to
+# checking /proc for the watched processes every second, which is still much
+# cheaper than going through all the session files. The directory is watched
+# with inotify, when available. Both are reached through ctypes, as Python 2
+# doesn't wrap them.
+#
+
+
+import os
+import errno
+import ctypes
+import ctypes.util
+
+from kano.logging import logger
+
+
+POLL_INTERVAL = 1
+
+# The number is shared by all the architectures
+SYS_PIDFD_OPEN = 434
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 02000000
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_DELETE = 0x00000200
+
+# New files are only looked at once they've been written
+SESSIONS_DIR_EVENTS = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_DELETE
+
+_libc = None
+
+
+def _get_libc():
+    global _libc
+
+    if _libc is None:
+        _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+
+    return _libc
+
+
+def pidfd_open(pid):
+    """ Opens a file descriptor that becomes readable when the process exits.
+
+    :param pid: The process to watch
+    :type pid: int
+    :returns: The file descriptor
+    :rtype: int
+    :raises OSError: ENOSYS if the kernel doesn't support it, ESRCH if the
+                     process doesn't exist
+    """
+    fd = _get_libc().syscall(SYS_PIDFD_OPEN, ctypes.c_int(pid), 0)
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    return fd
+
+
+def inotify_watch(path, mask):
+    """ Watches a directory for changes.
+
+    :returns: The inotify file descriptor, to be read when it's readable
+    :rtype: int
+    :raises OSError: If the watch can't be set up
+    """
+    libc = _get_libc()
+
+    fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+    if fd < 0:
+        err = ctypes.get_errno()
+        raise OSError(err, os.strerror(err))
+
+    if libc.inotify_add_watch(fd, path, ctypes.c_uint32(mask)) < 0:
+        err = ctypes.get_errno()
+        os.close(fd)
+        raise OSError(err, os.strerror(err))
+
+    return fd
+
+
+def _is_pid_running(pid):
+    return os.path.exists('/proc/{}'.format(pid))
+
+
+class SessionWatcher(object):
+    """ Watches the processes of the sessions and the sessions directory.
+
+    The owner selects on fds() for at most timeout() seconds and passes the
+    readable ones to check().
+    """
+
+    def __init__(self, sessions_dir):
+        self._pidfds = {}
+        self._polled = set()
+        self._exited = set()
+        self._pidfd_supported = True
+
+        try:
+            self._inotify_fd = inotify_watch(sessions_dir, SESSIONS_DIR_EVENTS)
+        except (OSError, AttributeError) as err:
+            logger.warn(
+                "Can't watch the sessions directory: {}".format(err)
+            )
+            self._inotify_fd = None
+
+    def watch_pid(self, pid):
+        """ Starts watching a process, unless it's watched already. """
+        if pid in self._pidfds or pid in self._polled or pid in self._exited:
+            return
+
+        if self._pidfd_supported:
+            try:
+                self._pidfds[pid] = pidfd_open(pid)
+                return
+            except OSError as err:
+                if err.errno == errno.ESRCH:
+                    self._exited.add(pid)
+                    return
+
+                logger.warn(
+                    "pidfd is not available ({}), polling the sessions"
+                    .format(err)
+                )
+                self._pidfd_supported = False
+            except AttributeError:
+                self._pidfd_supported = False
+
+        if _is_pid_running(pid):
+            self._polled.add(pid)
+        else:
+            self._exited.add(pid)
+
+    def unwatch_pid(self, pid):
+        """ Stops watching a process. """
+        fd = self._pidfds.pop(pid, None)
+        if fd is not None:
+            os.close(fd)
+
+        self._polled.discard(pid)
+        self._exited.discard(pid)
+
+    def fds(self):
+        """ The file descriptors to select on for reading """
+        fds = self._pidfds.values()
+        if self._inotify_fd is not None:
+            fds.append(self._inotify_fd)
+
+        return fds
+
+    def timeout(self):
+        """ How long to wait for the file descriptors at most
+
+        :returns: The timeout in seconds, or None to wait for as long as the
+                  owner wants
+        """
+        if self._exited:
+            return 0
+
+        if self._polled:
+            return POLL_INTERVAL
+
+        return None
+
+    def check(self, readable):
+        """ Collects the events that happened.
+
+        :param readable: The file descriptors that became readable
+        :type readable: list of int
+        :returns: The processes that exited since the last check and whether
+                  the sessions directory changed. The processes that exited
+                  aren't watched anymore.
+        :rtype: set of int, bool
+        """
+        changed = False
+        if self._inotify_fd is not None and self._inotify_fd in readable:
+            changed = self._drain_inotify()
+
+        for pid, fd in self._pidfds.items():
+            if fd in readable:
+                self._exited.add(pid)
+
+        for pid in list(self._polled):
+            if not _is_pid_running(pid):
+                self._exited.add(pid)
+
+        exited = self._exited
+        self._exited = set()
+
+        for pid in exited:
+            self.unwatch_pid(pid)
+
+        return exited, changed
+
+    def close(self):
+        for pid in self._pidfds.keys():
+            self.unwatch_pid(pid)
+
+        if self._inotify_fd is not None:
+            os.close(self._inotify_fd)
+            self._inotify_fd = None
+
+    def _drain_inotify(self):
+        changed = False
+
+        while True:
+            try:
+                data = os.read(self._inotify_fd, 4096)
+            except OSError as err:
+                if err.errno in (errno.EAGAIN, errno.EINTR):
+                    break
+                raise
+
+            if not data:
+                break
+
+            # Only the fact that something changed matters, the daemon
+            # compares the files against what it knows
+            changed = True
+
+        return changed
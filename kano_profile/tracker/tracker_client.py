@@ -0,0 +1,113 @@
+#
+# tracker_client.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Talks to the tracker daemon
+#
+# The messages are JSON objects with a `cmd` key, sent one per connection
+# over the Unix socket of the daemon, which answers with another JSON object.
+# When the daemon isn't running, the functions here return None and the
+# callers carry on with the session files and the event log themselves.
+#
+
+
+import os
+import json
+import socket
+import threading
+
+from kano.logging import logger
+from kano_profile.paths import tracker_socket_file
+
+
+CLIENT_TIMEOUT = 2
+MAX_MESSAGE_SIZE = 4 * 1024 * 1024
+
+# The thread serving the daemon, which must never wait for itself
+daemon_thread = None
+
+
+def read_message(sock):
+    """ Reads a newline terminated JSON message from a socket.
+
+    :returns: The message, or None if it is incomplete or invalid
+    """
+    chunks = []
+    size = 0
+
+    while True:
+        chunk = sock.recv(65536)
+        if not chunk:
+            break
+
+        chunks.append(chunk)
+        size += len(chunk)
+
+        if chunk.endswith('\n') or size > MAX_MESSAGE_SIZE:
+            break
+
+    data = ''.join(chunks)
+    if not data.endswith('\n'):
+        return None
+
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def send_message(message, socket_path=tracker_socket_file):
+    """ Sends a message to the tracker daemon and waits for the reply.
+
+    :param message: The message, with the `cmd` to run
+    :type message: dict
+    :param socket_path: (Optional) The socket of the daemon
+    :type socket_path: str
+    :returns: The reply of the daemon or None if it isn't running
+    :rtype: dict or NoneType
+    """
+    if daemon_thread is threading.current_thread():
+        return None
+
+    if not os.path.exists(socket_path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CLIENT_TIMEOUT)
+
+    try:
+        sock.connect(socket_path)
+        sock.sendall(json.dumps(message) + '\n')
+        reply = read_message(sock)
+    except socket.error as err:
+        logger.debug("The tracker daemon is unavailable: {}".format(err))
+        return None
+    finally:
+        sock.close()
+
+    if isinstance(reply, dict) and reply.get('released'):
+        logger.debug("The tracker daemon left the sessions to the files")
+        return None
+
+    if not isinstance(reply, dict) or 'error' in reply:
+        logger.warn(
+            "The tracker daemon rejected '{}': {}".format(
+                message.get('cmd'), reply
+            )
+        )
+        return None
+
+    return reply
+
+
+def send_events(events):
+    """ Hands tracking events over to the daemon to be stored.
+
+    :param events: The events to store
+    :type events: list of dict
+    :returns: Whether the daemon took the events
+    :rtype: bool
+    """
+    return send_message({'cmd': 'events', 'events': events}) is not None
@@ -0,0 +1,509 @@
+#
+# tracker_daemon.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# The tracker daemon, keeping the tracking sessions in memory
+#
+# Without the daemon, each session is a file in the sessions directory which
+# the refresh loop of kano-tracker-ctl locks, parses and rewrites every few
+# minutes only to update how long it's been running for. The daemon keeps
+# the sessions in a table instead, and receives the starts and ends of the
+# sessions and the tracking events from the clients over a Unix socket (see
+# tracker_client). The table is written back to the session files every now
+# and then and when the daemon stops, so the sessions outlive it.
+#
+# The session files remain the source of truth: files created or changed
+# behind the back of the daemon, e.g. by clients that couldn't reach it, are
+# picked up on the next refresh.
+#
+
+
+import os
+import json
+import time
+import errno
+import select
+import socket
+import threading
+
+from kano.logging import logger
+from kano.utils.file_operations import ensure_dir
+from kano_profile.paths import tracker_dir, tracker_socket_file
+from kano_profile.tracker import tracker_client
+from kano_profile.tracker.event_log import append_events
+from kano_profile.tracker.session_watcher import SessionWatcher
+from kano_profile.tracker.tracking_session import TrackingSession
+from kano_profile.tracker.tracking_sessions import get_session_event, \
+    get_session_elapsed
+from kano_profile.tracker.boot_clock import note_boot_clock
+from kano_profile.tracker.tracking_utils import open_locked, get_running_pids
+
+
+CHECKPOINT_INTERVAL = 10 * 60
+FLUSH_DELAY = 1
+FLUSH_EVENTS = 100
+INVALID_FILE_GRACE = 60
+
+# The commands left to the session files after a release
+SESSION_COMMANDS = ['start', 'end', 'get', 'sessions']
+
+
+def _monotonic():
+    # The elapsed real time, unaffected by changes of the system time
+    return os.times()[4]
+
+
+def _get_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+
+    return st.st_mtime, st.st_size, st.st_ino
+
+
+def _read_session(path):
+    """ Reads a session file.
+
+    :returns: The session, an empty dict if the file isn't valid JSON or None
+              if it can't be read
+    """
+    try:
+        with open_locked(path, 'r') as session_f:
+            return json.load(session_f)
+    except ValueError:
+        return {}
+    except IOError as err:
+        logger.warn("Can't read the session file {}: {}".format(path, err))
+        return None
+
+
+class TrackerDaemon(object):
+    """ Serves the tracking sessions and events of the clients.
+
+    The daemon is driven by the caller, which is expected to alternate
+    between refresh() and serve() for as long as it runs:
+
+        daemon = TrackerDaemon()
+        if daemon.start():
+            try:
+                while True:
+                    daemon.refresh()
+                    daemon.serve(120)
+            finally:
+                daemon.stop()
+    """
+
+    def __init__(self, socket_path=tracker_socket_file,
+                 sessions_dir=tracker_dir):
+        self.socket_path = socket_path
+        self.sessions_dir = sessions_dir
+
+        # The sessions indexed by the name of their file
+        self.sessions = {}
+
+        # The stat of the session files as last read or written
+        self._stamps = {}
+        self._dirty = set()
+        self._pending_events = []
+        self._server = None
+        self._watcher = None
+
+        # Whether the sessions were handed over to the files until the next
+        # refresh
+        self._released = False
+        self._last_checkpoint = _monotonic()
+
+        self._handlers = {
+            'ping': self._on_ping,
+            'start': self._on_start,
+            'end': self._on_end,
+            'get': self._on_get,
+            'sessions': self._on_sessions,
+            'events': self._on_events,
+            'release': self._on_release,
+        }
+
+    def start(self):
+        """ Starts listening for the clients.
+
+        :returns: False if another daemon is running already
+        :rtype: bool
+        """
+        if tracker_client.send_message({'cmd': 'ping'},
+                                       self.socket_path) is not None:
+            logger.error("The tracker daemon is running already")
+            return False
+
+        ensure_dir(os.path.dirname(self.socket_path))
+        if os.path.exists(self.socket_path):
+            # Left behind by a daemon that didn't stop cleanly
+            os.remove(self.socket_path)
+
+        self._server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._server.bind(self.socket_path)
+        self._server.listen(16)
+
+        tracker_client.daemon_thread = threading.current_thread()
+
+        ensure_dir(self.sessions_dir)
+        self._watcher = SessionWatcher(self.sessions_dir)
+        self._adopt_sessions()
+
+        return True
+
+    def stop(self):
+        """ Stops listening and writes everything held in memory to disk. """
+        if self._server:
+            self._server.close()
+            self._server = None
+
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)
+
+        tracker_client.daemon_thread = None
+
+        if self._watcher:
+            self._watcher.close()
+            self._watcher = None
+
+        self.flush_events()
+        self.checkpoint()
+
+    def serve(self, duration):
+        """ Handles the requests of the clients for a while.
+
+        :param duration: For how long to serve in seconds
+        :type duration: number
+        """
+        deadline = _monotonic() + duration
+
+        while True:
+            timeout = deadline - _monotonic()
+            if timeout <= 0:
+                break
+
+            if self._pending_events:
+                timeout = min(timeout, FLUSH_DELAY)
+
+            fds = [self._server]
+            if self._watcher:
+                fds += self._watcher.fds()
+
+                if self._watcher.timeout() is not None:
+                    timeout = min(timeout, self._watcher.timeout())
+
+            try:
+                readable, dummy_w, dummy_x = select.select(fds, [], [], timeout)
+            except select.error as err:
+                if err.args[0] == errno.EINTR:
+                    continue
+                raise
+
+            if self._watcher:
+                self._check_watcher(readable)
+
+            if not readable:
+                # Quiet for a moment, a good time to store the events
+                self.flush_events()
+                continue
+
+            if self._server in readable:
+                self._handle_connection()
+
+            if len(self._pending_events) >= FLUSH_EVENTS:
+                self.flush_events()
+
+    def refresh(self):
+        """ Updates the running sessions and stores the ended ones, the
+        daemon counterpart of `kano-tracker-ctl refresh`.
+        """
+        self._released = False
+        self._adopt_sessions()
+
+        # Keep track of the system time, in case it changed
+        note_boot_clock()
+
+        running_pids = get_running_pids()
+        done = []
+
+        for name, session in self.sessions.iteritems():
+            if session.get('finished') is True:
+                logger.debug(
+                    "Collecting a finished '{}' session".format(session['name'])
+                )
+                done.append(name)
+            elif int(session['pid']) == 0 or \
+                    int(session['pid']) in running_pids:
+                session['elapsed'] = get_session_elapsed(session)
+                self._dirty.add(name)
+            else:
+                logger.debug(
+                    "Collecting a crashed '{}' session".format(session['name'])
+                )
+                done.append(name)
+
+        self._collect(done)
+
+        if _monotonic() - self._last_checkpoint >= CHECKPOINT_INTERVAL:
+            self.checkpoint()
+
+    def flush_events(self):
+        """ Stores the events received so far in the event log.
+
+        :returns: Whether all the events were stored
+        :rtype: bool
+        """
+        if not self._pending_events:
+            return True
+
+        if not append_events(self._pending_events):
+            return False
+
+        self._pending_events = []
+        return True
+
+    def checkpoint(self):
+        """ Writes the sessions changed since the last checkpoint to their
+        files.
+        """
+        ensure_dir(self.sessions_dir)
+
+        for name in self._dirty:
+            path = os.path.join(self.sessions_dir, name)
+
+            try:
+                self._write_session(name, path)
+            except (IOError, OSError) as err:
+                logger.error(
+                    "Error writing the session file {}: {}".format(path, err)
+                )
+
+        self._dirty.clear()
+        self._last_checkpoint = _monotonic()
+
+    def _write_session(self, name, path):
+        """ Rewrites a session file in place, under the lock its other users
+        take. Renaming a new file over it would swap the file under their
+        lock, and their writes would be lost.
+        """
+        # Files the daemon already knows of aren't created again if they
+        # were removed, e.g. when the session was collected
+        mode = 'r+' if name in self._stamps else 'a'
+
+        try:
+            session_f = open_locked(path, mode)
+        except IOError as err:
+            if err.errno == errno.ENOENT:
+                return
+            raise
+
+        with session_f:
+            if name in self._stamps and \
+                    _get_stamp(path) != self._stamps[name]:
+                # Changed by someone else, to be picked up by the refresh
+                return
+
+            session_f.seek(0)
+            session_f.truncate()
+            json.dump(self.sessions[name], session_f)
+            session_f.flush()
+            os.fsync(session_f.fileno())
+
+            self._stamps[name] = _get_stamp(path)
+
+    def _collect(self, names):
+        """ Stores the events of the sessions given and forgets them. """
+        self.flush_events()
+
+        if not names or not append_events(
+                [get_session_event(self.sessions[name]) for name in names]):
+            return
+
+        for name in names:
+            self._forget(name)
+
+            path = os.path.join(self.sessions_dir, name)
+            if os.path.exists(path):
+                os.remove(path)
+
+    def _check_watcher(self, readable):
+        exited, changed = self._watcher.check(readable)
+
+        if changed and not self._released:
+            self._adopt_sessions()
+
+        if not exited:
+            return
+
+        done = []
+
+        for name, session in self.sessions.iteritems():
+            if int(session['pid']) not in exited:
+                continue
+
+            if session.get('finished') is not True:
+                logger.debug(
+                    "Collecting a crashed '{}' session".format(session['name'])
+                )
+                session['elapsed'] = get_session_elapsed(session)
+
+            done.append(name)
+
+        self._collect(done)
+
+    def _add(self, name, session):
+        self.sessions[name] = session
+
+        pid = int(session['pid'])
+        if self._watcher and pid != 0:
+            self._watcher.watch_pid(pid)
+
+    def _forget(self, name):
+        session = self.sessions.pop(name, None)
+        self._stamps.pop(name, None)
+        self._dirty.discard(name)
+
+        if not session or not self._watcher:
+            return
+
+        pid = int(session['pid'])
+        if not any(int(other['pid']) == pid
+                   for other in self.sessions.itervalues()):
+            self._watcher.unwatch_pid(pid)
+
+    def _adopt_sessions(self):
+        """ Reads the session files which are new or changed since the daemon
+        last read or wrote them, and forgets the sessions whose files were
+        removed.
+        """
+        try:
+            names = os.listdir(self.sessions_dir)
+        except OSError:
+            names = []
+
+        on_disk = set()
+        for name in names:
+            if not TrackingSession.SESSION_FILE_RE.match(name):
+                continue
+
+            on_disk.add(name)
+
+            path = os.path.join(self.sessions_dir, name)
+            stamp = _get_stamp(path)
+            if stamp is None or stamp == self._stamps.get(name):
+                continue
+
+            session = _read_session(path)
+            if session is None:
+                continue
+
+            if not isinstance(session, dict) or 'pid' not in session or \
+                    'started' not in session:
+                # Either still being written or corrupted, the refresh used
+                # to remove the latter too
+                if time.time() - stamp[0] > INVALID_FILE_GRACE:
+                    logger.warn(
+                        "Removing the invalid session file {}".format(path)
+                    )
+                    os.remove(path)
+                continue
+
+            self._add(name, session)
+            self._stamps[name] = stamp
+            self._dirty.discard(name)
+
+        for name in self._stamps.keys():
+            if name not in on_disk:
+                self._forget(name)
+
+    def _handle_connection(self):
+        try:
+            conn, dummy_addr = self._server.accept()
+        except socket.error:
+            return
+
+        conn.settimeout(tracker_client.CLIENT_TIMEOUT)
+
+        try:
+            message = tracker_client.read_message(conn)
+            conn.sendall(json.dumps(self.handle_message(message)) + '\n')
+        except socket.error as err:
+            logger.warn("Error talking to a tracker client: {}".format(err))
+        finally:
+            conn.close()
+
+    def handle_message(self, message):
+        """ Runs the command of a client.
+
+        :param message: The message received
+        :type message: dict
+        :returns: The reply to the client
+        :rtype: dict
+        """
+        if not isinstance(message, dict) or \
+                message.get('cmd') not in self._handlers:
+            return {'error': 'Invalid message'}
+
+        if self._released and message['cmd'] in SESSION_COMMANDS:
+            return {'released': True}
+
+        try:
+            return self._handlers[message['cmd']](message)
+        except (KeyError, TypeError, ValueError) as err:
+            return {'error': 'Invalid message: {}'.format(err)}
+
+    def _on_ping(self, message):
+        return {}
+
+    def _on_start(self, message):
+        session = message['session']
+        name = TrackingSession(name=session['name'], pid=session['pid']).file
+
+        self._add(name, session)
+        self._dirty.add(name)
+
+        return {'file': name}
+
+    def _on_end(self, message):
+        name = message['file']
+        session = self.sessions.get(name)
+        if not session:
+            return {'found': False}
+
+        session['elapsed'] = get_session_elapsed(session)
+        session['finished'] = True
+        self._dirty.add(name)
+
+        return {'found': True}
+
+    def _on_get(self, message):
+        return {'session': self.sessions.get(message['file'])}
+
+    def _on_sessions(self, message):
+        return {'sessions': self.sessions.values()}
+
+    def _on_events(self, message):
+        events = message['events']
+        if not isinstance(events, list):
+            raise TypeError('The events must be a list')
+
+        self._pending_events.extend(events)
+
+        return {}
+
+    def _on_release(self, message):
+        # Until the next refresh, the clients and kano-tracker-ctl work on
+        # the session files as if the daemon wasn't running
+        self.flush_events()
+        self.checkpoint()
+
+        for name in self.sessions.keys():
+            self._forget(name)
+
+        self._stamps.clear()
+        self._released = True
+
+        return {}
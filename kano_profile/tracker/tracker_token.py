@@ -8,6 +8,7 @@
 #
 
 import os
+import sys
 import time
 import hashlib
 
@@ -15,8 +16,8 @@ import hashlib
 from kano.utils.file_operations import ensure_dir, chown_path
 from kano.logging import logger
 from kano_profile.paths import tracker_dir, tracker_token_file, \
-    tracker_events_file
-from kano_profile.tracker.tracking_utils import open_locked
+    tracker_event_log_dir
+from kano_profile.tracker.tracking_utils import open_locked, LazyModule
 
 
 def load_token():
@@ -68,17 +69,35 @@ def generate_tracker_token():
         if 'SUDO_USER' in os.environ:
             chown_path(tracker_token_file)
 
-    # Make sure that the events file exist
-    try:
-        f = open(tracker_events_file, 'a')
-    except IOError as e:
-        logger.error("Error opening tracker events file {}".format(e))
-    else:
-        f.close()
-        if 'SUDO_USER' in os.environ:
-            chown_path(tracker_events_file)
+    # Make sure that the event log exists
+    ensure_dir(tracker_event_log_dir)
+    if 'SUDO_USER' in os.environ:
+        chown_path(tracker_event_log_dir)
 
     return token
 
 
-TOKEN = load_token()
+# The token of the current boot, loaded on first use
+_token = None
+
+
+def get_token():
+    """
+        Returns the token of the current boot, loading it (or generating it)
+        the first time it's needed.
+
+        :returns: The token.
+        :rtype: str
+    """
+
+    global _token
+
+    if _token is None:
+        _token = load_token()
+
+    return _token
+
+
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'TOKEN': get_token
+})
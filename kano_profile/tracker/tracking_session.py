@@ -20,11 +20,19 @@ from kano_profile.tracker.tracking_utils import is_pid_running, open_locked
 class TrackingSession(object):
     SESSION_FILE_RE = re.compile(r'^(\d+)-(.*).json$')
 
-    def __init__(self, session_file=None, name=None, pid=None):
+    # There can be thousands of them when the sessions directory is scanned
+    __slots__ = ('_file', '_pid', '_name', '_running_pids')
+
+    def __init__(self, session_file=None, name=None, pid=None,
+                 running_pids=None):
         if session_file:
             self._file = os.path.basename(session_file)
             self._pid, self._name = self.parse_session_file(self.file)
         elif name and pid:
+            # Kept encoded rather than encoded on every use
+            if isinstance(name, unicode):
+                name = name.encode('utf-8')
+
             self._name = name
             self._pid = int(pid)
             self._file = self.parse_name_and_pid(self.name, self.pid)
@@ -34,18 +42,17 @@ class TrackingSession(object):
                 'TrackingSession requires a file or a name/pid combination'
             )
 
+        # The running processes, if listed already by get_running_pids(),
+        # so that each session doesn't need to check its own
+        self._running_pids = running_pids
+
     def parse_session_file(self, session_file):
-        matches = TrackingSession.SESSION_FILE_RE.findall(session_file)
+        match = TrackingSession.SESSION_FILE_RE.match(session_file)
 
-        if not matches:
+        if not match:
             return None, None
 
-        match_data = matches[0]
-
-        pid = int(match_data[0])
-        name = match_data[1]
-
-        return pid, name
+        return int(match.group(1)), match.group(2)
 
     def parse_name_and_pid(self, name, pid):
         return "{}-{}.json".format(pid, name)
@@ -73,14 +80,18 @@ class TrackingSession(object):
 
     @property
     def name(self):
-        return self._name.encode('utf-8')
+        return self._name
 
     @property
     def pid(self):
         return self._pid or 0
 
     def is_open(self):
-        return is_pid_running(self.pid)
+        if self._running_pids is None:
+            return is_pid_running(self.pid)
+
+        # Like is_pid_running(), which signals the process group for 0
+        return self.pid == 0 or self.pid in self._running_pids
 
     def open(self, mode):
         try:
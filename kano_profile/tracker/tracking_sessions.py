@@ -9,52 +9,96 @@
 
 
 import os
+import sys
 import json
 import shutil
 import time
+from collections import OrderedDict
 from uuid import uuid1, uuid5
 
 from kano.utils.hardware import get_cpu_id
-from kano.utils.file_operations import read_file_contents, chown_path, \
-    ensure_dir
+from kano.utils.file_operations import read_file_contents, chown_path
 from kano.logging import logger
-from kano_profile.tracker.tracker_token import TOKEN
-from kano_profile.paths import tracker_dir, tracker_events_file, \
-    PAUSED_SESSIONS_FILE
+from kano_profile.tracker.tracker_token import get_token
+from kano_profile.paths import tracker_dir, PAUSED_SESSIONS_FILE
 from kano_profile.tracker.tracking_session import TrackingSession
-from kano_profile.tracker.tracking_utils import open_locked, get_utc_offset
+from kano_profile.tracker.tracking_utils import open_locked, get_utc_offset, \
+    LazyModule, list_files, get_running_pids
+from kano_profile.tracker.event_buffer import buffer_event
+from kano_profile.tracker.tracker_client import send_message
+from kano_profile.tracker.boot_clock import get_boot_id, get_boottime
 
 
-CPU_ID = str(get_cpu_id())
-LANGUAGE = (os.getenv('LANG') or '').split('.', 1)[0]
-OS_VERSION = str(read_file_contents('/etc/kanux_version'))
-os_variant = read_file_contents('/etc/kanux_version_variant')
-OS_VERSION += '-' + os_variant if os_variant else ''
+# The details of the system added to every event, looked up on first use
+_cpu_id = None
+_os_version = None
+_language = None
+
+
+def get_tracker_cpu_id():
+    global _cpu_id
+
+    if _cpu_id is None:
+        _cpu_id = str(get_cpu_id())
+
+    return _cpu_id
+
+
+def get_os_version():
+    global _os_version
+
+    if _os_version is None:
+        os_version = str(read_file_contents('/etc/kanux_version'))
+        os_variant = read_file_contents('/etc/kanux_version_variant')
+        _os_version = os_version + ('-' + os_variant if os_variant else '')
+
+    return _os_version
+
+
+def get_language():
+    global _language
+
+    if _language is None:
+        _language = (os.getenv('LANG') or '').split('.', 1)[0]
+
+    return _language
 
 
 def list_sessions():
     return [
-        f for f in os.listdir(tracker_dir)
-        if os.path.isfile(os.path.join(tracker_dir, f)) and
-        os.path.join(tracker_dir, f) != PAUSED_SESSIONS_FILE
+        f for f in list_files(tracker_dir)
+        if os.path.join(tracker_dir, f) != PAUSED_SESSIONS_FILE
     ]
 
 
-def get_open_sessions():
-    open_sessions = []
+def scan_sessions():
+    """ Reads the sessions directory in a single pass.
+
+        Whether the sessions are open is worked out from a single listing of
+        the running processes, shared by all of them.
+
+        :returns: The sessions, skipping the files which aren't sessions.
+        :rtype: list of TrackingSession
+    """
+
+    running_pids = get_running_pids()
+    sessions = []
 
     for session_file in list_sessions():
-        session = TrackingSession(session_file=session_file)
+        session = TrackingSession(
+            session_file=session_file, running_pids=running_pids
+        )
 
-        if not os.path.isfile(session.path):
+        if session.name is None:
             continue
 
-        if not session.is_open():
-            continue
+        sessions.append(session)
 
-        open_sessions.append(session)
+    return sessions
 
-    return open_sessions
+
+def get_open_sessions():
+    return [session for session in scan_sessions() if session.is_open()]
 
 
 def get_session_file_path(name, pid):
@@ -64,6 +108,14 @@ def get_session_file_path(name, pid):
 def get_session_unique_id(name, pid):
     data = {}
     tracker_session_file = get_session_file_path(name, pid)
+
+    reply = send_message({
+        'cmd': 'get',
+        'file': os.path.basename(tracker_session_file)
+    })
+    if reply and reply.get('session'):
+        return reply['session'].get('app_session_id', "")
+
     try:
         af = open_locked(tracker_session_file, 'r')
     except (IOError, OSError) as e:
@@ -102,14 +154,20 @@ def session_start(name, pid=None, ignore_pause=False):
         'pid': pid,
         'name': name,
         'started': int(time.time()),
+        'boot_id': get_boot_id(),
+        'started_boottime': get_boottime(),
         'elapsed': 0,
         'app_session_id': str(uuid5(uuid1(), name + str(pid))),
         'finished': False,
-        'token-system': TOKEN
+        'token-system': get_token()
     }
 
     path = get_session_file_path(data['name'], data['pid'])
 
+    # The daemon keeps the session in memory, no need for the file
+    if send_message({'cmd': 'start', 'session': data}) is not None:
+        return path
+
     try:
         f = open_locked(path, 'w')
     except IOError as e:
@@ -124,6 +182,13 @@ def session_start(name, pid=None, ignore_pause=False):
 
 
 def session_end(session_file):
+    reply = send_message({
+        'cmd': 'end',
+        'file': os.path.basename(session_file)
+    })
+    if reply and reply.get('found'):
+        return
+
     if not os.path.exists(session_file):
         msg = "Someone removed the tracker file, the runtime of this " \
               "app will not be logged"
@@ -138,7 +203,7 @@ def session_end(session_file):
         with rf:
             data = json.load(rf)
 
-            data['elapsed'] = int(time.time()) - data['started']
+            data['elapsed'] = get_session_elapsed(data)
             data['finished'] = True
 
             try:
@@ -153,6 +218,33 @@ def session_end(session_file):
             chown_path(session_file)
 
 
+def _load_paused_sessions(sessions_f):
+    """ Reads the paused sessions, indexed by their file so that each one is
+        only resumed once.
+    """
+
+    paused_sessions = OrderedDict()
+    for line in sessions_f:
+        if not line.strip():
+            continue
+
+        try:
+            session = TrackingSession.loads(line)
+        except (TypeError, ValueError):
+            logger.warn('Failed to process session: {}'.format(line))
+            continue
+
+        paused_sessions[session.file] = session
+
+    return paused_sessions
+
+
+def _write_paused_sessions(sessions_f, sessions):
+    sessions_f.write(''.join(
+        '{}\n'.format(session.dumps()) for session in sessions
+    ))
+
+
 def get_paused_sessions():
     if not os.path.exists(PAUSED_SESSIONS_FILE):
         return []
@@ -164,25 +256,25 @@ def get_paused_sessions():
         return []
     else:
         with sessions_f:
-            paused_sessions = []
-            for session in sessions_f:
-                if not session:
-                    continue
-
-                try:
-                    new_session = TrackingSession.loads(session)
-                except TypeError:
-                    logger.warn('Failed to process session: {}'.format(session))
-                    continue
-                paused_sessions.append(new_session)
-
-            return paused_sessions
+            return _load_paused_sessions(sessions_f).values()
 
 
 def is_tracking_paused():
     return os.path.exists(PAUSED_SESSIONS_FILE)
 
 
+def _close_paused_session(session):
+    session_end(session.path)
+
+    closed_session = TrackingSession(name=session.name, pid=999999)
+    shutil.move(
+        session.path,
+        '-{}'.format(time.time()).join(
+            os.path.splitext(closed_session.path)
+        )
+    )
+
+
 def pause_tracking_session(session):
     '''
     Close session and make a note of the session if it is open so that it can
@@ -196,19 +288,9 @@ def pause_tracking_session(session):
             logger.error('Error opening the paused sessions file: {}'.format(err))
         else:
             with sessions_f:
-                sessions_f.write(
-                    '{}\n'.format(session.dumps())
-                )
+                _write_paused_sessions(sessions_f, [session])
 
-    session_end(session.path)
-
-    closed_session = TrackingSession(name=session.name, pid=999999)
-    shutil.move(
-        session.path,
-        '-{}'.format(time.time()).join(
-            os.path.splitext(closed_session.path)
-        )
-    )
+    _close_paused_session(session)
 
 
 def unpause_tracking_session(session):
@@ -220,19 +302,23 @@ def unpause_tracking_session(session):
     if session.is_open():
         session_start(session.name, session.pid, ignore_pause=True)
 
-    paused_sessions = get_paused_sessions()
+    if not os.path.exists(PAUSED_SESSIONS_FILE):
+        return
 
     try:
-        paused_sessions_f = open_locked(PAUSED_SESSIONS_FILE, 'w')
+        paused_sessions_f = open_locked(PAUSED_SESSIONS_FILE, 'r+')
     except IOError as e:
         logger.error("Error while opening events file: {}".format(e))
     else:
         with paused_sessions_f:
-            for paused_session in paused_sessions:
-                if paused_session != session:
-                    paused_sessions_f.write(
-                        '{}\n'.format(paused_session.dumps())
-                    )
+            paused_sessions = _load_paused_sessions(paused_sessions_f)
+
+            if paused_sessions.pop(session.file, None) is not None:
+                paused_sessions_f.seek(0)
+                paused_sessions_f.truncate()
+                _write_paused_sessions(
+                    paused_sessions_f, paused_sessions.values()
+                )
 
 
 def pause_tracking_sessions():
@@ -240,22 +326,25 @@ def pause_tracking_sessions():
     Loop through all the alive sessions, pausing each one.
     '''
 
+    # Have the daemon write its sessions to their files and leave them be
+    send_message({'cmd': 'release'})
+
     open_sessions = get_open_sessions()
 
-    # Mark paused in the event of no sessions
-    if len(open_sessions) == 0:
-        try:
-            paused_sessions_f = open_locked(PAUSED_SESSIONS_FILE, 'a')
-        except IOError as err:
-            logger.error(
-                'Error while opening the paused sessions file: {}'.format(err)
-            )
-        else:
-            with paused_sessions_f:
-                pass
+    # Note all the sessions at once, which also marks the paused state in the
+    # event of no sessions
+    try:
+        paused_sessions_f = open_locked(PAUSED_SESSIONS_FILE, 'a')
+    except IOError as err:
+        logger.error(
+            'Error while opening the paused sessions file: {}'.format(err)
+        )
+    else:
+        with paused_sessions_f:
+            _write_paused_sessions(paused_sessions_f, open_sessions)
 
     for session in open_sessions:
-        pause_tracking_session(session)
+        _close_paused_session(session)
 
 
 def unpause_tracking_sessions():
@@ -264,29 +353,62 @@ def unpause_tracking_sessions():
     indicating that the system is in a paused state.
     '''
 
+    # The paused sessions are read once and dropped all together at the end
     for session in get_paused_sessions():
-        unpause_tracking_session(session)
+        if session.is_open():
+            session_start(session.name, session.pid, ignore_pause=True)
 
     if os.path.exists(PAUSED_SESSIONS_FILE):
         os.remove(PAUSED_SESSIONS_FILE)
 
 
+def get_session_elapsed(session):
+    """ Works out how long a session has been running for.
+
+        The time is measured on the clock of the boot, so changes of the
+        system time don't affect it.
+
+        :param session: The session.
+        :type session: dict
+
+        :returns: The length of the session in seconds.
+        :rtype: int
+    """
+
+    if 'started_boottime' not in session:
+        # Started by an older version of the tracker
+        return int(time.time()) - session['started']
+
+    if session.get('boot_id') != get_boot_id():
+        # The session ended with its boot, after it was last refreshed
+        return session.get('elapsed', 0)
+
+    return int(get_boottime() - session['started_boottime'])
+
+
 def get_session_event(session):
     """ Construct the event data structure for a session. """
 
-    return {
+    event = {
         'type': 'session',
         'time': session['started'],
         'timezone_offset': get_utc_offset(),
-        'os_version': OS_VERSION,
-        'cpu_id': CPU_ID,
-        'token': TOKEN,
-        'language': LANGUAGE,
+        'os_version': get_os_version(),
+        'cpu_id': get_tracker_cpu_id(),
+        'token': get_token(),
+        'language': get_language(),
         'name': session['name'],
         'length': session['elapsed'],
         'token-system': session.get('token-system', '')
     }
 
+    # The wall time is worked out from the clock of the boot when uploading
+    if 'started_boottime' in session:
+        event['boot_id'] = session.get('boot_id', '')
+        event['boottime'] = int(session['started_boottime'])
+
+    return event
+
 
 def session_log(name, started, length):
     """ Log a session that was tracked outside of the tracker.
@@ -301,19 +423,17 @@ def session_log(name, started, length):
         :param started: int
     """
 
-    try:
-        af = open_locked(tracker_events_file, 'a')
-    except IOError as e:
-        logger.error("Error while opening events file: {}".format(e))
-    else:
-        with af:
-            session = {
-                'name': name,
-                'started': int(started),
-                'elapsed': int(length)
-            }
-
-            event = get_session_event(session)
-            af.write(json.dumps(event) + "\n")
-        if 'SUDO_USER' in os.environ:
-            chown_path(tracker_events_file)
+    session = {
+        'name': name,
+        'started': int(started),
+        'elapsed': int(length)
+    }
+
+    buffer_event(get_session_event(session))
+
+
+sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+    'CPU_ID': get_tracker_cpu_id,
+    'OS_VERSION': get_os_version,
+    'LANGUAGE': get_language,
+})
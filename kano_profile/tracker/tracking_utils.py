@@ -10,6 +10,16 @@
 import os
 import fcntl
 import time
+import types
+
+try:
+    from os import scandir
+except ImportError:
+    # Only in the backport on Python 2, when it's installed
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
 
 
 class open_locked(file):
@@ -21,6 +31,39 @@ class open_locked(file):
         fcntl.flock(self, fcntl.LOCK_EX)
 
 
+class LazyModule(types.ModuleType):
+    """ Stands in for a module to compute some of its constants on first
+        use rather than when it's imported. Everything else is looked up in
+        the module itself.
+
+        It replaces the module at the end of its code:
+
+            sys.modules[__name__] = LazyModule(sys.modules[__name__], {
+                'CONSTANT': get_constant
+            })
+
+        The module keeps using the functions, only its users see constants.
+    """
+    def __init__(self, module, lazy_attrs):
+        super(LazyModule, self).__init__(module.__name__, module.__doc__)
+
+        # Also keeps the module alive, or its globals would be cleared
+        self.__dict__['_module'] = module
+        self.__dict__['_lazy_attrs'] = lazy_attrs
+
+    def __getattr__(self, name):
+        if name in self._lazy_attrs:
+            return self._lazy_attrs[name]()
+
+        return getattr(self._module, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._module, name, value)
+
+    def __dir__(self):
+        return sorted(set(dir(self._module)) | set(self._lazy_attrs))
+
+
 def is_pid_running(pid):
     '''
     Sending a signal 0 to a running process will do nothing. Sending it to a
@@ -35,6 +78,37 @@ def is_pid_running(pid):
         return True
 
 
+def get_running_pids():
+    """ Lists the running processes in a single pass over /proc, for when
+        there are many to check.
+
+        :returns: The PIDs of the processes.
+        :rtype: set of int
+    """
+
+    return set(int(entry) for entry in os.listdir('/proc') if entry.isdigit())
+
+
+def list_files(dir_path):
+    """ Lists the regular files in a directory. With scandir, the type of
+        the files comes with the listing and they don't need a stat each.
+
+        :param dir_path: The directory.
+        :type dir_path: str
+
+        :returns: The names of the files.
+        :rtype: list of str
+    """
+
+    if scandir is None:
+        return [
+            name for name in os.listdir(dir_path)
+            if os.path.isfile(os.path.join(dir_path, name))
+        ]
+
+    return [entry.name for entry in scandir(dir_path) if entry.is_file()]
+
+
 # TODO: While it isn't at the moment, this could be useful to have
 #       in the toolset.
 def get_nearest_previous_monday():
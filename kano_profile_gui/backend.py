@@ -6,14 +6,14 @@
 # License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
 #
 
-from kano_profile.badges import calculate_badges
+from kano_profile.badges import load_badges
 
 
 def filter_item_info():
     '''This is a dictionary of the names and the corresponding
     bg colour, badge description etc.
     '''
-    badge_dictionary = calculate_badges()['badges']
+    badge_dictionary = load_badges()['badges']
     badge_list = []
 
     for category, cat_dict in badge_dictionary.iteritems():
@@ -9,7 +9,7 @@
 
 import os
 from gi.repository import Gtk
-from kano_profile.badges import calculate_min_current_max_xp
+from kano_profile.badges import calculate_min_current_max_xp, load_xp
 from kano.gtk3.apply_styles import apply_styling_to_screen
 from kano_profile_gui.paths import media_dir
 
@@ -62,7 +62,7 @@ class ProgressBar(Gtk.Fixed):
     def set_progress(self):
 
         # Calculate xp_start, xp_progress, xp_end here
-        xp_start, xp_progress, xp_end = calculate_min_current_max_xp()
+        xp_start, xp_progress, xp_end = calculate_min_current_max_xp(load_xp())
 
         self.fraction = (xp_progress - xp_start + 0.0) / (xp_end - xp_start)
         progress_width = (self.total_width - self.label_width) * self.fraction
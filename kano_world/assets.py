@@ -0,0 +1,272 @@
+# assets.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU General Public License v2
+#
+# Downloads of the images shown with the profile, e.g. those of the badges
+#
+# The images rarely change, so the validators the server sent them with (the
+# ETag and Last-Modified headers) are kept in an index next to them and they
+# are only downloaded again when the server says they changed. Their hash is
+# kept too, so an image sent again as it was isn't rewritten. The downloads
+# run concurrently on a small pool of threads.
+#
+# The images which need resizing are resized once, to thumbnails named after
+# the hash of the image they come from, on the same pool as the downloads.
+#
+
+import os
+import uuid
+import hashlib
+from multiprocessing.pool import ThreadPool
+
+import requests
+
+from kano.logging import logger
+from kano.utils import read_json, ensure_dir
+from kano_profile.atomic_write import atomic_write, atomic_write_json
+
+from .config import ASSET_WORKERS
+from .connection import proxies, new_http_session
+
+
+ASSETS_INDEX = '.assets.json'
+
+# The timeouts to connect and to read
+DOWNLOAD_TIMEOUT = (5, 20)
+
+# Kept apart from the session of the API, which carries the token of the
+# user, but sharing its connections
+_http = None
+
+
+def _get_http():
+    global _http
+
+    if _http is None:
+        _http = new_http_session()
+
+    return _http
+
+
+def _fetch(url, path, entry):
+    """ Downloads an asset, unless it didn't change since it last was.
+
+    :returns: The entry of the asset in the index, or None if it couldn't be
+              downloaded
+    :rtype: dict
+    """
+    entry = entry or {}
+    exists = os.path.exists(path)
+
+    headers = {}
+    if exists and entry.get('url') == url:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+
+    try:
+        r = _get_http().get(url, headers=headers, proxies=proxies,
+                            timeout=DOWNLOAD_TIMEOUT)
+    except requests.exceptions.RequestException as e:
+        logger.error("Error downloading {}: {}".format(url, e))
+        return None
+
+    if r.status_code == 304:
+        return entry
+
+    if not r.ok:
+        logger.error("Error downloading {}: {}".format(url, r.status_code))
+        return None
+
+    content_hash = hashlib.sha1(r.content).hexdigest()
+    if not exists or entry.get('sha1') != content_hash:
+        try:
+            atomic_write(path, r.content)
+        except (IOError, OSError) as e:
+            logger.error("Error writing {}: {}".format(path, e))
+            return None
+
+    return {
+        'url': url,
+        'etag': r.headers.get('ETag'),
+        'last_modified': r.headers.get('Last-Modified'),
+        'sha1': content_hash
+    }
+
+
+def _fetch_all(fetch, names, workers):
+    # Set up before the workers share it
+    _get_http()
+
+    pool = ThreadPool(max(1, min(workers, len(names))))
+    try:
+        return pool.map(fetch, names)
+    finally:
+        pool.close()
+        pool.join()
+
+
+def _update_index(dir_path, index, names, entries, prune=False):
+    """ Saves the entries of the assets downloaded into the index.
+
+    :param prune: (Optional) Whether to remove the assets which weren't given
+    :returns: The names of the assets which couldn't be downloaded
+    :rtype: list of str
+    """
+    failed = []
+    new_index = {} if prune else dict(index)
+    for name, entry in zip(names, entries):
+        if entry is None:
+            failed.append(name)
+
+            # Kept as it was, so it can still be checked next time
+            if name in index:
+                new_index[name] = index[name]
+        else:
+            new_index[name] = entry
+
+    for name in set(index) - set(new_index):
+        try:
+            os.remove(os.path.join(dir_path, name))
+        except OSError:
+            pass
+
+    if new_index != index:
+        try:
+            atomic_write_json(os.path.join(dir_path, ASSETS_INDEX), new_index)
+        except (IOError, OSError) as e:
+            logger.error("Error writing the index of the assets: {}".format(e))
+
+    return failed
+
+
+def fetch_assets(assets, dir_path, workers=ASSET_WORKERS):
+    """ Downloads assets into a directory, skipping the unchanged ones.
+
+    :param assets: The URL of each asset, indexed by its file name
+    :type assets: dict
+    :param dir_path: The directory of the assets
+    :type dir_path: str
+    :param workers: (Optional) How many assets to download at the same time
+    :type workers: int
+    :returns: The names of the assets which couldn't be downloaded
+    :rtype: list of str
+    """
+    ensure_dir(dir_path)
+
+    index = read_json(os.path.join(dir_path, ASSETS_INDEX)) or {}
+    names = list(assets)
+
+    def fetch(name):
+        return _fetch(assets[name], os.path.join(dir_path, name),
+                      index.get(name))
+
+    entries = _fetch_all(fetch, names, workers)
+
+    return _update_index(dir_path, index, names, entries)
+
+
+def _resize_image(src_path, dest_path, width, height):
+    # FIXME: We import GdkPixbuf locally to make sure not to
+    # bugger up anything else, but we should move it up to the top.
+    from gi.repository import GdkPixbuf
+
+    pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(src_path, width, height)
+    pixbuf.savev(dest_path, 'png', [None], [None])
+
+
+def _make_thumbnail(src_path, dest_path, width, height):
+    if os.path.exists(dest_path):
+        return True
+
+    # Resized next to it first, so it never shows half written
+    tmp_path = '{}.{}.tmp'.format(dest_path, uuid.uuid4().hex)
+    try:
+        _resize_image(src_path, tmp_path, width, height)
+        os.rename(tmp_path, dest_path)
+    except Exception as e:
+        logger.error("Error resizing {}: {}".format(src_path, e))
+
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+        return False
+
+    return True
+
+
+def fetch_thumbnails(urls, dir_path, width, height, workers=ASSET_WORKERS):
+    """ Downloads images and resizes them, skipping what was already done.
+
+    The images are kept in the `originals` directory within `dir_path`, so
+    they are only downloaded again when they changed, and the thumbnails are
+    named after the hash of the image. The thumbnails and images no longer
+    asked for are removed.
+
+    :param urls: The URLs of the images
+    :type urls: list of str
+    :param dir_path: The directory of the thumbnails
+    :type dir_path: str
+    :param width: The width to fit the thumbnails in
+    :type width: int
+    :param height: The height to fit the thumbnails in
+    :type height: int
+    :param workers: (Optional) How many images to process at the same time
+    :type workers: int
+    :returns: The path of the thumbnail of each image, indexed by its URL,
+              without the images which couldn't be downloaded or resized and
+              weren't before
+    :rtype: dict
+    """
+    originals_dir = os.path.join(dir_path, 'originals')
+    ensure_dir(originals_dir)
+
+    index = read_json(os.path.join(originals_dir, ASSETS_INDEX)) or {}
+
+    # Named after their URL, as different images can share a file name
+    names = dict((hashlib.sha1(url).hexdigest(), url) for url in set(urls))
+    names_list = list(names)
+
+    def thumbnail_path(entry):
+        return os.path.join(dir_path, '{}.png'.format(entry['sha1']))
+
+    def fetch(name):
+        path = os.path.join(originals_dir, name)
+        entry = _fetch(names[name], path, index.get(name))
+        if entry is None:
+            # Keep showing the thumbnail made before, if any
+            old_entry = index.get(name)
+            if old_entry and os.path.exists(thumbnail_path(old_entry)):
+                return None, thumbnail_path(old_entry)
+
+            return None, None
+
+        thumb_path = thumbnail_path(entry)
+        if not _make_thumbnail(path, thumb_path, width, height):
+            return entry, None
+
+        return entry, thumb_path
+
+    results = _fetch_all(fetch, names_list, workers)
+
+    _update_index(originals_dir, index, names_list,
+                  [entry for entry, dummy in results], prune=True)
+
+    thumbnails = {}
+    for name, (dummy, thumb_path) in zip(names_list, results):
+        if thumb_path:
+            thumbnails[names[name]] = thumb_path
+
+    # Including those of the images before they changed
+    kept = set(thumbnails.itervalues())
+    for filename in os.listdir(dir_path):
+        path = os.path.join(dir_path, filename)
+        if os.path.isfile(path) and path not in kept:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return thumbnails
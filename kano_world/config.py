@@ -27,6 +27,31 @@ def load_conf():
     if 'world_url' not in conf:
         conf['world_url'] = 'http://world.kano.me'
 
+    # Limits of each request uploading the tracking data
+    if 'tracking_batch_events' not in conf:
+        conf['tracking_batch_events'] = 500
+
+    if 'tracking_batch_bytes' not in conf:
+        conf['tracking_batch_bytes'] = 256 * 1024
+
+    if 'tracking_gzip' not in conf:
+        conf['tracking_gzip'] = False
+
+    # How many stages of a sync can run at the same time
+    if 'sync_workers' not in conf:
+        conf['sync_workers'] = 4
+
+    # How many images can be downloaded at the same time
+    if 'asset_workers' not in conf:
+        conf['asset_workers'] = 4
+
+    # Connections kept open to each server, and retries of the failed ones
+    if 'http_pool_size' not in conf:
+        conf['http_pool_size'] = 10
+
+    if 'http_retries' not in conf:
+        conf['http_retries'] = 3
+
     return conf
 
 
@@ -34,6 +59,13 @@ CONF = load_conf()
 
 API_URL = CONF['api_url']
 WORLD_URL = CONF['world_url']
+TRACKING_BATCH_EVENTS = CONF['tracking_batch_events']
+TRACKING_BATCH_BYTES = CONF['tracking_batch_bytes']
+TRACKING_GZIP = CONF['tracking_gzip']
+SYNC_WORKERS = CONF['sync_workers']
+ASSET_WORKERS = CONF['asset_workers']
+HTTP_POOL_SIZE = CONF['http_pool_size']
+HTTP_RETRIES = CONF['http_retries']
 
 
 def get_world_url(path):
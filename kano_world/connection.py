@@ -6,17 +6,27 @@
 
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
 
 # TODO: Remove this statement after upgrading to a friendly Python-requests match
 requests.packages.urllib3.disable_warnings()
 
 from kano.logging import logger
-from kano_world.config import API_URL
+from kano_world.config import API_URL, HTTP_POOL_SIZE, HTTP_RETRIES
 from pprint import pformat
 
 
 content_type_json = {'content-type': 'application/json'}
 
+# How long to wait between the retries, in seconds, doubled after each one
+RETRY_BACKOFF = 0.5
+
+# All the HTTP sessions share the pool of connections, so the connections to
+# each server are kept alive and reused from one request to the next
+_http_adapter = None
+_http_session = None
+
 try:
     from kano_settings.system.proxy import get_requests_proxies
     proxies = get_requests_proxies()
@@ -24,6 +34,51 @@ except Exception:
     proxies = None
 
 
+def _get_http_adapter():
+    global _http_adapter
+
+    if _http_adapter is None:
+        # Only the requests which can't have reached the server are retried,
+        # a slow answer is already waited for long enough
+        retries = Retry(total=HTTP_RETRIES, read=False,
+                        backoff_factor=RETRY_BACKOFF)
+        _http_adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE,
+                                    pool_maxsize=HTTP_POOL_SIZE,
+                                    max_retries=retries)
+
+    return _http_adapter
+
+
+def new_http_session():
+    """ Creates an HTTP session sharing the pool of connections.
+
+    Sessions carrying different headers, e.g. the token of the user, can
+    reuse the same connections.
+
+    :rtype: requests.Session
+    """
+    session = requests.Session()
+
+    adapter = _get_http_adapter()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+
+    return session
+
+
+def get_http_session():
+    """ Returns the HTTP session of the requests made without a user.
+
+    :rtype: requests.Session
+    """
+    global _http_session
+
+    if _http_session is None:
+        _http_session = new_http_session()
+
+    return _http_session
+
+
 def _remove_sensitive_data(request_debug):
     if request_debug \
        and 'data' in request_debug \
@@ -50,7 +105,7 @@ def request_wrapper(method, endpoint, data=None, headers=None,
     if session:
         req_object = session
     else:
-        req_object = requests
+        req_object = get_http_session()
 
     method = getattr(req_object, method)
 
@@ -7,13 +7,16 @@
 #
 
 
+import os
 import json
 
 from kano_profile.profile import load_profile, save_profile
+from kano_profile.paths import profile_sync_hashes_file
 from kano.utils import get_user_unsudoed, is_number
 
 from .connection import request_wrapper, content_type_json
 from .session import KanoWorldSession
+from .sync_runner import SyncStage, run_stages
 
 
 glob_session = None
@@ -102,6 +105,10 @@ def remove_registration():
     profile.pop('secondary_email', None)
     save_profile(profile)
 
+    # What was synced with this account says nothing about the next one
+    if os.path.exists(profile_sync_hashes_file):
+        os.remove(profile_sync_hashes_file)
+
 
 def login_using_token():
     global glob_session
@@ -123,27 +130,28 @@ def sync():
     if not glob_session:
         return False, _("You are not logged in!")
 
-    success, value = glob_session.upload_profile_stats()
-    if not success:
-        return False, value
+    results = run_stages(get_sync_stages(glob_session))
 
-    success, value = glob_session.upload_private_data()
-    if not success:
-        return False, value
+    # Report the first failure, the stages which succeeded are kept
+    for result in results:
+        if not result.success:
+            return False, result.value
 
-    success, value = glob_session.refresh_notifications()
-    if not success:
-        return False, value
+    return True, None
 
-    success, value = glob_session.upload_tracking_data()
-    if not success:
-        return False, value
 
-    success, value = glob_session.download_online_badges()
-    if not success:
-        return False, value
+def get_sync_stages(session):
+    """ The stages of a sync, run concurrently by sync(). """
 
-    return True, None
+    return [
+        SyncStage('profile stats', session.upload_profile_stats, []),
+        SyncStage('private data', session.upload_private_data, []),
+        SyncStage('notifications', session.refresh_notifications, []),
+        SyncStage('tracking data', session.upload_tracking_data, []),
+        # The badges are awarded for the stats uploaded
+        SyncStage('online badges', session.download_online_badges,
+                  ['profile stats']),
+    ]
 
 
 def backup_content(file_path):
@@ -12,26 +12,127 @@ requests.packages.urllib3.disable_warnings()
 
 import json
 import os
+import zlib
+import hashlib
+import threading
+from multiprocessing.pool import ThreadPool
 
 from kano.logging import logger
 from kano.utils import download_url, read_json, ensure_dir, chown_path
 from kano_profile.profile import (load_profile, set_avatar, set_environment,
                                   save_profile, save_profile_variable,
                                   recreate_char)
-from kano_profile.badges import calculate_xp
-from kano_profile.apps import get_app_list, load_app_state, save_app_state
+from kano_profile.badges import load_xp
+from kano_profile.apps import get_app_list, peek_app_state, save_app_state
+from kano_profile.atomic_write import atomic_write_json, deferred_fsync
 from kano_profile.paths import app_profiles_file, online_badges_dir, \
-    online_badges_file, profile_dir
-from kano_profile.tracker import get_tracker_events, clear_tracker_events
+    online_badges_file, profile_dir, profile_sync_hashes_file
+from kano_profile.tracker import iter_tracker_events, \
+    acknowledge_tracker_events, resume_tracker_events_upload
+from kano_profile.tracker.app_stats import load_app_stats, import_app_stats
 from kano_profile_gui.paths import media_dir
 from kano_avatar.paths import (AVATAR_DEFAULT_LOC, AVATAR_DEFAULT_NAME,
                                AVATAR_ENV_DEFAULT,
                                AVATAR_CIRC_PLAIN_DEFAULT)
 
-from .connection import request_wrapper, content_type_json
+from .connection import request_wrapper, content_type_json, \
+    new_http_session
+from .assets import fetch_assets, fetch_thumbnails
+from .config import TRACKING_BATCH_EVENTS, TRACKING_BATCH_BYTES, TRACKING_GZIP
 
 app_profiles_data = read_json(app_profiles_file)
 
+# The stages of a sync run concurrently, those changing the profile take
+# turns so they don't lose each other's changes
+_profile_lock = threading.Lock()
+
+
+def _read_tracking_batch(max_events, max_bytes):
+    """ Reads the oldest tracking events still to upload.
+
+    :returns: The position of the last event read and the JSON of the events
+    :rtype: tuple, list of str
+    """
+    batch = []
+    size = 0
+    cursor = None
+
+    events = iter_tracker_events(old_only=True)
+    try:
+        for event_cursor, event in events:
+            event_json = json.dumps(event)
+            if batch and size + len(event_json) > max_bytes:
+                break
+
+            batch.append(event_json)
+            size += len(event_json)
+            cursor = event_cursor
+
+            if len(batch) >= max_events:
+                break
+    finally:
+        events.close()
+
+    return cursor, batch
+
+
+def _load_synced_app_state(app):
+    """ Returns the state of an app as it is synced with Kano World. """
+
+    state = peek_app_state(app)
+
+    if app == 'kano-tracker':
+        # The app stats are stored apart from the kano-tracker state
+        app_stats = load_app_stats()
+        if app_stats:
+            state = dict(state)
+            state['app_stats'] = app_stats
+
+    return state
+
+
+def _hash_app_state(state):
+    """ Returns a hash of the content of an app state, which doesn't
+    change when the state is saved again as it is.
+    """
+
+    content = dict(
+        (key, value) for key, value in state.iteritems() if key != 'save_date'
+    )
+    return hashlib.md5(json.dumps(content, sort_keys=True)).hexdigest()
+
+
+def _load_sync_hashes(account):
+    """ Returns the hashes of the app states as last synced with an account.
+
+    They're dropped when another account syncs, which then gets all the
+    states uploaded.
+    """
+    synced = read_json(profile_sync_hashes_file) or {}
+
+    if not account or synced.get('account') != account:
+        return {}
+
+    return synced.get('hashes') or {}
+
+
+def _save_sync_hashes(account, hashes):
+    if not account:
+        return
+
+    try:
+        atomic_write_json(profile_sync_hashes_file, {
+            'account': account,
+            'hashes': hashes
+        })
+    except (IOError, OSError) as e:
+        logger.error("Error saving the hashes of the synced apps: {}".format(e))
+
+
+def _gzip(data):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    return compressor.compress(data) + compressor.flush()
+
 
 def is_private(app_name):
     try:
@@ -42,7 +143,7 @@ def is_private(app_name):
 
 
 class KanoWorldSession(object):
-    session = requests.Session()
+    session = new_http_session()
 
     def __init__(self, token):
         self.session.headers.update({'Authorization': token})
@@ -59,7 +160,7 @@ class KanoWorldSession(object):
         data = dict()
 
         # xp
-        data['xp'] = calculate_xp()
+        data['xp'] = load_xp()
 
         # version
         try:
@@ -88,11 +189,21 @@ class KanoWorldSession(object):
 
         # avatar_generator
         data, files = self._prepare_avatar_gen(profile, data)
-        # app states
+        # app states, only those changed since they were last synced. The
+        # server merges the states sent into those it has rather than
+        # replacing them all, the download below checks it still has the rest
+        account = profile.get('kanoworld_id')
+        synced_hashes = _load_sync_hashes(account)
+        hashes = dict()
         stats = dict()
         for app in get_app_list():
-            if not is_private(app):
-                stats[app] = load_app_state(app)
+            if is_private(app):
+                continue
+
+            state = _load_synced_app_state(app)
+            hashes[app] = _hash_app_state(state)
+            if hashes[app] != synced_hashes.get(app):
+                stats[app] = state
 
         # append stats
         data['stats'] = stats
@@ -125,6 +236,8 @@ class KanoWorldSession(object):
                 logger.error("Uploading of the avatar assets failed")
                 return False, text
 
+        _save_sync_hashes(account, hashes)
+
         return self.download_profile_stats(response_data)
 
     def _prepare_avatar_gen(self, profile_data, data_to_send):
@@ -188,20 +301,7 @@ class KanoWorldSession(object):
         except Exception:
             logger.debug("Error closing avatar files")
 
-    def download_profile_stats(self, data=None):
-        if not data:
-            profile = load_profile()
-            if 'kanoworld_id' in profile:
-                user_id = profile['kanoworld_id']
-            else:
-                return False, 'Profile not registered!'
-
-            success, text, data = request_wrapper('get', '/users/' + user_id,
-                                                  headers=content_type_json,
-                                                  session=self.session)
-            if not success:
-                return False, text
-
+    def _update_avatar(self, data):
         try:
             version_no = data['user']['avatar']['generator']['version']
             save_profile_variable(
@@ -231,19 +331,64 @@ class KanoWorldSession(object):
         except Exception:
             pass
 
+        return updated_locally
+
+    def download_profile_stats(self, data=None):
+        profile = load_profile()
+
+        if not data:
+            if 'kanoworld_id' in profile:
+                user_id = profile['kanoworld_id']
+            else:
+                return False, 'Profile not registered!'
+
+            success, text, data = request_wrapper('get', '/users/' + user_id,
+                                                  headers=content_type_json,
+                                                  session=self.session)
+            if not success:
+                return False, text
+
+        with _profile_lock:
+            updated_locally = self._update_avatar(data)
+
         # app states
         try:
             app_data = data['user']['profile']['stats']
         except Exception:
             return False, "Data missing from payload!"
 
-        for app, values in app_data.iteritems():
-            if not values or type(values) != dict or \
-                    (len(values.keys()) == 1 and 'save_date' in values):
-                continue
-            if not is_private(app):
+        account = profile.get('kanoworld_id')
+        synced_hashes = _load_sync_hashes(account)
+        server_apps = set()
+
+        with deferred_fsync():
+            for app, values in app_data.iteritems():
+                if not values or type(values) != dict or \
+                        (len(values.keys()) == 1 and 'save_date' in values):
+                    continue
+                if is_private(app):
+                    continue
+
+                server_apps.add(app)
+
+                # Only write the states which differ from the local ones
+                synced_hashes[app] = _hash_app_state(values)
+                if synced_hashes[app] == \
+                        _hash_app_state(_load_synced_app_state(app)):
+                    continue
+
+                if app == 'kano-tracker' and 'app_stats' in values:
+                    values = dict(values)
+                    import_app_stats(values.pop('app_stats') or {})
+
                 save_app_state(app, values)
 
+        # The states the server doesn't have (any more) get uploaded again
+        for app in set(synced_hashes) - server_apps:
+            del synced_hashes[app]
+
+        _save_sync_hashes(account, synced_hashes)
+
         if updated_locally:
             recreate_char(block=True)
 
@@ -253,7 +398,7 @@ class KanoWorldSession(object):
         data = dict()
         for app in get_app_list():
             if is_private(app):
-                data[app] = load_app_state(app)
+                data[app] = peek_app_state(app)
 
         payload = dict()
         payload['data'] = data
@@ -280,9 +425,10 @@ class KanoWorldSession(object):
         else:
             return False, "Data missing missing from payload!"
 
-        for app, values in app_data.iteritems():
-            if is_private(app):
-                save_app_state(app, values)
+        with deferred_fsync():
+            for app, values in app_data.iteritems():
+                if is_private(app):
+                    save_app_state(app, values)
         return True, None
 
     def backup_content(self, file_path):
@@ -420,60 +566,107 @@ class KanoWorldSession(object):
             return False, text
         return True, None
 
+    def _get_notifications_page(self, page):
+        return request_wrapper(
+            'get',
+            '/notifications?read=false&page={}'.format(page),
+            session=self.session
+        )
+
     def refresh_notifications(self):
         rv = True
         error = None
 
-        next_page = 0
         notifications = []
-        while next_page is not None:
-            success, text, data = request_wrapper(
-                'get',
-                '/notifications?read=false&page={}'.format(next_page),
-                session=self.session
-            )
 
-            if not success:
-                rv = False
-                error = text
-                break
+        # The next page is requested while the current one is processed
+        pool = ThreadPool(1)
+        try:
+            next_page = pool.apply_async(self._get_notifications_page, (0,))
+            while next_page is not None:
+                success, text, data = next_page.get()
+                next_page = None
+
+                if not success:
+                    rv = False
+                    error = text
+                    break
+
+                if data.get('next') is not None:
+                    next_page = pool.apply_async(
+                        self._get_notifications_page, (data['next'],)
+                    )
+
+                for entry in data['entries']:
+                    if entry['read'] is False:
+                        n = self._process_notification(entry)
+                        if n:
+                            notifications.append(n)
+        finally:
+            pool.close()
+            pool.join()
 
-            for entry in data['entries']:
-                if entry['read'] is False:
-                    n = self._process_notification(entry)
-                    if n:
-                        notifications.append(n)
+        if rv:
+            self._add_notification_images(notifications)
 
-            try:
-                next_page = data['next']
-            except:
+            with _profile_lock:
+                profile = load_profile()
+                profile['notifications'] = notifications
+                save_profile(profile)
+
+        return rv, error
+
+    def upload_tracking_data(self, max_batch_events=TRACKING_BATCH_EVENTS,
+                             max_batch_bytes=TRACKING_BATCH_BYTES,
+                             compress=TRACKING_GZIP):
+        """ Uploads the tracking data of the previous boots in batches.
+
+        Each batch is removed from the device as soon as the server has
+        accepted it, so an interrupted upload resumes where it stopped.
+
+        :param max_batch_events: The maximum number of events per request
+        :param max_batch_bytes: The maximum size of a request, unless a
+                                single event is bigger
+        :param compress: Whether to gzip the requests
+        """
+        resume_tracker_events_upload()
+
+        uploaded = 0
+        while True:
+            cursor, batch = _read_tracking_batch(max_batch_events,
+                                                 max_batch_bytes)
+            if not batch:
                 break
 
-        if rv:
-            profile = load_profile()
-            profile['notifications'] = notifications
-            save_profile(profile)
+            data = '{"events": [' + ', '.join(batch) + ']}'
+            headers = content_type_json
+            if compress:
+                data = _gzip(data)
+                headers = dict(content_type_json)
+                headers['content-encoding'] = 'gzip'
 
-        return rv, error
+            success, text, response_data = request_wrapper(
+                'post',
+                '/tracking',
+                headers=headers,
+                session=self.session,
+                data=data
+            )
 
-    def upload_tracking_data(self):
-        data = get_tracker_events(old_only=True)
-        if len(data['events']) == 0:
-            return True, _("No data available")
+            if not success or not response_data or \
+                    not response_data.get('success'):
+                return False, _("Upload failed, tracking data not sent.")
 
-        success, text, response_data = request_wrapper(
-            'post',
-            '/tracking',
-            headers=content_type_json,
-            session=self.session,
-            data=json.dumps(data)
-        )
+            # Events stored since they were read are left for the next time
+            if not acknowledge_tracker_events(cursor):
+                return False, _("Upload failed, tracking data not sent.")
 
-        if success and 'success' in response_data and response_data['success']:
-            clear_tracker_events(old_only=True)
-            return True, None
+            uploaded += len(batch)
 
-        return False, _("Upload failed, tracking data not sent.")
+        if not uploaded:
+            return True, _("No data available")
+
+        return True, None
 
     def download_online_badges(self):
         profile = load_profile()
@@ -500,6 +693,7 @@ class KanoWorldSession(object):
             return False, _("Corrupt response (the 'user.profile.badges' key not found)")
 
         online_badges_data = {}
+        images = {}
 
         ensure_dir(online_badges_dir)
 
@@ -511,9 +705,7 @@ class KanoWorldSession(object):
             if 'image_url' not in badge:
                 return False, _("Couldn't find an image for the badge")
 
-            image_loc = os.path.join(online_badges_dir,
-                                     "{}.png".format(badge['id']))
-            download_url(badge['image_url'], image_loc)
+            images["{}.png".format(badge['id'])] = badge['image_url']
 
             online_badges_data[badge['id']] = {
                 'achieved': True,
@@ -523,16 +715,21 @@ class KanoWorldSession(object):
                 'title': badge['title']
             }
 
+        # The images which didn't change since the last sync are kept
+        fetch_assets(images, online_badges_dir)
+
+        if read_json(online_badges_file) == online_badges_data:
+            return True, None
+
         try:
             may_write = True
             txt = None
-            f = open(online_badges_file, 'w')
-        except IOError as e:
+            atomic_write_json(online_badges_file, online_badges_data,
+                              sort_keys=False)
+        except (IOError, OSError) as e:
             may_write = False
-            txt = 'Error opening badges file {}'.format(str(e))
+            txt = 'Error writing badges file {}'.format(str(e))
         else:
-            with f:
-                f.write(json.dumps(online_badges_data))
             if 'SUDO_USER' in os.environ:
                 chown_path(online_badges_dir)
                 chown_path(online_badges_file)
@@ -573,30 +770,6 @@ class KanoWorldSession(object):
                        entry['id'])
         }
 
-        # Some notifications may have images
-        # If so, we need to download them and resize
-        if 'image_url' in entry and entry['image_url']:
-            filename = os.path.basename(entry['image_url'])
-
-            img_path = "{}/notifications/{}".format(profile_dir, filename)
-            ensure_dir(os.path.dirname(img_path))
-
-            rv, e = download_url(entry['image_url'], img_path)
-            if rv:
-                # Resize image to 280x170
-                # FIXME: We import GdkPixbuf locally to make sure not to
-                # bugger up anything else, but we should move it up to the top.
-                from gi.repository import GdkPixbuf
-
-                pixbuf = GdkPixbuf.Pixbuf.new_from_file_at_size(
-                    img_path, 280, 170)
-                pixbuf.savev(img_path, 'png', [None], [None])
-
-                n['image'] = img_path
-            else:
-                msg = "Notifications image failed to download ({}).".format(e)
-                logger.error(msg)
-
         # Certain notifications may come with a command as well.
         # If so, override the default one.
         cmd = self._get_dict_value(entry, ['meta', 'cmd'])
@@ -639,8 +812,32 @@ class KanoWorldSession(object):
         else:
             return None
 
+        # The image sent is only shown when there isn't a better one
+        if n['image'] == GENERIC_ALERT_IMG and entry.get('image_url'):
+            n['image_url'] = entry['image_url']
+
         return n
 
+    def _add_notification_images(self, notifications):
+        """ Downloads and resizes the images sent with the notifications. """
+
+        urls = [n['image_url'] for n in notifications if 'image_url' in n]
+        thumbnails = fetch_thumbnails(
+            urls, os.path.join(profile_dir, 'notifications'), 280, 170
+        )
+
+        for n in notifications:
+            url = n.pop('image_url', None)
+            if url is None:
+                continue
+
+            if url in thumbnails:
+                n['image'] = thumbnails[url]
+            else:
+                logger.error(
+                    "Notifications image failed to download ({}).".format(url)
+                )
+
     def _get_dict_value(self, root, elements):
         cur_root = root
         for el in elements:
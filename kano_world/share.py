@@ -7,8 +7,9 @@
 import os
 from slugify import slugify
 
-from kano.utils import get_home, download_url, ensure_dir, read_json, write_json
+from kano.utils import get_home, download_url, ensure_dir, read_json
 from kano_profile.paths import app_profiles_file
+from kano_profile.atomic_write import atomic_write_json
 from kano.logging import logger
 from .connection import request_wrapper, content_type_json
 from .functions import get_glob_session, get_kano_world_id
@@ -199,5 +200,5 @@ def download_share(entry):
     # JSON file
     json_name = '{}.{}'.format(title_slugified, 'json')
     json_path = os.path.join(folder, json_name)
-    write_json(json_path, data)
+    atomic_write_json(json_path, data)
     return True, [title, attachment_path, app, attachment_name, folder]
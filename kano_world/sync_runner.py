@@ -0,0 +1,120 @@
+# sync_runner.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU General Public License v2
+#
+# Runs the stages of a sync with Kano World concurrently
+#
+# The stages mostly talk to different endpoints and store what they get in
+# different places, so they don't need to wait for one another. Each stage
+# starts on a small pool of threads as soon as the stages it comes after have
+# succeeded, and a failed stage only holds back the ones depending on it.
+#
+
+import time
+from collections import namedtuple
+from multiprocessing.pool import ThreadPool
+from Queue import Queue, Empty
+
+from kano.logging import logger
+
+from .config import SYNC_WORKERS
+
+
+# `run` returns a (success, value) tuple like the methods of the session,
+# `after` lists the names of the stages it needs to have succeeded first
+SyncStage = namedtuple('SyncStage', ['name', 'run', 'after'])
+
+StageResult = namedtuple('StageResult',
+                         ['name', 'success', 'value', 'duration'])
+
+
+def _run_stage(stage):
+    start = time.time()
+
+    try:
+        success, value = stage.run()
+    except Exception as e:
+        logger.error("The '{}' sync stage failed: {}".format(stage.name, e))
+        success, value = False, str(e)
+
+    return StageResult(stage.name, success, value, time.time() - start)
+
+
+def _skip_stage(stage, reason):
+    logger.warn("Skipping the '{}' sync stage: {}".format(stage.name, reason))
+    return StageResult(stage.name, False, reason, 0)
+
+
+def run_stages(stages, workers=SYNC_WORKERS):
+    """ Runs the stages, each as soon as the stages it comes after succeeded.
+
+    :param stages: The stages to run
+    :type stages: list of SyncStage
+    :param workers: (Optional) How many stages can run at the same time
+    :type workers: int
+    :returns: The outcome and duration of all the stages, in the order given
+    :rtype: list of StageResult
+    """
+    names = set(stage.name for stage in stages)
+    results = {}
+    pending = list(stages)
+    finished = Queue()
+    running = 0
+
+    pool = ThreadPool(max(1, min(workers, len(stages))))
+    try:
+        while pending or running:
+            # Skipping a stage can hold back the ones after it in turn
+            changed = True
+            while changed:
+                changed = False
+
+                for stage in pending[:]:
+                    after = [name for name in stage.after if name in names]
+                    failed = [
+                        name for name in after
+                        if name in results and not results[name].success
+                    ]
+
+                    if failed:
+                        results[stage.name] = _skip_stage(
+                            stage,
+                            _("Not synced as {} failed").format(failed[0])
+                        )
+                    elif all(name in results for name in after):
+                        pool.apply_async(_run_stage, (stage,),
+                                         callback=finished.put)
+                        running += 1
+                    else:
+                        continue
+
+                    pending.remove(stage)
+                    changed = True
+
+            if not running:
+                # Only stages waiting for one another are left
+                for stage in pending:
+                    results[stage.name] = _skip_stage(
+                        stage, _("Circular sync stages")
+                    )
+                break
+
+            # Waiting with a timeout keeps the wait interruptible
+            try:
+                result = finished.get(True, 1)
+            except Empty:
+                continue
+
+            running -= 1
+            results[result.name] = result
+
+            logger.info("Sync stage '{}' {} in {:.2f}s".format(
+                result.name, 'succeeded' if result.success else 'failed',
+                result.duration
+            ))
+    finally:
+        pool.close()
+        pool.join()
+
+    return [results[stage.name] for stage in stages]
@@ -10,4 +10,11 @@
 #
 
 
+from tests.fixtures.profile import isolate_tests_profile
+
+
+# The tests clear the stores of the profile, keep them off the user's. This
+# comes first, before the modules of the profile are imported
+isolate_tests_profile()
+
 from tests.fixtures.tracking import *
@@ -0,0 +1,67 @@
+#
+# profile.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Keeps the tests off the profile of the user running them
+#
+
+
+import os
+import atexit
+import shutil
+import tempfile
+
+import kano_profile.paths as paths
+
+
+ROOT_DIR = os.path.abspath(
+    os.path.join(os.path.dirname(__file__), '..', '..')
+)
+
+_tests_home = None
+
+
+def isolate_profile(home):
+    """ Points the profile paths at a throwaway directory.
+
+    The modules of the profile copy the paths when they're imported, so this
+    has to run before any of them is.
+    """
+    profile_dir = paths.kanoprofile_dir
+
+    for name, value in vars(paths).items():
+        if isinstance(value, basestring) and value.startswith(profile_dir):
+            setattr(paths, name, home + value[len(profile_dir):])
+
+
+def isolate_tests_profile():
+    """ Points the profile paths of the tests at a temporary directory.
+
+    The conftest can be imported more than once, the directory is only set up
+    the first time.
+
+    :returns: The directory standing for the `.kanoprofile` of the user
+    :rtype: str
+    """
+    global _tests_home
+
+    if _tests_home is None:
+        _tests_home = tempfile.mkdtemp(prefix='kanoprofile-tests-')
+        atexit.register(shutil.rmtree, _tests_home, True)
+
+        isolate_profile(_tests_home)
+        os.makedirs(paths.tracker_dir)
+
+    return _tests_home
+
+
+def isolated_script(lines):
+    """ Joins the lines of a script run by the tests, using their profile """
+    return '\n'.join([
+        'import sys',
+        'sys.path.insert(0, {!r})'.format(ROOT_DIR),
+        'from tests.fixtures.profile import isolate_profile',
+        'isolate_profile({!r})'.format(paths.kanoprofile_dir),
+    ] + lines)
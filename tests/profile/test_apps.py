@@ -0,0 +1,74 @@
+#
+# test_apps.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the app state functions:
+#     `kano_profile.apps`
+#
+
+
+import os
+import shutil
+import pytest
+
+import kano_profile.apps as apps
+
+
+TEST_APPS = ['make-snake', 'make-pong', 'make-art']
+
+
+def setup_function(function):
+    for app in TEST_APPS:
+        if os.path.exists(apps.get_app_dir(app)):
+            shutil.rmtree(apps.get_app_dir(app))
+
+
+def test_app_state_saves_once(monkeypatch):
+    apps.save_app_state('make-snake', {'level': 1})
+
+    saved = []
+    save_app_state = apps.save_app_state
+
+    def count_saves(app_name, data):
+        saved.append(app_name)
+        save_app_state(app_name, data)
+
+    monkeypatch.setattr(apps, 'save_app_state', count_saves)
+
+    with apps.app_state('make-snake') as state:
+        state['level'] = 4
+        state['total_number_of_apples'] = 10
+        state['total_number_of_apples'] += 5
+
+    assert saved == ['make-snake']
+    assert apps.load_app_state_variable('make-snake', 'level') == 4
+    assert apps.load_app_state_variable(
+        'make-snake', 'total_number_of_apples') == 15
+
+    with apps.app_state('make-snake') as state:
+        state['level'] = 4
+
+    assert saved == ['make-snake']
+
+
+def test_app_state_discarded_on_error():
+    apps.save_app_state('make-pong', {'level': 2})
+
+    with pytest.raises(ValueError):
+        with apps.app_state('make-pong') as state:
+            state['level'] = 3
+            raise ValueError()
+
+    assert apps.load_app_state_variable('make-pong', 'level') == 2
+
+
+def test_variable_helpers():
+    apps.increment_app_state_variable('make-art', 'shared', 2)
+    apps.increment_app_state_variable('make-art', 'shared', 3)
+    apps.update_upwards('make-art', 'shared', 1)
+    assert apps.load_app_state_variable('make-art', 'shared') == 5
+
+    apps.update_upwards('make-art', 'shared', 7)
+    assert apps.load_app_state_variable('make-art', 'shared') == 7
@@ -0,0 +1,65 @@
+#
+# test_atomic_write.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the crash-safe writes:
+#     `kano_profile.atomic_write`
+#
+
+
+import os
+import json
+import pytest
+
+import kano_profile.atomic_write as atomic_write
+
+
+def test_atomic_write_replaces_file(tmpdir):
+    path = str(tmpdir.join('state.json'))
+    with open(path, 'w') as f:
+        f.write('old')
+    os.chmod(path, 0600)
+
+    atomic_write.atomic_write_json(path, {'level': 3})
+
+    with open(path) as f:
+        assert json.load(f) == {'level': 3}
+    assert os.stat(path).st_mode & 0777 == 0600
+    assert os.listdir(str(tmpdir)) == ['state.json']
+
+
+def test_failed_write_keeps_old_contents(tmpdir):
+    path = str(tmpdir.join('state.json'))
+    atomic_write.atomic_write(path, 'old')
+
+    with pytest.raises(UnicodeEncodeError):
+        atomic_write.atomic_write(path, u'\u2013')
+
+    with open(path) as f:
+        assert f.read() == 'old'
+    assert os.listdir(str(tmpdir)) == ['state.json']
+
+
+def test_deferred_fsync_coalesces_syncs(tmpdir, monkeypatch):
+    synced = []
+    fsync = os.fsync
+
+    def count_fsync(fd):
+        synced.append(fd)
+        fsync(fd)
+
+    monkeypatch.setattr(os, 'fsync', count_fsync)
+
+    with atomic_write.deferred_fsync():
+        for i in xrange(5):
+            atomic_write.atomic_write(str(tmpdir.join('a')), str(i))
+            atomic_write.atomic_write(str(tmpdir.join('b')), str(i))
+
+        # The contents are synced before they replace the files
+        assert len(synced) == 10
+
+    # The directory is only synced once
+    assert len(synced) == 11
+    assert tmpdir.join('a').read() == '4'
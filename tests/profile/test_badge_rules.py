@@ -0,0 +1,109 @@
+#
+# test_badge_rules.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the badge rule compiler:
+#     `kano_profile.badge_rules`
+#
+
+
+import pytest
+
+from kano_profile.badge_rules import BadgeRules, compile_badge_rules
+
+
+APP_PROFILES = {
+    'make-pong': {'max_level': 16},
+}
+
+RULES = {
+    'badges': {
+        'master': {
+            'pong_pro': {
+                'operation': 'each_greater',
+                'targets': [['make-pong', 'level', -1]],
+            },
+        },
+        'in_game': {
+            'summercamp': {
+                'operation': 'each_greater',
+                'targets': [['kano-draw', 'groups.summercamp.challengeNo', 4]],
+            },
+        },
+        'online': {
+            'sharer': {
+                'operation': 'sum_greater',
+                'targets': [['make-pong', 'shared'], ['kano-draw', 'shared']],
+                'value': 3,
+            },
+        },
+    },
+    'environments': {
+        'all': {
+            'space': {
+                'operation': 'each_greater',
+                'targets': [['computed', 'num_offline_badges', 2]],
+                'push_back': True,
+            },
+        },
+    },
+}
+
+
+@pytest.mark.parametrize('rules, app_states, expected', [
+    (
+        RULES['badges']['master']['pong_pro'],
+        {'make-pong': {'level': 15}},
+        False
+    ),
+    (
+        RULES['badges']['master']['pong_pro'],
+        {'make-pong': {'level': 16}},
+        True
+    ),
+    (RULES['badges']['in_game']['summercamp'], {}, False),
+    (
+        RULES['badges']['in_game']['summercamp'],
+        {'kano-draw': {'groups': {'summercamp': {'challengeNo': 4}}}},
+        True
+    ),
+    (
+        RULES['badges']['online']['sharer'],
+        {'make-pong': {'shared': 1}, 'kano-draw': {'shared': 1}},
+        False
+    ),
+    (
+        RULES['badges']['online']['sharer'],
+        {'make-pong': {'shared': 2}, 'kano-draw': {'shared': 1}},
+        True
+    ),
+])
+def test_compiled_rules(rules, app_states, expected):
+    evaluate = compile_badge_rules(rules, APP_PROFILES)
+
+    assert evaluate(app_states) == expected
+
+
+@pytest.mark.parametrize('rules', [
+    {'targets': [['make-pong', 'level', 1]]},
+    {'operation': 'each_greater'},
+    {'operation': 'sum_greater', 'targets': [['make-pong', 'level']]},
+    {'operation': 'unknown', 'targets': [['make-pong', 'level', 1]]},
+])
+def test_malformed_rules(rules):
+    assert compile_badge_rules(rules, APP_PROFILES) is None
+
+
+def test_evaluation_plan():
+    plan = BadgeRules(RULES, APP_PROFILES)
+
+    assert len(plan.badges) == 3
+    assert [b.name for b in plan.push_back_badges] == ['space']
+
+    assert set(b.name for b in plan.badges_for_app('make-pong')) == \
+        set(['pong_pro', 'sharer'])
+    assert [b.name for b in plan.badges_for_target('kano-draw', 'shared')] == \
+        ['sharer']
+    assert plan.badges_for_app('make-snake') == []
@@ -0,0 +1,128 @@
+#
+# test_badges.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the badge calculation:
+#     `kano_profile.badges`
+#
+
+
+import os
+import json
+import shutil
+import pytest
+
+import kano_profile.badges as badges
+from kano_profile.apps import save_app_state, load_app_state, get_app_dir
+
+
+TEST_APPS = ['make-snake', 'make-pong', 'make-minecraft', 'kano-draw']
+
+
+def setup_function(function):
+    for app in TEST_APPS:
+        if os.path.exists(get_app_dir(app)):
+            shutil.rmtree(get_app_dir(app))
+
+
+def _badge_names(changes):
+    return sorted(
+        (category, subcat, item)
+        for category, subcats in changes.iteritems()
+        for subcat, items in subcats.iteritems()
+        for item in items
+    )
+
+
+@pytest.mark.parametrize('app, old_state, new_state', [
+    ('make-snake', {}, {'level': 9, 'total_number_of_apples': 150}),
+    ('make-pong', {'shared': 1}, {'shared': 6, 'blocks_created': 120}),
+    ('kano-draw', {}, {'groups': {'summercamp': {'challengeNo': 22}}}),
+    ('make-pong', {'level': 16}, {'level': 2}),
+])
+def test_badge_changes_match_full_calculation(app, old_state, new_state):
+    save_app_state('make-minecraft', {'level': 5, 'shared': 2})
+    save_app_state(app, old_state)
+
+    old_badges = badges.calculate_badges()
+    old_level = badges.calculate_kano_level()[0]
+    old_state = load_app_state(app)
+
+    save_app_state(app, new_state)
+
+    new_badges = badges.calculate_badges()
+    new_level = badges.calculate_kano_level()[0]
+
+    expected = badges.compare_badges_dict(old_badges, new_badges)
+    changes = badges.calculate_badge_changes(
+        app, old_state, new_state, old_level, new_level
+    )
+
+    assert _badge_names(changes) == _badge_names(expected or {})
+
+
+def test_calculated_badges_are_not_shared():
+    save_app_state('make-pong', {'level': 16, 'shared': 2})
+
+    first = badges.calculate_badges()
+    pong_pro = first['badges']['master']['pong_pro']
+    assert pong_pro['achieved']
+
+    pong_pro['title'] = 'changed'
+    pong_pro['achieved'] = False
+
+    second = badges.calculate_badges()
+    assert second['badges']['master']['pong_pro']['title'] != 'changed'
+    assert second['badges']['master']['pong_pro']['achieved']
+    assert first != second
+
+
+def test_app_state_with_dialog_diffs_once(monkeypatch):
+    calls = []
+    calculate_badge_changes = badges.calculate_badge_changes
+
+    def count_calls(*args):
+        calls.append(args)
+        return calculate_badge_changes(*args)
+
+    monkeypatch.setattr(badges, 'calculate_badge_changes', count_calls)
+    monkeypatch.setattr(badges, 'run_bg', lambda cmd: None)
+
+    with badges.app_state_with_dialog('make-pong') as state:
+        state['level'] = 16
+        state['shared'] = 2
+
+    assert len(calls) == 1
+    assert load_app_state('make-pong')['level'] == 16
+
+    with badges.app_state_with_dialog('make-pong') as state:
+        state['level'] = 16
+
+    assert len(calls) == 1
+
+
+def test_missing_app_profiles_means_no_badge_changes(monkeypatch):
+    monkeypatch.setattr(badges, '_compiled_badge_rules', None)
+    monkeypatch.setattr(badges, 'app_profiles_file', '/nonexistent.json')
+    monkeypatch.setattr(badges, 'run_bg', lambda cmd: None)
+
+    changes = badges.calculate_badge_changes(
+        'make-pong', {}, {'level': 16}, 1, 1
+    )
+    assert changes == {}
+
+    badges.save_app_state_with_dialog('make-pong', {'level': 16})
+    assert load_app_state('make-pong')['level'] == 16
+
+
+def test_badges_to_dict():
+    save_app_state('make-pong', {'level': 16, 'shared': 2})
+
+    calculated = badges.calculate_badges()
+    serialised = json.loads(json.dumps(badges.badges_to_dict(calculated)))
+
+    pong_pro = serialised['badges']['master']['pong_pro']
+    assert pong_pro['achieved']
+    assert pong_pro == calculated['badges']['master']['pong_pro'].to_dict()
@@ -0,0 +1,86 @@
+#
+# test_json_cache.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the cache of the profile json files:
+#     `kano_profile.json_cache`
+#
+
+
+import os
+import shutil
+
+import kano_profile.json_cache as json_cache
+from kano_profile.apps import save_app_state, load_app_state, \
+    load_app_state_variable, get_app_state_file, get_app_dir
+
+
+TEST_APPS = ['make-snake']
+
+
+def setup_function(function):
+    for app in TEST_APPS:
+        if os.path.exists(get_app_dir(app)):
+            shutil.rmtree(get_app_dir(app))
+
+    json_cache.invalidate()
+
+
+def _count_reads(monkeypatch):
+    reads = []
+    read_json = json_cache.read_json
+
+    def count_reads(path):
+        reads.append(path)
+        return read_json(path)
+
+    monkeypatch.setattr(json_cache, 'read_json', count_reads)
+
+    return reads
+
+
+def test_unchanged_file_is_read_once(monkeypatch):
+    save_app_state('make-snake', {'level': 2, 'groups': {'a': [1, 2]}})
+    reads = _count_reads(monkeypatch)
+
+    for dummy in xrange(3):
+        assert load_app_state('make-snake')['level'] == 2
+
+    assert reads == [get_app_state_file('make-snake')]
+
+
+def test_save_invalidates(monkeypatch):
+    save_app_state('make-snake', {'level': 2})
+    assert load_app_state('make-snake')['level'] == 2
+
+    save_app_state('make-snake', {'level': 3})
+    assert load_app_state('make-snake')['level'] == 3
+
+    os.remove(get_app_state_file('make-snake'))
+    assert load_app_state('make-snake') == {}
+
+
+def test_external_change_is_noticed(tmpdir):
+    path = str(tmpdir.join('data.json'))
+    with open(path, 'w') as f:
+        f.write('{"a": 1}')
+    assert json_cache.peek_json(path) == {'a': 1}
+
+    with open(path, 'w') as f:
+        f.write('{"a": 10}')
+    assert json_cache.peek_json(path) == {'a': 10}
+
+
+def test_returned_states_are_private():
+    save_app_state('make-snake', {'level': 2, 'groups': {'a': [1, 2]}})
+
+    state = load_app_state('make-snake')
+    state['level'] = 5
+    state['groups']['a'].append(3)
+    load_app_state_variable('make-snake', 'groups')['b'] = 1
+
+    state = load_app_state('make-snake')
+    assert state['level'] == 2
+    assert state['groups'] == {'a': [1, 2]}
@@ -0,0 +1,81 @@
+#
+# test_profile_index.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the persistent index of the profile results:
+#     `kano_profile.profile_index`
+#
+
+
+import os
+import shutil
+
+import kano_profile.badges as badges
+from kano_profile.apps import save_app_state, get_app_dir
+from kano_profile.paths import profile_index_file, profile_generation_file
+from kano_profile.profile_index import get_generation, bump_generation, \
+    load_index, save_index
+
+
+TEST_APPS = ['make-snake', 'make-pong']
+
+
+def setup_function(function):
+    for app in TEST_APPS:
+        if os.path.exists(get_app_dir(app)):
+            shutil.rmtree(get_app_dir(app))
+
+    for path in [profile_index_file, profile_generation_file]:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def test_generation_bump():
+    assert get_generation() is None
+
+    assert bump_generation() == 1
+    assert bump_generation() == 2
+    assert get_generation() == 2
+
+
+def test_save_app_state_invalidates_index():
+    save_index('test', [bump_generation()], {'data': 1})
+    assert load_index('test', [get_generation()]) == {'data': 1}
+
+    save_app_state('make-pong', {'level': 3})
+
+    assert load_index('test', [get_generation()]) is None
+
+
+def test_generation_restart_drops_index():
+    save_index('test', [bump_generation()], {'data': 1})
+    os.remove(profile_generation_file)
+
+    assert bump_generation() == 1
+    assert load_index('test', [1]) is None
+
+
+def test_load_badges(monkeypatch):
+    save_app_state('make-pong', {'level': 16, 'shared': 2})
+
+    assert badges.load_badges() == badges.calculate_badges()
+
+    def fail():
+        raise AssertionError('The badges should come from the index')
+
+    monkeypatch.setattr(badges, 'calculate_badges', fail)
+    monkeypatch.setattr(badges, 'calculate_xp', fail)
+
+    assert badges.load_badges()['badges']['master']['pong_pro']['achieved']
+    assert badges.count_badges()[0]['badges'] > 0
+
+
+def test_load_xp_follows_saves():
+    save_app_state('make-snake', {'level': 1})
+    assert badges.load_xp() == badges.calculate_xp()
+
+    save_app_state('make-snake', {'level': 4})
+    assert badges.load_xp() == badges.calculate_xp()
+    assert badges.load_kano_level() == badges.calculate_kano_level()
@@ -0,0 +1,76 @@
+#
+# test_xp.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the XP calculation:
+#     `kano_profile.badges.calculate_xp`
+#
+
+
+import os
+import shutil
+
+import kano_profile.badges as badges
+from kano_profile.apps import save_app_state, get_app_dir
+
+
+TEST_APPS = ['make-snake', 'make-pong']
+
+
+def setup_function(function):
+    for app in TEST_APPS:
+        if os.path.exists(get_app_dir(app)):
+            shutil.rmtree(get_app_dir(app))
+
+
+def test_calculate_xp_levels():
+    base_xp = badges.calculate_xp()
+
+    save_app_state('make-snake', {'level': 2})
+
+    assert badges.calculate_xp() == base_xp + 10
+
+
+def test_calculate_xp_picks_up_changes():
+    base_xp = badges.calculate_xp()
+
+    save_app_state('make-pong', {'level': 1})
+    assert badges.calculate_xp() == base_xp + 5
+
+    save_app_state('make-pong', {'level': 2, 'shared': 3})
+    assert badges.calculate_xp() == base_xp + 13
+
+
+def test_calculate_xp_only_reloads_changed_apps(monkeypatch):
+    save_app_state('make-snake', {'level': 1})
+    save_app_state('make-pong', {'level': 1})
+    badges.calculate_xp()
+
+    loaded = []
+
+    def peek_app_state(app):
+        loaded.append(app)
+        return original_peek(app)
+
+    original_peek = badges.peek_app_state
+    monkeypatch.setattr(badges, 'peek_app_state', peek_app_state)
+
+    xp = badges.calculate_xp()
+    assert loaded == []
+
+    save_app_state('make-pong', {'level': 2, 'extra': 'changes the size'})
+    assert badges.calculate_xp() == xp + 5
+    assert loaded == ['make-pong']
+
+
+def test_calculate_xp_notices_saves_with_the_same_stamp(monkeypatch):
+    monkeypatch.setattr(badges, 'get_app_state_stamp', lambda app: (1, 2, 3))
+    base_xp = badges.calculate_xp()
+
+    save_app_state('make-pong', {'level': 1})
+    assert badges.calculate_xp() == base_xp + 5
+
+    save_app_state('make-pong', {'level': 2})
+    assert badges.calculate_xp() == base_xp + 10
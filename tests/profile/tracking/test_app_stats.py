@@ -0,0 +1,96 @@
+#
+# test_app_stats.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the usage statistics of the applications:
+#     `kano_profile.tracker.app_stats`
+#
+
+
+import os
+import shutil
+
+import kano_profile.tracker.app_stats as app_stats
+from kano_profile.apps import peek_app_state, save_app_state
+from kano_profile.paths import tracker_app_stats_dir
+from kano_profile.tracker import add_runtime_to_app
+
+
+# Monday, 2 January 2017
+WEEK = 1483315200
+
+
+def setup_function(function):
+    if os.path.exists(tracker_app_stats_dir):
+        shutil.rmtree(tracker_app_stats_dir)
+
+    save_app_state('kano-tracker', {})
+
+
+def test_compaction_is_bounded():
+    record = {'weekly': {}}
+    for i in xrange(3 * 52):
+        week = str(WEEK - i * app_stats.WEEK)
+        record['weekly'][week] = {'starts': 1, 'runtime': 10}
+
+    app_stats.compact_app_stats(record, WEEK)
+
+    assert len(record['weekly']) == app_stats.WEEKS_KEPT
+    assert len(record['monthly']) <= app_stats.MONTHS_KEPT
+    assert sorted(record['monthly'])[0] == '2016-02'
+    assert sorted(record['yearly']) == ['2014', '2015', '2016']
+
+    buckets = record['weekly'].values() + record['monthly'].values() + \
+        record['yearly'].values()
+    assert sum(bucket['starts'] for bucket in buckets) == 3 * 52
+    assert sum(bucket['runtime'] for bucket in buckets) == 3 * 52 * 10
+
+
+def test_add_runtime_to_app():
+    add_runtime_to_app('make-art', 10)
+    add_runtime_to_app('make-art', '5.5')
+
+    record = app_stats.load_app_stats()['make-art']
+    assert record['starts'] == 2
+    assert record['runtime'] == 15.5
+    assert sum(b['starts'] for b in record['weekly'].itervalues()) == 2
+
+    assert 'app_stats' not in peek_app_state('kano-tracker')
+
+
+def test_migrate_app_stats():
+    legacy = {
+        'make-snake': {
+            'starts': 3,
+            'runtime': 30,
+            'weekly': {
+                str(WEEK): {'starts': 3, 'runtime': 30}
+            }
+        }
+    }
+    save_app_state('kano-tracker', {'app_stats': legacy, 'versions': {}})
+
+    add_runtime_to_app('make-snake', 10)
+
+    state = peek_app_state('kano-tracker')
+    assert 'app_stats' not in state
+    assert 'versions' in state
+
+    record = app_stats.load_app_stats()['make-snake']
+    assert record['starts'] == 4
+    assert record['runtime'] == 40
+
+
+def test_import_keeps_local_records():
+    add_runtime_to_app('make-art', 10)
+
+    app_stats.import_app_stats({
+        'make-art': {'starts': 100, 'runtime': 1000, 'weekly': {}},
+        'make-pong': {'starts': 1, 'runtime': 5, 'weekly': {}}
+    })
+
+    stats = app_stats.load_app_stats()
+    assert stats['make-art']['starts'] == 1
+    assert stats['make-pong']['starts'] == 1
@@ -0,0 +1,131 @@
+#
+# test_boot_clock.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the timing of the sessions and events on the clock of the
+# boot:
+#     `kano_profile.tracker.boot_clock`
+#
+
+
+import os
+import json
+import time
+import shutil
+
+import kano_profile.tracker.boot_clock as boot_clock
+import kano_profile.tracker.tracking_sessions as tracking_sessions
+from kano_profile.paths import tracker_boot_clocks_file, tracker_event_log_dir
+from kano_profile.tracker import iter_tracker_events, get_action_event
+from kano_profile.tracker.event_log import append_events
+
+
+def setup_function(function):
+    if os.path.exists(tracker_boot_clocks_file):
+        os.remove(tracker_boot_clocks_file)
+
+    if os.path.exists(tracker_event_log_dir):
+        shutil.rmtree(tracker_event_log_dir)
+
+
+def test_boottime():
+    first = boot_clock.get_boottime()
+    second = boot_clock.get_boottime()
+
+    assert 0 < first <= second
+    assert boot_clock.get_boot_id()
+
+
+def test_note_boot_clock():
+    with open(tracker_boot_clocks_file, 'w') as clocks_f:
+        json.dump({'previous-boot': 1500000000}, clocks_f)
+
+    boot_clock.note_boot_clock()
+
+    boot_clocks = boot_clock.load_boot_clocks()
+    assert boot_clocks['previous-boot'] == 1500000000
+    offset = boot_clock.get_boot_clock_offset()
+    assert abs(boot_clocks[boot_clock.get_boot_id()] - offset) <= \
+        boot_clock.CLOCK_TOLERANCE
+
+    assert boot_clock.get_wall_time('previous-boot', 100, boot_clocks) == \
+        1500000100
+    assert boot_clock.get_wall_time('unknown-boot', 100, boot_clocks) is None
+
+
+def test_boots_with_events_are_kept(monkeypatch):
+    monkeypatch.setattr(boot_clock, 'MAX_BOOTS', 3)
+
+    boot_clocks = dict(
+        ('boot-{}'.format(i), 1500000000 + i) for i in xrange(10)
+    )
+    with open(tracker_boot_clocks_file, 'w') as clocks_f:
+        json.dump(boot_clocks, clocks_f)
+
+    # The oldest boot still has events to upload
+    event = get_action_event('offline')
+    event['boot_id'] = 'boot-0'
+    append_events([event])
+
+    boot_clock.note_boot_clock()
+
+    assert sorted(boot_clock.load_boot_clocks()) == \
+        sorted(['boot-0', boot_clock.get_boot_id()])
+
+
+def test_elapsed_ignores_time_changes(monkeypatch):
+    session = {
+        'pid': os.getpid(),
+        'name': 'make-art',
+        'started': int(time.time()),
+        'boot_id': boot_clock.get_boot_id(),
+        'started_boottime': boot_clock.get_boottime() - 60,
+        'elapsed': 0
+    }
+
+    # The NTP catching up with a Kit booted without network
+    real_time = time.time
+    monkeypatch.setattr(time, 'time', lambda: real_time() + 365 * 24 * 3600)
+
+    assert 60 <= tracking_sessions.get_session_elapsed(session) <= 61
+
+
+def test_elapsed_of_previous_boots():
+    session = {
+        'started': 1500000000,
+        'boot_id': 'previous-boot',
+        'started_boottime': 10,
+        'elapsed': 300
+    }
+
+    assert tracking_sessions.get_session_elapsed(session) == 300
+
+
+def test_events_resolve_wall_time():
+    with open(tracker_boot_clocks_file, 'w') as clocks_f:
+        json.dump({'previous-boot': 1500000000}, clocks_f)
+
+    previous = get_action_event('previous')
+    previous['time'] = 0
+    previous['boot_id'] = 'previous-boot'
+    previous['boottime'] = 100
+
+    unknown = get_action_event('unknown')
+    unknown['time'] = 1400000000
+    unknown['boot_id'] = 'unknown-boot'
+
+    append_events([previous, unknown, get_action_event('current')])
+
+    events = dict(
+        (event['name'], event) for dummy, event in iter_tracker_events()
+    )
+
+    assert events['previous']['time'] == 1500000100
+    assert events['unknown']['time'] == 1400000000
+    assert abs(events['current']['time'] - time.time()) <= 2
+
+    for event in events.itervalues():
+        assert 'boot_id' not in event
+        assert 'boottime' not in event
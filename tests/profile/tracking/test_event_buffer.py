@@ -0,0 +1,88 @@
+#
+# test_event_buffer.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the buffer of the tracking events:
+#     `kano_profile.tracker.event_buffer`
+#
+
+
+import os
+import sys
+import time
+import shutil
+import subprocess
+
+import kano_profile.tracker.event_buffer as event_buffer
+from kano_profile.paths import tracker_event_log_dir
+from kano_profile.tracker.event_log import iter_events
+from tests.fixtures.profile import isolated_script
+
+
+def _event(i):
+    return {
+        'type': 'action',
+        'time': 1500000000 + i,
+        'timezone_offset': 3600,
+        'os_version': '3.14.0',
+        'cpu_id': '00000000abcdef',
+        'token': 'token-1',
+        'language': 'en_GB',
+        'name': 'action-{}'.format(i)
+    }
+
+
+def _names():
+    return [event['name'] for event in iter_events()]
+
+
+def setup_function(function):
+    if os.path.exists(tracker_event_log_dir):
+        shutil.rmtree(tracker_event_log_dir)
+
+
+def test_flush_when_full():
+    buf = event_buffer.EventBuffer(max_events=3, max_delay=60)
+
+    buf.add(_event(0))
+    buf.add(_event(1))
+    assert _names() == []
+
+    buf.add(_event(2))
+    assert _names() == ['action-0', 'action-1', 'action-2']
+
+
+def test_flush_after_delay():
+    buf = event_buffer.EventBuffer(max_events=100, max_delay=0.1)
+
+    buf.add(_event(0))
+    assert _names() == []
+
+    time.sleep(0.5)
+    assert _names() == ['action-0']
+
+
+def test_failed_flush_keeps_events(monkeypatch):
+    buf = event_buffer.EventBuffer(max_events=100, max_delay=60)
+    buf.add(_event(0))
+
+    monkeypatch.setattr(event_buffer, '_store_events', lambda events: False)
+    assert not buf.flush()
+
+    monkeypatch.undo()
+    assert buf.flush()
+    assert _names() == ['action-0']
+
+
+def test_flush_on_exit():
+    script = isolated_script([
+        'from kano_profile.tracker import track_action',
+        'track_action("exited")',
+    ])
+
+    rv = subprocess.call([sys.executable, '-c', script])
+
+    assert rv == 0
+    assert _names() == ['exited']
@@ -0,0 +1,181 @@
+#
+# test_event_log.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the storage of the tracking events:
+#     `kano_profile.tracker.event_log`
+#
+
+
+import os
+import json
+
+import kano_profile.tracker.event_log as event_log
+
+
+def _event(i, token='token-1', **kwargs):
+    event = {
+        'type': 'action',
+        'time': 1500000000 + i,
+        'timezone_offset': 3600,
+        'os_version': '3.14.0',
+        'cpu_id': '00000000abcdef',
+        'token': token,
+        'language': 'en_GB',
+        'name': 'action-{}'.format(i)
+    }
+    event.update(kwargs)
+
+    return event
+
+
+def _read(log_dir, legacy_file='/non/existent'):
+    return list(event_log.iter_events(str(log_dir), legacy_file))
+
+
+def test_events_round_trip(tmpdir):
+    events = [_event(i) for i in xrange(100)]
+    events.append(_event(100, token='token-2', data={'nested': [1, 2]}))
+
+    assert event_log.append_events(events[:50], str(tmpdir))
+    assert event_log.append_events(events[50:], str(tmpdir))
+
+    assert _read(tmpdir) == events
+
+    # The constant fields are only stored once per segment and boot
+    segments = event_log.list_segments(str(tmpdir))
+    assert len(segments) == 1
+
+    with open(segments[0], 'rb') as segment_f:
+        kinds = [
+            kind for kind, dummy_key, dummy_data, dummy_offset
+            in event_log.iter_segment_records(segment_f)
+        ]
+    assert kinds.count(event_log.HEADER_RECORD) == 2
+
+    lines_size = sum(len(json.dumps(event)) + 1 for event in events)
+    assert os.path.getsize(segments[0]) < lines_size / 2
+
+
+def test_segments_rotate(tmpdir, monkeypatch):
+    monkeypatch.setattr(event_log, 'SEGMENT_SIZE', 1024)
+    monkeypatch.setattr(event_log, 'MAX_SEGMENTS', 3)
+
+    events = [_event(i) for i in xrange(200)]
+    for event in events:
+        event_log.append_events([event], str(tmpdir))
+
+    assert len(event_log.list_segments(str(tmpdir))) == 3
+
+    # The oldest events were dropped
+    stored = _read(tmpdir)
+    assert stored == events[-len(stored):]
+
+
+def test_truncated_record_is_ignored(tmpdir):
+    event_log.append_events([_event(1), _event(2)], str(tmpdir))
+
+    segment = event_log.list_segments(str(tmpdir))[0]
+    with open(segment, 'ab') as segment_f:
+        segment_f.write('\x00\x00\x01\x00E12345678{"na')
+
+    assert _read(tmpdir) == [_event(1), _event(2)]
+
+
+def test_torn_record_is_cut_before_appending(tmpdir):
+    event_log.append_events([_event(1), _event(2)], str(tmpdir))
+
+    segment = event_log.list_segments(str(tmpdir))[0]
+    with open(segment, 'ab') as segment_f:
+        segment_f.write('\x00\x00\x01\x00E12345678{"na')
+
+    # Written by another process as far as this one knows
+    event_log._written_headers.clear()
+    event_log.append_events([_event(3)], str(tmpdir))
+
+    assert _read(tmpdir) == [_event(1), _event(2), _event(3)]
+    assert len(event_log.list_segments(str(tmpdir))) == 1
+
+
+def test_corrupted_segment_is_restarted(tmpdir):
+    segment = os.path.join(str(tmpdir), '00000001.log')
+    with open(segment, 'wb') as segment_f:
+        segment_f.write('KT')
+
+    event_log.append_events([_event(1)], str(tmpdir))
+
+    assert _read(tmpdir) == [_event(1)]
+
+
+def test_rewrite_events(tmpdir):
+    old_events = [_event(i, token='old') for i in xrange(10)]
+    new_events = [_event(i, token='new') for i in xrange(10, 20)]
+    event_log.append_events(old_events + new_events, str(tmpdir))
+
+    def select(header):
+        return event_log.TRANSFORM if header['token'] == 'new' \
+            else event_log.DROP
+
+    def transform(event):
+        if event['time'] % 2:
+            return None
+
+        event['time'] += 5
+        event['timezone_offset'] = 0
+
+        return event
+
+    assert event_log.rewrite_events(select, transform, log_dir=str(tmpdir),
+                                    legacy_events_file='/non/existent')
+
+    expected = [
+        _event(i, token='new', time=1500000005 + i, timezone_offset=0)
+        for i in xrange(10, 20, 2)
+    ]
+    assert _read(tmpdir) == expected
+
+
+def test_legacy_events_are_migrated(tmpdir):
+    log_dir = tmpdir.join('log')
+    legacy_file = str(tmpdir.join('events'))
+
+    with open(legacy_file, 'w') as legacy_f:
+        for i in xrange(3):
+            legacy_f.write(json.dumps(_event(i, token='old')) + '\n')
+        legacy_f.write('{"corrupted\n')
+        legacy_f.write(json.dumps(_event(3, token='new')) + '\n')
+
+    assert len(_read(log_dir, legacy_file)) == 4
+
+    def select(header):
+        return event_log.KEEP if header['token'] == 'new' \
+            else event_log.DROP
+
+    event_log.rewrite_events(select, log_dir=str(log_dir),
+                             legacy_events_file=legacy_file)
+
+    assert not os.path.exists(legacy_file)
+    assert _read(log_dir, legacy_file) == [_event(3, token='new')]
+
+
+def test_rewrite_until_cursor(tmpdir, monkeypatch):
+    monkeypatch.setattr(event_log, 'SEGMENT_SIZE', 1024)
+
+    for i in xrange(40):
+        event_log.append_events([_event(i, token='old')], str(tmpdir))
+
+    read = list(event_log.iter_events_with_cursor(str(tmpdir),
+                                                  '/non/existent'))
+    cursor = read[24][0]
+    assert cursor[0] > 1
+
+    # Stored after the events were read
+    event_log.append_events([_event(40, token='old')], str(tmpdir))
+
+    event_log.rewrite_events(lambda header: event_log.DROP, until=cursor,
+                             log_dir=str(tmpdir),
+                             legacy_events_file='/non/existent')
+
+    assert _read(tmpdir) == [_event(i, token='old') for i in xrange(25, 41)]
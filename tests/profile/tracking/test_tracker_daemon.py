@@ -0,0 +1,193 @@
+#
+# test_tracker_daemon.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the tracker daemon:
+#     `kano_profile.tracker.tracker_daemon`
+#
+
+
+import os
+import json
+import time
+import shutil
+import threading
+import subprocess
+import pytest
+
+import kano_profile.tracker.tracking_sessions as tracking_sessions
+from kano_profile.tracker import track_action, flush_tracking_events
+from kano_profile.tracker.tracker_daemon import TrackerDaemon
+from kano_profile.tracker.event_log import iter_events
+from kano_profile.paths import tracker_dir, tracker_event_log_dir, \
+    tracker_socket_file
+
+
+class DaemonThread(threading.Thread):
+    def __init__(self):
+        super(DaemonThread, self).__init__()
+
+        self.daemon_obj = TrackerDaemon()
+        self.ready = threading.Event()
+        self.stopped = threading.Event()
+
+    def run(self):
+        self.daemon_obj.start()
+        self.ready.set()
+
+        while not self.stopped.is_set():
+            self.daemon_obj.serve(0.05)
+
+        self.daemon_obj.stop()
+
+    def __enter__(self):
+        self.start()
+        self.ready.wait()
+        return self.daemon_obj
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+        self.join()
+
+
+def setup_function(function):
+    for path in [tracker_dir, tracker_event_log_dir]:
+        if os.path.exists(path):
+            shutil.rmtree(path)
+
+    os.makedirs(tracker_dir)
+
+
+def test_sessions_in_memory(tracking_session):
+    tracking_session.setup_paused_sessions(None)
+
+    with DaemonThread() as daemon:
+        path = tracking_sessions.session_start('test', os.getpid())
+        assert tracking_sessions.get_session_unique_id('test', os.getpid())
+
+        tracking_sessions.session_start('crashed', 999999999)
+        tracking_sessions.session_end(path)
+
+        assert os.listdir(tracker_dir) == []
+
+    daemon.refresh()
+
+    events = list(iter_events())
+    assert sorted(event['name'] for event in events) == ['crashed', 'test']
+    assert daemon.sessions == {}
+
+
+def test_checkpoint_on_stop(tracking_session):
+    tracking_session.setup_paused_sessions(None)
+
+    with DaemonThread():
+        path = tracking_sessions.session_start('test', os.getpid())
+
+    assert not os.path.exists(tracker_socket_file)
+
+    with open(path, 'r') as session_f:
+        assert json.load(session_f)['pid'] == os.getpid()
+
+    # The sessions are picked up again by the next daemon
+    with DaemonThread():
+        tracking_sessions.session_end(path)
+
+    with open(path, 'r') as session_f:
+        assert json.load(session_f)['finished']
+
+
+def test_session_files_changed_behind(tracking_session):
+    tracking_session.setup_sessions([
+        tracking_session.format_session('test-1', 12345678, 999999999, 60,
+                                        True)
+    ])
+
+    daemon = TrackerDaemon()
+    daemon.refresh()
+
+    assert [event['name'] for event in iter_events()] == ['test-1']
+    assert os.listdir(tracker_dir) == []
+
+
+def test_checkpoint_rewrites_files_in_place(tracking_session):
+    tracking_session.setup_sessions([
+        tracking_session.format_session('test-1', 12345678, os.getpid(), 60,
+                                        False),
+        tracking_session.format_session('test-2', 12345678, os.getpid(), 60,
+                                        False)
+    ])
+
+    daemon = TrackerDaemon()
+    daemon.refresh()
+
+    names = sorted(daemon.sessions)
+    paths = [os.path.join(tracker_dir, name) for name in names]
+    inode = os.stat(paths[0]).st_ino
+
+    # Those holding the lock of a file keep writing to the file in place
+    os.remove(paths[1])
+    for name in names:
+        daemon.sessions[name]['elapsed'] = 120
+        daemon._dirty.add(name)
+    daemon.checkpoint()
+
+    assert os.stat(paths[0]).st_ino == inode
+    with open(paths[0], 'r') as session_f:
+        assert json.load(session_f)['elapsed'] == 120
+
+    # Removed behind the back of the daemon, not to be created again
+    assert not os.path.exists(paths[1])
+
+
+def test_events_through_daemon():
+    with DaemonThread():
+        track_action('test-action')
+        flush_tracking_events()
+
+    assert [event['name'] for event in iter_events()] == ['test-action']
+
+
+def test_release(tracking_session):
+    tracking_session.setup_paused_sessions(None)
+
+    with DaemonThread() as daemon:
+        path = tracking_sessions.session_start('test', os.getpid())
+        tracking_sessions.send_message({'cmd': 'release'})
+
+        assert os.path.exists(path)
+        assert daemon.sessions == {}
+
+
+@pytest.mark.parametrize('pidfd_supported', [True, False])
+def test_session_end_on_exit(tracking_session, pidfd_supported):
+    tracking_session.setup_paused_sessions(None)
+
+    process = subprocess.Popen(['sleep', '0.2'])
+
+    with DaemonThread() as daemon:
+        daemon._watcher._pidfd_supported = pidfd_supported
+        tracking_sessions.session_start('test', process.pid)
+        process.wait()
+
+        deadline = time.time() + 3
+        while daemon.sessions and time.time() < deadline:
+            time.sleep(0.05)
+
+    assert daemon.sessions == {}
+    assert [event['name'] for event in iter_events()] == ['test']
+
+
+def test_session_files_watched(tracking_session):
+    with DaemonThread():
+        tracking_session.setup_sessions([
+            tracking_session.format_session('test-1', 12345678, 999999999, 60,
+                                            True)
+        ])
+
+        deadline = time.time() + 3
+        while os.listdir(tracker_dir) and time.time() < deadline:
+            time.sleep(0.05)
+
+    assert [event['name'] for event in iter_events()] == ['test-1']
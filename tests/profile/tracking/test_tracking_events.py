@@ -12,10 +12,13 @@
 import os
 import json
 import time
+import shutil
 import pytest
 
-from kano_profile.paths import tracker_events_file
+from kano_profile.paths import tracker_event_log_dir
 import kano_profile.tracker.tracking_events as tracking_events
+from kano_profile.tracker.event_log import iter_events
+from kano_profile.tracker.event_buffer import flush_tracking_events
 from kano_profile.tracker.tracker_token import TOKEN
 
 
@@ -24,17 +27,15 @@ from kano_profile.tracker.tracker_token import TOKEN
     ('auto-poweroff', 'battery', '{"status": "automatic-poweroff"}')
     ])
 def test_generate_low_battery_event(event_name, event_type, event_data):
-    if os.path.exists(tracker_events_file):
-        os.remove(tracker_events_file)
+    if os.path.exists(tracker_event_log_dir):
+        shutil.rmtree(tracker_event_log_dir)
 
     tracking_events.generate_event(event_name)
+    flush_tracking_events()
 
-    assert os.path.exists(tracker_events_file)
+    assert os.path.exists(tracker_event_log_dir)
 
-    events = []
-
-    with open(tracker_events_file, 'r') as events_f:
-        events.append(json.loads(events_f.readline()))
+    events = list(iter_events())
 
     assert len(events) == 1
 
@@ -9,9 +9,14 @@
 #
 
 
+import os
+import sys
+import subprocess
 import pytest
 
 import kano_profile.tracker as tracker
+from kano_profile.paths import tracker_token_file
+from tests.fixtures.profile import isolated_script
 import kano_profile.tracking_events as tracking_events
 
 
@@ -51,3 +56,33 @@ def test_tracker_module_import(module_export):
     ])
 def test_tracking_events_module_import(module_export):
     getattr(tracking_events, module_export)
+
+
+# Generous, the import takes a fraction of that on a Raspberry Pi
+IMPORT_TIME_BUDGET = 2.0
+
+IMPORT_SCRIPT = isolated_script('''
+import time
+import kano.utils.hardware
+
+def probe(*args, **kwargs):
+    raise AssertionError('The hardware was probed on import')
+
+kano.utils.hardware.get_cpu_id = probe
+
+start = time.time()
+import kano_profile.tracker
+print time.time() - start
+'''.splitlines())
+
+
+def test_tracker_import_is_lazy():
+    if os.path.exists(tracker_token_file):
+        os.remove(tracker_token_file)
+
+    import_time = subprocess.check_output(
+        [sys.executable, '-c', IMPORT_SCRIPT]
+    )
+
+    assert not os.path.exists(tracker_token_file)
+    assert float(import_time) < IMPORT_TIME_BUDGET
@@ -38,3 +38,21 @@ def test_pid_name_init(tracking_session_file_data):
     assert session.path == session_path
     assert session.pid == session_pid
     assert session.name == session_name
+
+
+def test_unicode_name():
+    session = TrackingSession(pid=1242, name=u'caf\xe9')
+
+    assert session.name == 'caf\xc3\xa9'
+    assert session.file == '1242-caf\xc3\xa9.json'
+    assert TrackingSession(session_file=session.file).name == session.name
+
+
+def test_running_pids():
+    session = TrackingSession(pid=1242, name='test', running_pids={1242})
+    assert session.is_open()
+
+    session = TrackingSession(pid=1242, name='test', running_pids=set())
+    assert not session.is_open()
+
+    assert not hasattr(session, '__dict__')
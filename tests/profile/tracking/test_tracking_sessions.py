@@ -11,6 +11,7 @@
 
 import os
 import json
+import shutil
 import pytest
 
 from conftest import sample_tracking_sessions
@@ -18,7 +19,9 @@ from conftest import sample_tracking_sessions
 import kano_profile.tracker.tracking_sessions as tracking_sessions
 from kano_profile.tracker.tracking_session import TrackingSession
 from kano_profile.paths import tracker_dir, PAUSED_SESSIONS_FILE, \
-    tracker_events_file
+    tracker_event_log_dir
+from kano_profile.tracker.event_log import iter_events
+from kano_profile.tracker.event_buffer import flush_tracking_events
 
 
 def test_list_sessions(tracking_session, sample_tracking_sessions):
@@ -37,6 +40,32 @@ def test_list_sessions(tracking_session, sample_tracking_sessions):
         assert os.path.basename(session_path) in listed_sessions
 
 
+def test_scan_sessions(tracking_session, sample_tracking_sessions,
+                       monkeypatch):
+    tracking_session.setup_sessions(sample_tracking_sessions)
+    tracking_session.setup_paused_sessions(None)
+
+    with open(os.path.join(tracker_dir, 'not-a-session'), 'w'):
+        pass
+
+    listings = []
+
+    def get_running_pids():
+        listings.append(True)
+        return {1234}
+
+    monkeypatch.setattr(tracking_sessions, 'get_running_pids',
+                        get_running_pids)
+
+    sessions = tracking_sessions.scan_sessions()
+
+    assert sorted(session.name for session in sessions) == sorted(
+        session['name'] for session in sample_tracking_sessions
+    )
+    assert all(session.is_open() for session in sessions)
+    assert len(listings) == 1
+
+
 def test_get_open_sessions(tracking_session, sample_tracking_sessions):
     sample_sessions = sample_tracking_sessions[:]
     open_session = tracking_session.format_session(
@@ -208,14 +237,27 @@ def test_unpause_tracking_sessions(tracking_session, sample_tracking_sessions):
     ]
 )
 def test_session_log(name, started, length):
-    if os.path.exists(tracker_events_file):
-        os.remove(tracker_events_file)
+    if os.path.exists(tracker_event_log_dir):
+        shutil.rmtree(tracker_event_log_dir)
 
     tracking_sessions.session_log(name, started, length)
+    flush_tracking_events()
 
-    with open(tracker_events_file, 'r') as events_f:
-        events_data = json.load(events_f)
+    events = list(iter_events())
+    assert len(events) == 1
+    events_data = events[0]
 
     assert events_data['name'] == name
     assert events_data['time'] == started
     assert events_data['length'] == length
+
+
+def test_unpause_tracking_session(tracking_session, sample_tracking_sessions):
+    tracking_session.setup_sessions([])
+    tracking_session.setup_paused_sessions(sample_tracking_sessions)
+
+    paused_sessions = tracking_sessions.get_paused_sessions()
+    tracking_sessions.unpause_tracking_session(paused_sessions[0])
+
+    assert tracking_sessions.get_paused_sessions() == paused_sessions[1:]
+    assert tracking_sessions.is_tracking_paused()
@@ -0,0 +1,143 @@
+#
+# test_tracking_upload.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the upload of the tracking events:
+#     `kano_world.session.KanoWorldSession.upload_tracking_data`
+#
+
+
+import os
+import json
+import zlib
+import shutil
+
+import kano_world.session as session
+from kano_profile.paths import tracker_event_log_dir, \
+    tracker_upload_cursor_file
+from kano_profile.tracker import iter_tracker_events, \
+    resume_tracker_events_upload
+from kano_profile.tracker.event_log import append_events, iter_events
+
+
+def _event(i):
+    return {
+        'type': 'action',
+        'time': 1500000000 + i,
+        'timezone_offset': 3600,
+        'os_version': '3.14.0',
+        'cpu_id': '00000000abcdef',
+        'token': 'previous-boot',
+        'language': 'en_GB',
+        'name': 'action-{}'.format(i)
+    }
+
+
+class FakeServer(object):
+    def __init__(self, fail_at=None):
+        self.batches = []
+        self.headers = []
+        self.fail_at = fail_at
+
+    def request_wrapper(self, method, endpoint, data=None, headers=None,
+                        session=None):
+        if method == 'get':
+            return True, None, {}
+
+        if len(self.batches) == self.fail_at:
+            return False, 'Connection error', None
+
+        if headers and headers.get('content-encoding') == 'gzip':
+            data = zlib.decompress(data, 16 + zlib.MAX_WBITS)
+
+        self.batches.append(json.loads(data)['events'])
+        self.headers.append(headers)
+
+        return True, None, {'success': True}
+
+
+def setup_function(function):
+    if os.path.exists(tracker_event_log_dir):
+        shutil.rmtree(tracker_event_log_dir)
+
+    if os.path.exists(tracker_upload_cursor_file):
+        os.remove(tracker_upload_cursor_file)
+
+
+def _upload(monkeypatch, server, **kwargs):
+    monkeypatch.setattr(session, 'request_wrapper', server.request_wrapper)
+
+    return session.KanoWorldSession('token').upload_tracking_data(**kwargs)
+
+
+def test_upload_in_batches(monkeypatch):
+    events = [_event(i) for i in xrange(25)]
+    append_events(events)
+
+    server = FakeServer()
+    assert _upload(monkeypatch, server, max_batch_events=10) == (True, None)
+
+    assert [len(batch) for batch in server.batches] == [10, 10, 5]
+    assert sum(server.batches, []) == events
+    assert list(iter_events()) == []
+
+
+def test_upload_batch_size_limit(monkeypatch):
+    append_events([_event(i) for i in xrange(10)])
+    event_size = len(json.dumps(_event(0)))
+
+    server = FakeServer()
+    _upload(monkeypatch, server, max_batch_bytes=event_size * 3)
+
+    assert [len(batch) for batch in server.batches] == [3, 3, 3, 1]
+
+
+def test_interrupted_upload_resumes(monkeypatch):
+    events = [_event(i) for i in xrange(25)]
+    append_events(events)
+
+    server = FakeServer(fail_at=1)
+    rv, error = _upload(monkeypatch, server, max_batch_events=10)
+
+    assert not rv
+    assert list(iter_events()) == events[10:]
+
+    server = FakeServer()
+    assert _upload(monkeypatch, server, max_batch_events=10) == (True, None)
+    assert sum(server.batches, []) == events[10:]
+
+
+def test_resume_saved_cursor():
+    events = [_event(i) for i in xrange(5)]
+    append_events(events)
+
+    cursors = [cursor for cursor, dummy_event in iter_tracker_events()]
+    with open(tracker_upload_cursor_file, 'w') as cursor_f:
+        json.dump(list(cursors[1]), cursor_f)
+
+    resume_tracker_events_upload()
+
+    assert list(iter_events()) == events[2:]
+    assert not os.path.exists(tracker_upload_cursor_file)
+
+
+def test_upload_gzip(monkeypatch):
+    events = [_event(i) for i in xrange(5)]
+    append_events(events)
+
+    server = FakeServer()
+    assert _upload(monkeypatch, server, compress=True) == (True, None)
+
+    assert server.batches == [events]
+    assert server.headers[0]['content-encoding'] == 'gzip'
+
+
+def test_upload_nothing(monkeypatch):
+    server = FakeServer()
+    rv, error = _upload(monkeypatch, server)
+
+    assert rv
+    assert error
+    assert server.batches == []
@@ -0,0 +1,229 @@
+#
+# test_assets.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the downloads of the images of the profile:
+#     `kano_world.assets`
+#
+
+
+import os
+import time
+import shutil
+import tempfile
+import threading
+
+import pytest
+
+import kano_world.assets as assets
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, content='', headers=None):
+        self.status_code = status_code
+        self.ok = status_code < 400
+        self.content = content
+        self.headers = headers or {}
+
+
+class FakeHttp(object):
+    """ Serves images, with an ETag when asked to """
+
+    def __init__(self, images, etags=True, delay=0):
+        self.images = images
+        self.etags = etags
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def get(self, url, headers=None, proxies=None, timeout=None):
+        with self._lock:
+            self.requests.append((url, headers))
+
+        time.sleep(self.delay)
+
+        if url not in self.images:
+            return FakeResponse(404)
+
+        content = self.images[url]
+        etag = '"{}"'.format(hash(content))
+        if self.etags and headers.get('If-None-Match') == etag:
+            return FakeResponse(304)
+
+        return FakeResponse(
+            200, content, {'ETag': etag} if self.etags else {}
+        )
+
+
+@pytest.fixture
+def assets_dir(request):
+    dir_path = tempfile.mkdtemp()
+    request.addfinalizer(lambda: shutil.rmtree(dir_path))
+    return dir_path
+
+
+def _fetch(monkeypatch, http, images, dir_path):
+    monkeypatch.setattr(assets, '_http', http)
+    return assets.fetch_assets(images, dir_path)
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_mtime, st.st_ino
+
+
+def test_unchanged_assets_are_not_downloaded(monkeypatch, assets_dir):
+    images = {'a.png': 'http://images/a', 'b.png': 'http://images/b'}
+    http = FakeHttp({'http://images/a': 'A', 'http://images/b': 'B'})
+
+    assert _fetch(monkeypatch, http, images, assets_dir) == []
+    with open(os.path.join(assets_dir, 'a.png')) as image_f:
+        assert image_f.read() == 'A'
+
+    stamp = _stamp(os.path.join(assets_dir, 'a.png'))
+    http.requests = []
+
+    assert _fetch(monkeypatch, http, images, assets_dir) == []
+    assert all(headers.get('If-None-Match') for dummy, headers in
+               http.requests)
+    assert _stamp(os.path.join(assets_dir, 'a.png')) == stamp
+
+
+def test_same_content_is_not_rewritten(monkeypatch, assets_dir):
+    images = {'a.png': 'http://images/a'}
+    http = FakeHttp({'http://images/a': 'A'}, etags=False)
+
+    _fetch(monkeypatch, http, images, assets_dir)
+    stamp = _stamp(os.path.join(assets_dir, 'a.png'))
+
+    _fetch(monkeypatch, http, images, assets_dir)
+    assert _stamp(os.path.join(assets_dir, 'a.png')) == stamp
+
+    http.images['http://images/a'] = 'A2'
+    _fetch(monkeypatch, http, images, assets_dir)
+    with open(os.path.join(assets_dir, 'a.png')) as image_f:
+        assert image_f.read() == 'A2'
+
+
+def test_failed_downloads(monkeypatch, assets_dir):
+    images = {'a.png': 'http://images/a', 'missing.png': 'http://missing'}
+    http = FakeHttp({'http://images/a': 'A'})
+
+    assert _fetch(monkeypatch, http, images, assets_dir) == ['missing.png']
+    assert not os.path.exists(os.path.join(assets_dir, 'missing.png'))
+
+
+def test_downloads_are_concurrent(monkeypatch, assets_dir):
+    urls = ['http://images/{}'.format(i) for i in xrange(4)]
+    images = dict(('{}.png'.format(i), url) for i, url in enumerate(urls))
+    http = FakeHttp(dict((url, url) for url in urls), delay=0.2)
+
+    start = time.time()
+    _fetch(monkeypatch, http, images, assets_dir)
+
+    assert time.time() - start < 0.6
+    assert sorted(os.listdir(assets_dir)) == \
+        sorted(images.keys() + [assets.ASSETS_INDEX])
+
+
+def test_badges_file_only_written_on_change(monkeypatch):
+    import kano_world.session as session
+    from kano_profile.paths import online_badges_file
+
+    badges = [{
+        'id': 'badge-1',
+        'assigned': True,
+        'image_url': 'http://images/badge-1',
+        'bg_color': '#ff0000',
+        'desc_locked': 'Locked',
+        'desc_unlocked': 'Unlocked',
+        'title': 'Badge'
+    }]
+    fetched = []
+
+    monkeypatch.setattr(session, 'request_wrapper',
+                        lambda *args, **kwargs: (True, None, {
+                            'user': {'profile': {'badges': badges}}
+                        }))
+    monkeypatch.setattr(session, 'load_profile',
+                        lambda: {'kanoworld_id': 'user-1'})
+    monkeypatch.setattr(session, 'fetch_assets',
+                        lambda images, dir_path: fetched.append(images))
+
+    kw_session = session.KanoWorldSession('token')
+    assert kw_session.download_online_badges() == (True, None)
+    assert fetched == [{'badge-1.png': 'http://images/badge-1'}]
+
+    stamp = _stamp(online_badges_file)
+    assert kw_session.download_online_badges() == (True, None)
+    assert _stamp(online_badges_file) == stamp
+
+
+@pytest.fixture
+def resized(monkeypatch):
+    resized = []
+
+    def resize(src_path, dest_path, width, height):
+        with open(src_path) as src_f:
+            content = src_f.read()
+
+        resized.append(content)
+        with open(dest_path, 'w') as dest_f:
+            dest_f.write('{}x{} {}'.format(width, height, content))
+
+    monkeypatch.setattr(assets, '_resize_image', resize)
+    return resized
+
+
+def test_thumbnails_are_only_made_once(monkeypatch, assets_dir, resized):
+    urls = ['http://images/a', 'http://images/b']
+    http = FakeHttp({'http://images/a': 'A', 'http://images/b': 'B'})
+    monkeypatch.setattr(assets, '_http', http)
+
+    thumbnails = assets.fetch_thumbnails(urls, assets_dir, 28, 17)
+    assert sorted(thumbnails) == urls
+    with open(thumbnails['http://images/a']) as thumb_f:
+        assert thumb_f.read() == '28x17 A'
+
+    assert assets.fetch_thumbnails(urls, assets_dir, 28, 17) == thumbnails
+    assert sorted(resized) == ['A', 'B']
+
+    # The same image under another URL shares the thumbnail
+    http.images['http://copy/a'] = 'A'
+    thumbnails = assets.fetch_thumbnails(['http://copy/a'], assets_dir, 28, 17)
+    assert sorted(resized) == ['A', 'B']
+    assert sorted(os.listdir(assets_dir)) == \
+        sorted([os.path.basename(thumbnails['http://copy/a']), 'originals'])
+
+
+def test_failed_thumbnails(monkeypatch, assets_dir, resized):
+    def broken(src_path, dest_path, width, height):
+        with open(dest_path, 'w') as dest_f:
+            dest_f.write('Half')
+        raise IOError('Not an image')
+
+    http = FakeHttp({'http://images/a': 'A'})
+    monkeypatch.setattr(assets, '_http', http)
+    monkeypatch.setattr(assets, '_resize_image', broken)
+
+    assert assets.fetch_thumbnails(
+        ['http://images/a', 'http://missing'], assets_dir, 28, 17
+    ) == {}
+    assert os.listdir(assets_dir) == ['originals']
+
+
+def test_cached_thumbnails_outlive_failed_downloads(monkeypatch, assets_dir,
+                                                    resized):
+    http = FakeHttp({'http://images/a': 'A'})
+    monkeypatch.setattr(assets, '_http', http)
+
+    thumbnails = assets.fetch_thumbnails(['http://images/a'], assets_dir,
+                                         28, 17)
+
+    # Offline for a moment
+    del http.images['http://images/a']
+    assert assets.fetch_thumbnails(['http://images/a'], assets_dir,
+                                   28, 17) == thumbnails
+    assert os.path.exists(thumbnails['http://images/a'])
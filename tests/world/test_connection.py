@@ -0,0 +1,57 @@
+#
+# test_connection.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the connections to Kano World:
+#     `kano_world.connection`
+#
+
+
+import kano_world.connection as connection
+from kano_world.config import HTTP_POOL_SIZE, HTTP_RETRIES
+
+
+class FakeResponse(object):
+    ok = True
+
+    def json(self):
+        return {'success': True}
+
+
+class FakeSession(object):
+    def __init__(self):
+        self.requests = []
+
+    def post(self, url, **kwargs):
+        self.requests.append(url)
+        return FakeResponse()
+
+
+def test_requests_without_session_share_one(monkeypatch):
+    fake = FakeSession()
+    monkeypatch.setattr(connection, '_http_session', fake)
+
+    for dummy in xrange(2):
+        assert connection.request_wrapper('post', '/auth') == \
+            (True, None, {'success': True})
+
+    assert fake.requests == [connection.API_URL + '/auth'] * 2
+
+
+def test_sessions_share_the_connections():
+    session = connection.get_http_session()
+    assert connection.get_http_session() is session
+
+    user_session = connection.new_http_session()
+    user_session.headers.update({'Authorization': 'token'})
+    assert 'Authorization' not in session.headers
+
+    adapter = session.get_adapter(connection.API_URL)
+    assert user_session.get_adapter(connection.API_URL) is adapter
+    assert session.get_adapter('http://kano.me') is adapter
+
+    assert adapter._pool_maxsize == HTTP_POOL_SIZE
+    assert adapter.max_retries.total == HTTP_RETRIES
+    assert adapter.max_retries.read is False
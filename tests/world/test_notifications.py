@@ -0,0 +1,136 @@
+#
+# test_notifications.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the notifications from Kano World:
+#     `kano_world.session.KanoWorldSession.refresh_notifications`
+#
+
+
+import time
+import threading
+
+import kano_world.session as session
+
+
+def _entry(entry_id, category='shares', image_url=None):
+    return {
+        'id': entry_id,
+        'read': False,
+        'title': 'Notification {}'.format(entry_id),
+        'category': category,
+        'type': 'unknown',
+        'image_url': image_url
+    }
+
+
+class FakeServer(object):
+    """ Serves pages of notifications, slowly """
+
+    def __init__(self, pages, delay=0):
+        self.pages = pages
+        self.delay = delay
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def request_wrapper(self, method, endpoint, data=None, headers=None,
+                        session=None, files=None):
+        if not endpoint.startswith('/notifications'):
+            return True, None, {}
+
+        with self._lock:
+            self.requests.append(endpoint)
+
+        time.sleep(self.delay)
+
+        page = int(endpoint.rsplit('=', 1)[1])
+        if self.pages[page] is None:
+            return False, 'Offline', None
+
+        return True, None, {
+            'entries': self.pages[page],
+            'next': page + 1 if page + 1 < len(self.pages) else None
+        }
+
+
+def _refresh(monkeypatch, server, thumbnails=None):
+    saved = []
+    fetched = []
+
+    def fetch_thumbnails(urls, dir_path, width, height):
+        fetched.append(urls)
+        return thumbnails or {}
+
+    monkeypatch.setattr(session, 'request_wrapper', server.request_wrapper)
+    monkeypatch.setattr(session, 'fetch_thumbnails', fetch_thumbnails)
+    monkeypatch.setattr(session, 'load_profile', lambda: {})
+    monkeypatch.setattr(session, 'save_profile', saved.append)
+
+    rv = session.KanoWorldSession('token').refresh_notifications()
+
+    return rv, saved, fetched
+
+
+def test_notifications_of_all_pages(monkeypatch):
+    server = FakeServer([
+        [_entry(1), _entry(2, 'follows')],
+        [_entry(3, 'unknown')],
+        [_entry(4, 'likes')],
+    ])
+
+    rv, saved, dummy = _refresh(monkeypatch, server)
+
+    assert rv == (True, None)
+    assert [n['byline'] for n in saved[0]['notifications']] == \
+        ['Notification 1', 'Notification 2', 'Notification 4']
+    assert len(server.requests) == 3
+
+
+def test_failed_page_keeps_the_notifications(monkeypatch):
+    server = FakeServer([[_entry(1)], None])
+
+    rv, saved, fetched = _refresh(monkeypatch, server)
+
+    assert rv == (False, 'Offline')
+    assert saved == []
+    assert fetched == []
+
+
+def test_only_shown_images_are_fetched(monkeypatch):
+    server = FakeServer([[
+        _entry(1, image_url='http://images/1'),
+        _entry(2, 'follows', image_url='http://images/2'),
+        _entry(3, image_url='http://images/3'),
+        _entry(4),
+    ]])
+
+    rv, saved, fetched = _refresh(monkeypatch, server, {
+        'http://images/1': '/thumbnails/1.png'
+    })
+
+    assert fetched == [['http://images/1', 'http://images/3']]
+
+    notifications = saved[0]['notifications']
+    assert notifications[0]['image'] == '/thumbnails/1.png'
+    assert notifications[2]['image'] == notifications[3]['image']
+    assert not any('image_url' in n for n in notifications)
+
+
+def test_next_page_is_prefetched(monkeypatch):
+    server = FakeServer([[_entry(i)] for i in xrange(3)], delay=0.2)
+    processed = []
+
+    def process(self, entry):
+        processed.append(entry['id'])
+        time.sleep(0.2)
+
+    monkeypatch.setattr(session.KanoWorldSession, '_process_notification',
+                        process)
+
+    start = time.time()
+    _refresh(monkeypatch, server)
+
+    assert processed == [0, 1, 2]
+    assert time.time() - start < 1.0
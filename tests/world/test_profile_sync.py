@@ -0,0 +1,136 @@
+#
+# test_profile_sync.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the sync of the app states with Kano World:
+#     `kano_world.session.KanoWorldSession.upload_profile_stats`
+#     `kano_world.functions.remove_registration`
+#
+
+
+import os
+import json
+import copy
+
+import kano_world.session as session
+import kano_world.functions as functions
+from kano_profile.apps import save_app_state, get_app_state_stamp
+from kano_profile.paths import profile_sync_hashes_file
+
+
+class FakeServer(object):
+    """ Keeps the app states uploaded and sends them all back """
+
+    def __init__(self, merge=True):
+        self.stats = {}
+        self.uploads = []
+        self.merge = merge
+
+    def request_wrapper(self, method, endpoint, data=None, headers=None,
+                        session=None, files=None):
+        if method == 'put' and data:
+            uploaded = json.loads(data)['stats']
+            self.uploads.append(uploaded)
+
+            if not self.merge:
+                self.stats = {}
+            self.stats.update(uploaded)
+
+        return True, None, {
+            'user': {'profile': {'stats': copy.deepcopy(self.stats)}}
+        }
+
+
+def setup_function(function):
+    if os.path.exists(profile_sync_hashes_file):
+        os.remove(profile_sync_hashes_file)
+
+
+def _sync(monkeypatch, server, account='user-1'):
+    monkeypatch.setattr(session, 'request_wrapper', server.request_wrapper)
+    monkeypatch.setattr(session, 'load_profile',
+                        lambda: {'kanoworld_id': account})
+
+    return session.KanoWorldSession('token').upload_profile_stats()
+
+
+def test_only_changed_states_are_uploaded(monkeypatch):
+    save_app_state('make-art', {'level': 1})
+    save_app_state('make-snake', {'level': 2})
+
+    server = FakeServer()
+    assert _sync(monkeypatch, server) == (True, None)
+    assert 'make-art' in server.uploads[-1]
+    assert 'make-snake' in server.uploads[-1]
+
+    _sync(monkeypatch, server)
+    assert server.uploads[-1] == {}
+
+    save_app_state('make-art', {'level': 3})
+    _sync(monkeypatch, server)
+    assert server.uploads[-1].keys() == ['make-art']
+    assert server.uploads[-1]['make-art']['level'] == 3
+
+
+def test_only_different_states_are_written(monkeypatch):
+    save_app_state('make-art', {'level': 1})
+    save_app_state('make-snake', {'level': 2})
+
+    server = FakeServer()
+    _sync(monkeypatch, server)
+
+    stamp = get_app_state_stamp('make-snake')
+
+    server.stats['make-pong'] = {'level': 4, 'save_date': 1}
+    server.stats['make-art'] = {'level': 5, 'save_date': 1}
+    _sync(monkeypatch, server)
+
+    assert get_app_state_stamp('make-snake') == stamp
+    assert session.peek_app_state('make-pong')['level'] == 4
+    assert session.peek_app_state('make-art')['level'] == 5
+
+    # What came from the server doesn't need uploading back
+    _sync(monkeypatch, server)
+    assert server.uploads[-1] == {}
+
+
+def test_other_account_gets_all_states(monkeypatch):
+    save_app_state('make-art', {'level': 1})
+
+    _sync(monkeypatch, FakeServer())
+
+    server = FakeServer()
+    _sync(monkeypatch, server, account='user-2')
+    assert 'make-art' in server.uploads[-1]
+
+
+def test_removed_registration_forgets_synced_states(monkeypatch):
+    save_app_state('make-art', {'level': 1})
+
+    server = FakeServer()
+    _sync(monkeypatch, server)
+    assert os.path.exists(profile_sync_hashes_file)
+
+    monkeypatch.setattr(functions, 'load_profile', lambda: {})
+    monkeypatch.setattr(functions, 'save_profile', lambda profile: None)
+    functions.remove_registration()
+
+    assert not os.path.exists(profile_sync_hashes_file)
+
+
+def test_states_missing_on_server_are_uploaded_again(monkeypatch):
+    save_app_state('make-art', {'level': 1})
+    save_app_state('make-snake', {'level': 2})
+
+    server = FakeServer(merge=False)
+    _sync(monkeypatch, server)
+
+    save_app_state('make-art', {'level': 3})
+    _sync(monkeypatch, server)
+    assert server.uploads[-1].keys() == ['make-art']
+
+    # The server dropped make-snake, so it is sent again
+    _sync(monkeypatch, server)
+    assert 'make-snake' in server.uploads[-1]
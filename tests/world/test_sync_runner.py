@@ -0,0 +1,83 @@
+#
+# test_sync_runner.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU GPL v2
+#
+# Unit tests for the concurrent stages of a sync:
+#     `kano_world.sync_runner`
+#
+
+
+import time
+
+from kano_world.sync_runner import SyncStage, run_stages
+
+
+def _stage(name, after=None, success=True, delay=0.2, log=None):
+    def run():
+        if log is not None:
+            log.append(('start', name))
+
+        time.sleep(delay)
+
+        if log is not None:
+            log.append(('end', name))
+
+        return success, None if success else '{} failed'.format(name)
+
+    return SyncStage(name, run, after or [])
+
+
+def test_independent_stages_overlap():
+    stages = [_stage('stage-{}'.format(i)) for i in xrange(4)]
+
+    start = time.time()
+    results = run_stages(stages, workers=4)
+
+    assert time.time() - start < 0.6
+    assert [result.name for result in results] == \
+        [stage.name for stage in stages]
+    assert all(result.success for result in results)
+    assert all(result.duration >= 0.2 for result in results)
+
+
+def test_stages_wait_for_their_dependencies():
+    log = []
+    run_stages([
+        _stage('upload', log=log),
+        _stage('download', ['upload'], log=log),
+    ])
+
+    assert log.index(('end', 'upload')) < log.index(('start', 'download'))
+
+
+def test_failures_keep_the_other_stages():
+    def broken():
+        raise IOError('No space left on device')
+
+    results = run_stages([
+        _stage('upload', success=False),
+        _stage('download', ['upload']),
+        _stage('after-download', ['download']),
+        _stage('tracking'),
+        SyncStage('broken', broken, []),
+    ])
+    results = dict((result.name, result) for result in results)
+
+    assert results['upload'].value == 'upload failed'
+    assert not results['download'].success
+    assert not results['after-download'].success
+    assert results['tracking'].success
+    assert not results['broken'].success
+    assert 'No space left' in results['broken'].value
+
+
+def test_circular_stages():
+    results = run_stages([
+        _stage('a', ['b'], delay=0),
+        _stage('b', ['a'], delay=0),
+        _stage('c', delay=0),
+    ])
+
+    assert [result.success for result in results] == [False, False, True]
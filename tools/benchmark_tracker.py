@@ -0,0 +1,314 @@
+#!/usr/bin/env python
+
+# benchmark_tracker.py
+#
+# Copyright (C) 2017 Kano Computing Ltd.
+# License: http://www.gnu.org/licenses/gpl-2.0.txt GNU General Public License v2
+#
+# Times the tracker operations against synthetic profiles in a throwaway
+# profile directory, leaving the profile and the tracker daemon of the user
+# alone. The results are printed as JSON, so they can be kept and compared
+# with the ones of a later run.
+#
+
+"""
+Benchmarks the tracker operations.
+
+Usage:
+  benchmark_tracker.py [options]
+  benchmark_tracker.py -h|--help
+
+Options:
+  -h, --help              Show this message.
+  -s, --sessions=<n>      Sessions in the profile [default: 100].
+  -e, --events=<m>        Events in the profile [default: 1000].
+  -p, --paused=<k>        Paused sessions in the profile [default: 100].
+  -r, --runs=<r>          Runs of the operations on whole profiles
+                          [default: 10].
+  -o, --output=<file>     Write the results to a file.
+  -c, --compare=<file>    Compare the results with the ones of an earlier run.
+"""
+
+import os
+import sys
+import imp
+import json
+import time
+import shutil
+import platform
+import resource
+import tempfile
+import docopt
+
+if __name__ == '__main__' and __package__ is None:
+    dir_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    if dir_path != '/usr':
+        sys.path.insert(1, dir_path)
+
+import kano_profile.paths as paths
+
+
+TRACKER_CTL = os.path.join(paths.dir_path, 'bin', 'kano-tracker-ctl')
+
+# No process ever gets a PID this high, so the sessions look crashed
+with open('/proc/sys/kernel/pid_max') as pid_max_f:
+    DEAD_PID = int(pid_max_f.read())
+
+
+def isolate(tmp_dir):
+    """ Points the profile paths at a throwaway directory.
+
+    The tracker modules copy the paths when they're imported, so this has to
+    run before any of them is.
+    """
+    profile_dir = paths.kanoprofile_dir
+
+    for name, value in vars(paths).items():
+        if isinstance(value, basestring) and value.startswith(profile_dir):
+            setattr(paths, name, tmp_dir + value[len(profile_dir):])
+
+
+def percentile(latencies, fraction):
+    """ The nearest-rank percentile of sorted latencies """
+    index = max(0, int(round(fraction * len(latencies))) - 1)
+    return latencies[index]
+
+
+def summarise(latencies):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+
+    return {
+        'ops': len(latencies),
+        'ops_per_sec': len(latencies) / total if total else None,
+        'p50_ms': percentile(latencies, 0.5) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+        # The peak of the whole process so far, the benchmarks run in order
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def measure(op, count, setup=None):
+    """ Times each of `count` calls of op(i), after setup(i) if given. """
+    latencies = []
+
+    for i in xrange(count):
+        if setup:
+            setup(i)
+
+        start = time.time()
+        op(i)
+        latencies.append(time.time() - start)
+
+    return latencies
+
+
+class Benchmarks(object):
+    def __init__(self, sessions, events, paused, runs):
+        # Only imported now the paths are isolated
+        import kano_profile.tracker as tracker
+        import kano_profile.tracker.tracking_sessions as tracking_sessions
+        from kano_profile.tracker.event_log import append_events
+
+        self.tracker = tracker
+        self.tracking_sessions = tracking_sessions
+        self.append_events = append_events
+        self.ctl = imp.load_source('kano_tracker_ctl', TRACKER_CTL)
+
+        self.sessions = sessions
+        self.events = events
+        self.paused = paused
+        self.runs = runs
+
+    def reset_profile(self):
+        self.tracker.flush_tracking_events()
+        shutil.rmtree(paths.kanoprofile_dir, ignore_errors=True)
+        os.makedirs(paths.tracker_dir)
+
+    def add_events(self, count):
+        events = [
+            self.tracker.get_action_event('benchmark-{}'.format(i))
+            for i in xrange(count)
+        ]
+        self.append_events(events)
+
+    def add_sessions(self, count):
+        """ Starts a third of the sessions running, a third finished and a
+        third crashed.
+        """
+        for i in xrange(count):
+            name = 'benchmark-{}'.format(i)
+            kind = i % 3
+
+            pid = DEAD_PID if kind == 2 else os.getpid()
+            path = self.tracking_sessions.session_start(
+                name, pid, ignore_pause=True
+            )
+
+            if kind == 1:
+                self.tracking_sessions.session_end(path)
+
+    def add_paused_sessions(self, count):
+        for i in xrange(count):
+            self.tracking_sessions.session_start(
+                'benchmark-paused-{}'.format(i), os.getpid(), ignore_pause=True
+            )
+
+        self.tracking_sessions.pause_tracking_sessions()
+
+    def track_action(self):
+        def op(i):
+            self.tracker.track_action('benchmark-{}'.format(i))
+
+            # Pay for storing the buffered events too
+            if i == self.events - 1:
+                self.tracker.flush_tracking_events()
+
+        self.reset_profile()
+        return measure(op, self.events)
+
+    def track_data(self):
+        def op(i):
+            self.tracker.track_data('benchmark-{}'.format(i), {'value': i})
+
+            if i == self.events - 1:
+                self.tracker.flush_tracking_events()
+
+        self.reset_profile()
+        return measure(op, self.events)
+
+    def session_start_end(self):
+        def op(i):
+            path = self.tracker.session_start(
+                'benchmark-{}'.format(i), os.getpid(), ignore_pause=True
+            )
+            self.tracker.session_end(path)
+
+        self.reset_profile()
+        return measure(op, self.sessions)
+
+    def update_status(self):
+        def setup(i):
+            self.reset_profile()
+            self.add_events(self.events)
+            self.add_sessions(self.sessions)
+
+        return measure(
+            lambda i: self.ctl._do_update_status(), self.runs, setup
+        )
+
+    def clear_sessions(self):
+        def setup(i):
+            self.reset_profile()
+            self.add_sessions(self.sessions)
+
+        return measure(lambda i: self.ctl.clear_sessions(), self.runs, setup)
+
+    def get_tracker_events(self):
+        self.reset_profile()
+        self.add_events(self.events)
+
+        return measure(
+            lambda i: self.tracker.get_tracker_events(), self.runs
+        )
+
+    def pause_tracking_sessions(self):
+        def setup(i):
+            self.reset_profile()
+            self.add_paused_sessions(self.paused)
+            self.add_sessions(self.sessions)
+
+        return measure(
+            lambda i: self.tracker.pause_tracking_sessions(), self.runs, setup
+        )
+
+    def unpause_tracking_sessions(self):
+        def setup(i):
+            self.reset_profile()
+            self.add_paused_sessions(self.paused)
+
+        return measure(
+            lambda i: self.tracker.unpause_tracking_sessions(), self.runs,
+            setup
+        )
+
+    def run(self):
+        names = [
+            'track_action',
+            'track_data',
+            'session_start_end',
+            'update_status',
+            'clear_sessions',
+            'get_tracker_events',
+            'pause_tracking_sessions',
+            'unpause_tracking_sessions'
+        ]
+
+        results = {}
+        for name in names:
+            results[name] = summarise(getattr(self, name)())
+
+        self.reset_profile()
+        return results
+
+
+def compare(results, earlier):
+    """ Prints how the results changed since an earlier run. """
+    for name in sorted(results):
+        if name not in earlier:
+            continue
+
+        now = results[name]
+        before = earlier[name]
+
+        print >> sys.stderr, '{:<30} p50 {:+7.1f}%  p99 {:+7.1f}%'.format(
+            name,
+            _change(before['p50_ms'], now['p50_ms']),
+            _change(before['p99_ms'], now['p99_ms'])
+        )
+
+
+def _change(before, now):
+    return (now - before) * 100.0 / before if before else 0
+
+
+def main():
+    args = docopt.docopt(__doc__)
+
+    config = {
+        'sessions': int(args['--sessions']),
+        'events': int(args['--events']),
+        'paused': int(args['--paused']),
+        'runs': int(args['--runs'])
+    }
+
+    tmp_dir = tempfile.mkdtemp(prefix='kano-tracker-benchmark-')
+    try:
+        isolate(tmp_dir)
+        results = Benchmarks(**config).run()
+    finally:
+        shutil.rmtree(tmp_dir)
+
+    report = {
+        'config': config,
+        'python': platform.python_version(),
+        'time': int(time.time()),
+        'results': results
+    }
+
+    output = json.dumps(report, indent=4, sort_keys=True)
+    if args['--output']:
+        with open(args['--output'], 'w') as output_f:
+            output_f.write(output + '\n')
+    else:
+        print output
+
+    if args['--compare']:
+        with open(args['--compare']) as earlier_f:
+            compare(results, json.load(earlier_f)['results'])
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())